@@ -4,7 +4,7 @@ import type { IBeakerCell, IMimeRenderer } from 'beaker-kernel';
 import type { BeakerNotebookComponentType } from '../components/notebook/BeakerNotebook.vue';
 import type { BeakerSessionComponentType } from '../components/session/BeakerSession.vue';
 import { JavascriptRenderer, JSONRenderer, LatexRenderer, MarkdownRenderer, wrapJupyterRenderer, TableRenderer, type BeakerRenderOutput } from '../renderers';
-import { atStartOfInput, atEndOfInput } from '../util';
+import { atStartOfInput, atEndOfInput, handleKernelStateDelta } from '../util';
 import type { NavOption } from '../components/misc/BeakerHeader.vue';
 import { standardRendererFactories } from '@jupyterlab/rendermime';
 import type { IBeakerTheme } from '../plugins/theme';
@@ -331,6 +331,9 @@ export function useNotebookInterface(): UseNotebookInterfaceReturn {
         else if (msg.header.msg_type === "kernel_state_info") {
             kernelStateInfo.value = msg.content;
         }
+        else if (msg.header.msg_type === "kernel_state_delta") {
+            handleKernelStateDelta(kernelStateInfo, msg.content, beakerSession.value?.session);
+        }
         else if (msg.header.msg_type === "debug_event") {
             debugLogs.value.push({
                 type: msg.content.event,
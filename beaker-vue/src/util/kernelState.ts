@@ -0,0 +1,61 @@
+import type { Ref } from 'vue';
+
+export interface KernelStateDelta {
+    version: number;
+    base_version: number;
+    updated: {[category: string]: {[name: string]: any}};
+    removed: {[category: string]: string[]};
+}
+
+const KERNEL_STATE_MIMETYPE = "x-application/beaker-subkernel-state";
+
+/**
+ * Applies a `kernel_state_delta` message's content to the last received kernel state.
+ *
+ * Returns the new kernel state, or null if the current kernel state isn't the one the delta was computed against, in
+ * which case the full kernel state should be requested via the `resync_kernel_state` action.
+ **/
+export function applyKernelStateDelta(current: any, delta: KernelStateDelta): any | null {
+    if (!current || current.version !== delta.base_version) {
+        return null;
+    }
+    const state = {...(current[KERNEL_STATE_MIMETYPE]?.["application/json"] || {})};
+    for (const [category, names] of Object.entries(delta.removed || {})) {
+        if (state[category]) {
+            state[category] = {...state[category]};
+            for (const name of names) {
+                delete state[category][name];
+            }
+        }
+    }
+    for (const [category, entries] of Object.entries(delta.updated || {})) {
+        if (Object.keys(entries).length > 0) {
+            state[category] = {...(state[category] || {}), ...entries};
+        }
+    }
+    return {
+        ...current,
+        [KERNEL_STATE_MIMETYPE]: {
+            "application/json": state,
+        },
+        version: delta.version,
+    };
+}
+
+/**
+ * Handles a `kernel_state_delta` message, applying it to `kernelStateInfo`, or requesting the full kernel state from
+ * the kernel via the `resync_kernel_state` action if the delta can't be applied.
+ **/
+export function handleKernelStateDelta(
+    kernelStateInfo: Ref<any>,
+    delta: KernelStateDelta,
+    session?: {executeAction: (action: string, payload: any) => any},
+): void {
+    const updatedState = applyKernelStateDelta(kernelStateInfo.value, delta);
+    if (updatedState === null) {
+        session?.executeAction("resync_kernel_state", {});
+    }
+    else {
+        kernelStateInfo.value = updatedState;
+    }
+}
@@ -14,7 +14,7 @@ from hatchling.metadata.utils import normalize_project_name
 normalize_file_name_component = BuilderInterface.normalize_file_name_component
 
 from .helpers import find_pyproject_file
-from .running import notebook
+from .running import build_app_command, notebook
 
 
 HATCH_NEW_CONTEXT_CONFIG_FILE_DEFAULTS = {
@@ -25,14 +25,6 @@ HATCH_NEW_CONTEXT_CONFIG_FILE_DEFAULTS = {
 }
 
 
-def build_app_command(app_name, import_str):
-    @click.pass_context
-    def inner(ctx: click.Context):
-        os.environ.setdefault("BEAKER_APP", import_str)
-        ctx.forward(notebook)
-    return click.Command(name=app_name, callback=inner, help=f"""Beaker app '{app_name}' ({import_str}).""")
-
-
 @click.group(name="app")
 def app():
     """
@@ -1,85 +1,133 @@
 import click
 import importlib
+from typing import NamedTuple
 
 from beaker_kernel.lib.autodiscovery import find_mappings
 
 
+class LazyCommand(NamedTuple):
+    module: str
+    entry_point: str
+    short_help: str = ""
+
+
+# Built in commands, imported only when used so that e.g. `beaker --help` doesn't import hatch or the Beaker config.
+# The help of each must match the short help of the command, which is checked by tests/test_cli_commands.py.
+BUILTIN_COMMANDS = {
+    "app": LazyCommand("beaker_kernel.cli.app", "app", "Commands for dealing with stand-alone/white-labeled apps."),
+    "config": LazyCommand(
+        "beaker_kernel.cli.config", "config_group", "Options for viewing and updating configuration settings"
+    ),
+    "context": LazyCommand("beaker_kernel.cli.context", "context", "Commands for creating a new context."),
+    "dev": LazyCommand("beaker_kernel.cli.running", "dev", "Start Beaker server in development mode."),
+    "notebook": LazyCommand(
+        "beaker_kernel.cli.running", "notebook", "Start Beaker in local mode and opens a notebook."
+    ),
+    "profile-startup": LazyCommand(
+        "beaker_kernel.cli.profile",
+        "profile_startup",
+        "Report import times and time to first kernel_info_reply of the Beaker kernel.",
+    ),
+    "project": LazyCommand("beaker_kernel.cli.project", "project", "Beaker project management"),
+    "subkernel": LazyCommand("beaker_kernel.cli.subkernel", "subkernel", "Commands for creating a new subkernel."),
+}
+
+
 class BeakerCli(click.Group):
-    subcommands: dict[str, click.Command | click.Group]
+    """
+    Command group whose commands and apps are listed from their mappings and only imported when they are run or their
+    help is shown.
+    """
+    subcommands: dict[str, LazyCommand]
+    loaded_subcommands: dict[str, click.Command | click.Group]
     apps: dict[str, str]
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
-        self.subcommands = {}
+        self.subcommands = dict(BUILTIN_COMMANDS)
+        self.loaded_subcommands = {}
         self.apps = {}
 
         for _, command_info in find_mappings("commands"):
             group_name = command_info["group_name"]
-            module = command_info["module"]
-            entry_point = command_info.get("entry_point", "cli_commands")
-            try:
-                module = importlib.import_module(module)
-            except ImportError:
-                click.echo(f"Unable to load item {entry_point} from module {module}. Skipping...", err=True)
-                continue
-            entry = getattr(module, entry_point, None)
-            if not entry:
-                click.echo(f"Unable to load item {entry_point} from module {module}. Skipping...", err=True)
-                continue
-            if not isinstance(entry, (click.Command, click.Group)):
-                click.echo(f"Entry point {entry_point} in module {module} is not a click Group or Command class. Skipping...", err=True)
-            self.subcommands[group_name] = entry
+            self.subcommands[group_name] = LazyCommand(
+                command_info["module"],
+                command_info.get("entry_point", "cli_commands"),
+                command_info.get("help", ""),
+            )
 
         for _, app_info in find_mappings("apps"):
             app_name = app_info["slug"]
-            package = app_info["package"]
-            class_name = app_info["class_name"]
-            app_import_str = f"{package}.{class_name}"
-            try:
-                module = importlib.import_module(package)
-                cls = getattr(module, class_name, None)
-            except ImportError:
-                cls = None
-            if cls is None:
-                continue
-            self.apps[app_name] = app_import_str
+            self.apps[app_name] = f"{app_info['package']}.{app_info['class_name']}"
 
     def list_commands(self, ctx):
-        commands = super().list_commands(ctx)
-        commands.extend(self.subcommands.keys())
+        commands = sorted(set(super().list_commands(ctx)) | BUILTIN_COMMANDS.keys())
+        commands.extend(name for name in self.subcommands if name not in commands)
         commands.extend(self.apps.keys())
         return commands
 
     def get_command(self, ctx, cmd_name):
         if cmd_name in self.subcommands:
-            return self.subcommands[cmd_name]
+            if cmd_name not in self.loaded_subcommands:
+                self.loaded_subcommands[cmd_name] = self.load_subcommand(cmd_name)
+            return self.loaded_subcommands[cmd_name]
         elif cmd_name in self.apps:
-            from .app import build_app_command
+            from .running import build_app_command
             import_str = self.apps[cmd_name]
             return build_app_command(cmd_name, import_str)
         else:
             return super().get_command(ctx, cmd_name)
 
+    def load_subcommand(self, cmd_name: str) -> click.Command | click.Group | None:
+        module_name, entry_point, _ = self.subcommands[cmd_name]
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            click.echo(f"Unable to load item {entry_point} from module {module_name}. Skipping...", err=True)
+            return None
+        entry = getattr(module, entry_point, None)
+        if not entry:
+            click.echo(f"Unable to load item {entry_point} from module {module_name}. Skipping...", err=True)
+            return None
+        if not isinstance(entry, (click.Command, click.Group)):
+            click.echo(f"Entry point {entry_point} in module {module_name} is not a click Group or Command class. Skipping...", err=True)
+            return None
+        return entry
+
+    def list_help(self, ctx, cmd_name: str, limit: int) -> str | None:
+        """
+        Returns the help shown in the command list, without importing commands that haven't been loaded yet.
+        """
+        if cmd_name in self.subcommands and cmd_name not in self.loaded_subcommands:
+            # Shortened to the limit the same way as the help of the command itself would be
+            return click.Command(cmd_name, help=self.subcommands[cmd_name].short_help).get_short_help_str(limit)
+        elif cmd_name in self.apps:
+            return f"Beaker app '{cmd_name}' ({self.apps[cmd_name]})."
+        command = self.get_command(ctx, cmd_name)
+        if command is None or command.hidden:
+            return None
+        return command.get_short_help_str(limit)
+
+    def format_commands(self, ctx, formatter):
+        # Same as `click.Group.format_commands()`, but using `list_help()`
+        cmd_names = self.list_commands(ctx)
+        if not cmd_names:
+            return
+        limit = formatter.width - 6 - max(len(cmd_name) for cmd_name in cmd_names)
+        rows = [
+            (cmd_name, help_text)
+            for cmd_name in cmd_names
+            if (help_text := self.list_help(ctx, cmd_name, limit)) is not None
+        ]
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
 @click.group(cls=BeakerCli)
 def cli():
     """
     CLI Tooling to work with and in Beaker
     """
     pass
-
-
-from .project import project
-from .config import config_group
-from .running import dev, notebook
-from .context import context
-from .subkernel import subkernel
-from .app import app
-
-cli.add_command(project)
-cli.add_command(config_group)
-cli.add_command(context)
-cli.add_command(dev)
-cli.add_command(notebook)
-cli.add_command(subkernel)
-cli.add_command(app)
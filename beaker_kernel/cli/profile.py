@@ -0,0 +1,144 @@
+import asyncio
+import json
+import re
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+import click
+
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+
+@dataclass
+class ImportNode:
+    module: str
+    self_us: int
+    cumulative_us: int
+    children: list["ImportNode"] = field(default_factory=list)
+
+    def asdict(self, min_us: int = 0) -> dict:
+        return {
+            "module": self.module,
+            "self_ms": self.self_us / 1000,
+            "cumulative_ms": self.cumulative_us / 1000,
+            "children": [child.asdict(min_us) for child in self.children if child.cumulative_us >= min_us],
+        }
+
+
+def parse_import_times(output: str) -> list[ImportNode]:
+    """
+    Builds the import tree from the output of `python -X importtime`. Modules are listed after the modules they import,
+    indented by two spaces per level.
+    """
+    pending: dict[int, list[ImportNode]] = {}
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        depth = (len(indent) - 1) // 2
+        node = ImportNode(module, int(self_us), int(cumulative_us), children=pending.pop(depth + 1, []))
+        pending.setdefault(depth, []).append(node)
+    return pending.get(0, [])
+
+
+def profile_imports(module: str) -> list[ImportNode]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise click.ClickException(f"Unable to import {module}:\n{result.stderr[-2000:]}")
+    return parse_import_times(result.stderr)
+
+
+def walk(nodes: list[ImportNode]):
+    for node in nodes:
+        yield node
+        yield from walk(node.children)
+
+
+def print_import_tree(nodes: list[ImportNode], min_us: int, indent: int = 0):
+    for node in sorted(nodes, key=lambda node: node.cumulative_us, reverse=True):
+        if node.cumulative_us < min_us:
+            continue
+        click.echo(f"{node.cumulative_us / 1000:9.1f} {node.self_us / 1000:9.1f}  {'  ' * indent}{node.module}")
+        print_import_tree(node.children, min_us, indent + 1)
+
+
+async def time_to_kernel_info(kernel_name: str, timeout: float) -> dict:
+    """
+    Starts a kernel and measures how long it takes to answer a `kernel_info_request`.
+
+    The Beaker kernel forwards the request to its subkernel, so the reply comes from the subkernel once the default
+    context is set up. Without a Jupyter server to start the subkernel, the kernel answers with a placeholder after a
+    few seconds instead, which is reported as the "proxy" implementation.
+    """
+    from jupyter_client.manager import AsyncKernelManager
+
+    kernel_manager = AsyncKernelManager(kernel_name=kernel_name)
+    start = time.perf_counter()
+    await kernel_manager.start_kernel()
+    launched = time.perf_counter()
+    client = kernel_manager.client()
+    client.start_channels()
+    try:
+        await client.wait_for_ready(timeout=timeout)
+        ready = time.perf_counter()
+        # `wait_for_ready()` consumes the reply, so ask again for its contents
+        reply = await client.kernel_info(reply=True, timeout=timeout)
+        return {
+            "launch_ms": (launched - start) * 1000,
+            "kernel_info_reply_ms": (ready - start) * 1000,
+            "implementation": reply["content"].get("implementation"),
+        }
+    finally:
+        client.stop_channels()
+        await kernel_manager.shutdown_kernel(now=True)
+
+
+@click.command(name="profile-startup")
+@click.option("--module", default="beaker_kernel.kernel", show_default=True, help="Module to profile the import of.")
+@click.option("--min-ms", default=10.0, show_default=True, help="Hide imports that take less time than this.")
+@click.option("--top", default=15, show_default=True, help="Number of slowest modules (by self time) to list.")
+@click.option("--kernel-name", default="beaker_kernel", show_default=True, help="Kernel to start and time.")
+@click.option("--no-kernel", is_flag=True, default=False, help="Only profile imports, without starting a kernel.")
+@click.option("--timeout", default=60.0, show_default=True, help="Seconds to wait for the kernel to reply.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Output the results as JSON.")
+def profile_startup(module, min_ms, top, kernel_name, no_kernel, timeout, as_json):
+    """
+    Report import times and time to first kernel_info_reply of the Beaker kernel.
+    """
+    min_us = int(min_ms * 1000)
+    roots = profile_imports(module)
+    total_us = sum(node.cumulative_us for node in roots)
+    slowest = sorted(walk(roots), key=lambda node: node.self_us, reverse=True)[:top]
+    kernel_timing = None if no_kernel else asyncio.run(time_to_kernel_info(kernel_name, timeout))
+
+    if as_json:
+        click.echo(json.dumps({
+            "module": module,
+            "import_ms": total_us / 1000,
+            "imports": [node.asdict(min_us) for node in roots if node.cumulative_us >= min_us],
+            "slowest": [{"module": node.module, "self_ms": node.self_us / 1000} for node in slowest],
+            "kernel": kernel_timing,
+        }, indent=2))
+        return
+
+    click.echo(f"Importing {module} took {total_us / 1000:.1f}ms\n")
+    click.echo(f"{'cumul ms':>9} {'self ms':>9}  module (imports over {min_ms}ms)")
+    print_import_tree(roots, min_us)
+    click.echo("\nSlowest modules by self time:")
+    for node in slowest:
+        click.echo(f"{node.self_us / 1000:9.1f}  {node.module}")
+    if kernel_timing:
+        click.echo(f"\n{kernel_name} kernel:")
+        click.echo(f"  launched in {kernel_timing['launch_ms']:.1f}ms")
+        click.echo(
+            f"  first kernel_info_reply after {kernel_timing['kernel_info_reply_ms']:.1f}ms "
+            f"(implementation: {kernel_timing['implementation']})"
+        )
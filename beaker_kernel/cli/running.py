@@ -35,6 +35,14 @@ def notebook(ctx, extra_args, beakerapp_cls=None):
             app.stop()
 
 
+def build_app_command(app_name, import_str):
+    @click.pass_context
+    def inner(ctx: click.Context):
+        os.environ.setdefault("BEAKER_APP", import_str)
+        ctx.forward(notebook)
+    return click.Command(name=app_name, callback=inner, help=f"""Beaker app '{app_name}' ({import_str}).""")
+
+
 @click.group(name="dev", invoke_without_command=True)
 @click.option("--no-open-notebook", "-n", is_flag=True, default=False, type=bool, help="Prevent opening the notebook in a webbrowser.")
 @click.pass_context
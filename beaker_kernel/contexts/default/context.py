@@ -44,9 +44,7 @@ class DefaultContext(BeakerContext):
         """
         Preview what exists in the subkernel.
         """
-        fetch_state_code = self.subkernel.FETCH_STATE_CODE
-        result = await self.evaluate(fetch_state_code)
-        state = result.get("return", None)
+        state = await self.get_subkernel_state()
         return {
             "x-application/beaker-subkernel-state": {
                 "state": {
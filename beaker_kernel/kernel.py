@@ -14,15 +14,19 @@ from typing import Literal, Optional, ClassVar, Awaitable
 
 import requests
 from tornado import ioloop
+from tornado.httpclient import HTTPClientError
 
 from beaker_kernel.lib.config import reset_config, config
 from beaker_kernel.lib.context import BeakerContext, autodiscover_contexts
+from beaker_kernel.lib.jupyter_api import interrupt_kernel, start_kernel
 from beaker_kernel.lib.jupyter_kernel_proxy import InterceptionFilter, JupyterMessage, KernelProxyManager
+from beaker_kernel.lib.output_spill import OutputSpill
 from beaker_kernel.lib.utils import (message_handler, LogMessageEncoder, magic,
                         handle_message, get_socket, execution_context, parent_message_context,
                         ForwardMessage, ensure_async)
 
 USER_RESPONSE_WAIT_TIME_SECONDS = 100
+NOTEBOOK_STATE_WAIT_TIME_SECONDS = 1
 
 logger = logging.getLogger(__name__)
 
@@ -54,11 +58,17 @@ class BeakerKernel(KernelProxyManager):
     context: Optional[BeakerContext]
     internal_executions: set[str]
     subkernel_execution_tracking: dict[str, str]
-    user_responses: dict[str, str]
+    # Ids of kernels started on the Jupyter server for contexts that haven't been created yet, keyed by kernel name
+    started_subkernels: dict[str, list[str]]
+    # Futures resolved by responses from the front-end (e.g. input_reply), keyed by the msg_id of the request
+    pending_responses: dict[str, asyncio.Future]
     debug_enabled: bool
     magic_commands: dict[str, callable]
     ready: asyncio.Future
     running_actions: dict[str, Awaitable]
+    # Tasks started without being awaited, referenced here until they finish so they are not garbage collected
+    background_tasks: set[asyncio.Task]
+    output_spill: OutputSpill
 
     def __init__(self, session_config, kernel_id=None, connection_file=None):
         self.jupyter_server = session_config.get("server", config.jupyter_server)
@@ -69,17 +79,35 @@ class BeakerKernel(KernelProxyManager):
         self.magic_commands = {}
         self.internal_executions = set()
         self.subkernel_execution_tracking = {}
+        self.started_subkernels = {}
         self.running_actions = {}
+        self.background_tasks = set()
+        # Kernels started without an id (e.g. outside of a Jupyter server) still need a spill file of their own
+        spill_name = kernel_id or uuid.uuid4().hex
+        self.output_spill = OutputSpill(
+            os.path.join(config.beaker_run_path, "output", f"{spill_name}.spill"),
+            max_bytes=getattr(config, "output_max_bytes", 0),
+            bytes_per_second=getattr(config, "output_max_bytes_per_second", 0),
+        )
         context_args = session_config.get("context", {})
         super().__init__(session_config, session_id=f"{kernel_id}_session")
         self.register_magic_commands()
         self.add_base_intercepts()
         self.context = None
-        self.user_responses = dict()
+        self.pending_responses = {}
         # Initialize context (Using the event loop to simulate `await`ing the async func in non-async setup)
         event_loop = asyncio.get_event_loop()
-        context_task = event_loop.create_task(self.start_default_context(**context_args))
-        context_task.add_done_callback(lambda task: None)
+        self.run_in_background(event_loop.create_task(self.start_default_context(**context_args)))
+
+    def run_in_background(self, task: asyncio.Task):
+        self.background_tasks.add(task)
+        task.add_done_callback(self._background_task_done)
+
+    def _background_task_done(self, task: asyncio.Task):
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task {task.get_coro().__qualname__} failed: {task.exception()}",
+                         exc_info=task.exception())
 
     async def start_default_context(self, default_context=None, default_context_payload=None, **options):
         default_context = default_context or os.environ.get('BEAKER_DEFAULT_CONTEXT')
@@ -132,6 +160,8 @@ class BeakerKernel(KernelProxyManager):
             "iopub", "execute_input", self.update_execute_input_response
         )
         self.server.intercept_message("shell", "execute_reply", self.post_execute)
+        for msg_type in ("stream", "execute_result", "display_data"):
+            self.server.intercept_message("iopub", msg_type, self.limit_output)
         self.server.intercept_message("stdin", "input_reply", self.input_reply)
         self.server.intercept_message("shell", "set_agent_model", self.set_agent_model)
         self.server.intercept_message("shell", "reset_request", self.reset_kernel)
@@ -195,26 +225,25 @@ class BeakerKernel(KernelProxyManager):
         content = json.loads(payload)
         self.stdout(f"Running action `{action_name}`...", parent_header=parent_header)
 
-        for intercept in self.server.filters:
-            if intercept.stream_type.name == "shell" and intercept.msg_type == request_name:
-                action_func = intercept.callback
-                data = self.context.subkernel.connected_kernel.make_multipart_message(msg_type=request_name, content=content, parent_header=parent_header)
-                response = await action_func(self.server, self.context.subkernel.connected_kernel.streams.shell, data)
-                self.stdout(f"Action `{action_name}` execution complete.", parent_header=parent_header)
-                result_data = {}
-                try:
-                    result_data["text/plain"] = json.dumps(response, cls=LogMessageEncoder, indent=2)
-                    result_data["application/json"] = response
-                except TypeError:
-                    result_data["text/plain"] = str(response)
-
-                self.send_response(
-                    stream="iopub",
-                    msg_or_type=parent_header.get('msg_type').replace("_request", "") + "_result",
-                    content={"execution_count": -1, "data": result_data, "metadata": {}},
-                    parent_header=parent_header,
-                )
-                break
+        for intercept in self.server.filters.match(get_socket("shell"), request_name):
+            action_func = intercept.callback
+            data = self.context.subkernel.connected_kernel.make_multipart_message(msg_type=request_name, content=content, parent_header=parent_header)
+            response = await action_func(self.server, self.context.subkernel.connected_kernel.streams.shell, data)
+            self.stdout(f"Action `{action_name}` execution complete.", parent_header=parent_header)
+            result_data = {}
+            try:
+                result_data["text/plain"] = json.dumps(response, cls=LogMessageEncoder, indent=2)
+                result_data["application/json"] = response
+            except TypeError:
+                result_data["text/plain"] = str(response)
+
+            self.send_response(
+                stream="iopub",
+                msg_or_type=parent_header.get('msg_type').replace("_request", "") + "_result",
+                content={"execution_count": -1, "data": result_data, "metadata": {}},
+                parent_header=parent_header,
+            )
+            break
         else:
             self.stderr(f"Unable to find an action with name `{action_name}`.")
         return result_data
@@ -255,8 +284,7 @@ class BeakerKernel(KernelProxyManager):
             return
         socket = get_socket(stream)
         filter = InterceptionFilter(socket, msg_type, func)
-        if filter in self.server.filters:
-            self.server.filters.remove(filter)
+        self.server.filters.discard(filter)
 
     async def send_preview(self, parent_header=None):
         if self.context.preview:
@@ -265,9 +293,16 @@ class BeakerKernel(KernelProxyManager):
                 if preview_payload:
                     self.send_response("iopub", "preview", preview_payload, parent_header=parent_header)
 
-    async def send_kernel_state_info(self, parent_header=None):
+    async def send_kernel_state_info(self, parent_header=None, full=False):
         if self.context.kernel_state:
             with execution_context("kernel_state_info"):
+                delta = None if full else await self.context.kernel_state_delta()
+                if delta is not None:
+                    # Only the changes since the last kernel state are sent. Clients that are out of sync with the
+                    # base version can request the full state via the `resync_kernel_state` action.
+                    if delta["version"] != delta["base_version"]:
+                        self.send_response("iopub", "kernel_state_delta", delta, parent_header=parent_header)
+                    return
                 state_payload = await self.context.kernel_state()
                 if state_payload:
                     self.send_response("iopub", "kernel_state_info", state_payload, parent_header=parent_header)
@@ -317,15 +352,23 @@ class BeakerKernel(KernelProxyManager):
         with open(self.connection_file, "w") as connection_file:
             json.dump(run_info, connection_file, indent=2)
 
-    async def set_context(self, context_name, context_info, language="python3", parent_header={}):
+    async def set_context(self, context_name, context_info, language="python3", parent_header={}, reuse_subkernel=None):
 
         context_cls = AVAILABLE_CONTEXTS.get(context_name, None)
         if not context_cls:
             # TODO: Should we return an error if the requested context isn't available?
             return False
+        kernel_name = context_cls.resolve_subkernel_class(language).KERNEL_NAME
+        if reuse_subkernel is None:
+            reuse_subkernel = getattr(config, "reuse_subkernel_on_context_switch", False)
 
         # Cleanup the old context, then create and setup the new context
         if self.context:
+            subkernel = self.context.subkernel
+            if reuse_subkernel and subkernel.KERNEL_NAME == kernel_name and subkernel.jupyter_id is not None:
+                # Hand the running kernel over to the new context instead of shutting it down
+                self.started_subkernels.setdefault(kernel_name, []).insert(0, subkernel.jupyter_id)
+                subkernel.jupyter_id = None
             self.context.cleanup()
 
         if context_info is None:
@@ -338,7 +381,12 @@ class BeakerKernel(KernelProxyManager):
             "language": language,
             "context_info": context_info
         }
+        # Started here so that message proxying continues while the kernel starts up, rather than from within the
+        # context's constructor.
+        if not self.started_subkernels.get(kernel_name):
+            await self.start_subkernel(kernel_name)
         self.context = context_cls(beaker_kernel=self, config=context_config)
+        self.configure_stream_coalescing()
         await self.context.setup(context_info=context_info, parent_header=parent_header)
         subkernel = self.context.subkernel
         kernel_setup_func = getattr(subkernel, "setup", None)
@@ -348,6 +396,28 @@ class BeakerKernel(KernelProxyManager):
         await self.send_preview(parent_header=parent_header)
         await self.send_kernel_state_info(parent_header=parent_header)
 
+    def configure_stream_coalescing(self):
+        """
+        Applies the stream coalescing settings of the current context, falling back to the config.
+        """
+        window_ms = getattr(self.context, "STREAM_COALESCE_WINDOW_MS", None)
+        max_bytes = getattr(self.context, "STREAM_COALESCE_MAX_BYTES", None)
+        if window_ms is None:
+            window_ms = getattr(config, "stream_coalesce_window_ms", 0)
+        if max_bytes is None:
+            max_bytes = getattr(config, "stream_coalesce_max_bytes", 65536)
+        self.server.streams.iopub.configure(window_ms=window_ms, max_bytes=max_bytes)
+
+    async def start_subkernel(self, kernel_name: str):
+        subkernel_id = await start_kernel(self.jupyter_server, kernel_name)
+        self.started_subkernels.setdefault(kernel_name, []).append(subkernel_id)
+
+    def take_started_subkernel(self, kernel_name: str) -> Optional[str]:
+        started = self.started_subkernels.get(kernel_name)
+        if started:
+            return started.pop(0)
+        return None
+
     async def post_execute(self, queue, message_id, data):
         message = JupyterMessage.parse(data)
 
@@ -380,7 +450,7 @@ class BeakerKernel(KernelProxyManager):
             await asyncio.gather(*coroutines)
 
         if loop:
-            loop.create_task(task())
+            self.run_in_background(loop.create_task(task()))
         return data
 
     def send_response(
@@ -413,10 +483,54 @@ class BeakerKernel(KernelProxyManager):
         parent_id = message.parent_header.get("msg_id")
         notebook_item = self.subkernel_execution_tracking.get(parent_id)
         if notebook_item:
-            message.metadata["notebook_item"] = notebook_item
+            message = message._replace(metadata={**message.metadata, "notebook_item": notebook_item})
             data = message.parts
         return data
 
+    async def limit_output(self, server, target_stream, data):
+        """
+        Enforces the output budget of the execution the output belongs to. The first message over the budget is
+        replaced with a notice, and it and all later output of the execution are saved to the spill file instead.
+        """
+        if not self.output_spill.enabled:
+            return data
+        header, parent_header = JupyterMessage.parse_headers(data)
+        msg_id = parent_header.get("msg_id")
+        msg_type = header.get("msg_type")
+        # Output of internal executions is read by Beaker itself (e.g. `evaluate()` results or state fetches printed to
+        # stdout), so it is never limited.
+        if not msg_id or msg_id in self.internal_executions:
+            return data
+
+        delimiter_index = data.index(JupyterMessage.DELIMITER)
+        size = sum(len(frame) for frame in data[delimiter_index + 5:])
+        budget = self.output_spill.budget(msg_id)
+        already_exhausted = budget.exhausted
+        if budget.admit(size):
+            return data
+
+        # Only output over the budget is decoded
+        message = JupyterMessage.parse(data)
+        if msg_type == "stream":
+            text = message.content.get("text", "")
+        else:
+            output_data = message.content.get("data", {})
+            text = output_data.get("text/plain") or json.dumps(output_data)
+            text = text if text.endswith("\n") else f"{text}\n"
+        self.output_spill.spill(msg_id, text)
+        if already_exhausted:
+            return None
+
+        notice = (
+            f"\n[Output truncated: this execution exceeded its output limit. The rest of its output is saved and can "
+            f"be read with the fetch_output_range action using msg_id {msg_id}.]\n"
+        )
+        if msg_type == "stream":
+            content = {**message.content, "text": notice}
+        else:
+            content = {**message.content, "data": {"text/plain": notice}, "metadata": {}}
+        return message._replace(content=content, buffers=[]).parts
+
     @message_handler
     async def interrupt(self, _message):
         self._interrupt(interrupt_subkernel=True)
@@ -424,20 +538,21 @@ class BeakerKernel(KernelProxyManager):
     def soft_interrupt(self, signal, frame):
         self._interrupt(interrupt_subkernel=False)
 
+    async def interrupt_subkernel(self):
+        try:
+            subkernel_id = self.context.subkernel.jupyter_id
+            print(f"Interrupting connected subkernel: {subkernel_id}")
+            await interrupt_kernel(self.jupyter_server, subkernel_id, timeout=0.5)
+        except (HTTPClientError, OSError) as err:
+            logger.error(f"Subkernel cannot be interrupted.\nDetails:\n  {err}", exc_info=err)
+
     def _interrupt(self, interrupt_subkernel=True):
         if interrupt_subkernel:
-            try:
-                subkernel_id = self.context.subkernel.jupyter_id
-                print(f"Interrupting connected subkernel: {subkernel_id}")
-                requests.post(
-                    f"{self.context.beaker_kernel.jupyter_server}/api/kernels/{subkernel_id}/interrupt",
-                    headers={"Authorization": f"token {config.jupyter_token}"},
-                    timeout=0.5,
-                )
-            except requests.exceptions.HTTPError as err:
-                logger.error(f"Subkernel cannot be interrupted.\nDetails:\n  {err.request.body}", exc_info=err)
-            except requests.exceptions.ConnectionError:
-                logger.error(f"Subkernel cannot be interrupted.\nDetails:\n  {err}", exc_info=err)
+            self.run_in_background(asyncio.get_running_loop().create_task(self.interrupt_subkernel()))
+
+        for future in self.pending_responses.values():
+            future.cancel(msg="Execution interrupted by user.")
+        self.pending_responses.clear()
 
         for key, value in list(self.running_actions.items()):
             if inspect.iscoroutine(value):
@@ -451,15 +566,43 @@ class BeakerKernel(KernelProxyManager):
     async def shutdown(self, message):
         def stop_loop(loop: ioloop.IOLoop):
             loop.stop()
+        subkernel = self.context.subkernel
         self.context.cleanup()
         self.context = None
+        # Make sure the request to shut down the subkernel has been sent before stopping.
+        if subkernel.shutdown_task is not None:
+            await subkernel.shutdown_task
         # Stop loop after short delay to allow cleanup to run.
         loop = ioloop.IOLoop.current()
         loop.call_later(0.2, stop_loop, loop)
         return None
 
+    def expect_response(self, msg_id: str) -> asyncio.Future:
+        """
+        Returns a future that is resolved with the front-end's response to the request `msg_id`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending_responses[msg_id] = future
+        return future
+
+    def resolve_response(self, msg_id: str, value):
+        future = self.pending_responses.pop(msg_id, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    async def wait_for_response(self, msg_id: str, future: asyncio.Future, timeout: float):
+        """
+        Waits up to `timeout` seconds for the response to `msg_id`, raising TimeoutError if there is none. The future is
+        discarded afterwards, so late responses are ignored.
+        """
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending_responses.pop(msg_id, None)
+
     async def prompt_user(self, query, parent_message=None, format: Optional[Literal['workflow_confirmation']]=None):
         msg_id = str(uuid.uuid4())
+        response = self.expect_response(msg_id)
         self.send_response(
             "stdin",
             "input_request",
@@ -468,15 +611,10 @@ class BeakerKernel(KernelProxyManager):
             parent_identities=getattr(parent_message, "identities", None),
             msg_id=msg_id,
         )
-        sleep_duration = 0.2
-        for _ in range(round(USER_RESPONSE_WAIT_TIME_SECONDS / sleep_duration)):
-            if msg_id in self.user_responses:
-                result = self.user_responses[msg_id]
-                del self.user_responses[msg_id]
-                return result
-            await asyncio.sleep(sleep_duration)
-
-        raise Exception("Query timed out. User took too long to respond.")
+        try:
+            return await self.wait_for_response(msg_id, response, USER_RESPONSE_WAIT_TIME_SECONDS)
+        except asyncio.TimeoutError:
+            raise Exception("Query timed out. User took too long to respond.")
 
     def log(self, event_type: str, content, parent_header=None):
         # Re-encode data to fix issues with un-json-encodable elements in the debug output
@@ -687,7 +825,7 @@ class BeakerKernel(KernelProxyManager):
     async def input_reply(self, message):
         content = message.content
         parent_id = message.parent_header["msg_id"]
-        self.user_responses[parent_id] = content["value"]
+        self.resolve_response(parent_id, content["value"])
 
     @message_handler
     async def set_agent_model(self, message):
@@ -710,7 +848,8 @@ class BeakerKernel(KernelProxyManager):
             self.context.SLUG,
             self.context.config,
             language=self.context.subkernel.SLUG,
-            parent_header=message.header
+            parent_header=message.header,
+            reuse_subkernel=False,
         )
         await self.send_chat_history(message.header)
         return True
@@ -721,12 +860,14 @@ class BeakerKernel(KernelProxyManager):
 
     async def notebook_state_response(self, server, target_stream, data):
         async with handle_message(server, target_stream, data, send_status_updates=False, send_reply=False) as ctx:
-            setattr(self.notebook_state_response.__func__, 'result', ctx.message.content)
+            # The front-end replies with a msg_id of "<request msg_id>_reply" rather than setting the parent header
+            request_id = ctx.message.parent_header.get("msg_id") or ctx.message.header["msg_id"].removesuffix("_reply")
+            self.resolve_response(request_id, ctx.message.content)
             return None
-    setattr(notebook_state_response, 'result', None)
 
     async def request_notebook_state(self, parent_message=None):
         msg_id = str(uuid.uuid4())
+        response = self.expect_response(msg_id)
         self.send_response(
             "iopub",
             "notebook_state_request",
@@ -735,16 +876,10 @@ class BeakerKernel(KernelProxyManager):
             parent_identities=getattr(parent_message, "identities", None),
             msg_id=msg_id,
         )
-        timeout = 1
-        steps = 10
-        sleep_duration = timeout / steps
-        for _ in range(steps):
-            result = getattr(self.notebook_state_response, 'result', None)
-            if result != None:
-                setattr(self.notebook_state_response.__func__, 'result', None)
-                return result
-            await asyncio.sleep(sleep_duration)
-        return None
+        try:
+            return await self.wait_for_response(msg_id, response, NOTEBOOK_STATE_WAIT_TIME_SECONDS)
+        except asyncio.TimeoutError:
+            return None
 
 
 # Provided for backwards compatibility
@@ -753,6 +888,7 @@ LLMKernel = BeakerKernel
 
 def cleanup(kernel: BeakerKernel):
     try:
+        kernel.output_spill.cleanup()
         if kernel.context is not None:
             kernel.context.cleanup()
     except requests.exceptions.ConnectionError:
@@ -1,9 +1,29 @@
-from .agent import BeakerAgent
-from .context import BeakerContext
-from .subkernel import BeakerSubkernel
+import importlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .agent import BeakerAgent
+    from .context import BeakerContext
+    from .subkernel import BeakerSubkernel
 
 __all__ = [
     "BeakerAgent",
     "BeakerContext",
     "BeakerSubkernel",
 ]
+
+# Imported on first access so that lightweight modules in this package, such as `autodiscovery` which is used by the
+# CLI, can be imported without importing the agent and its dependencies.
+_LAZY_EXPORTS = {
+    "BeakerAgent": ".agent",
+    "BeakerContext": ".context",
+    "BeakerSubkernel": ".subkernel",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,6 @@
 import importlib
 import importlib.util
+import itertools
 import json
 import logging
 import os
@@ -11,46 +12,54 @@ from collections.abc import Mapping
 
 logger = logging.getLogger(__name__)
 
-# Sorted from more general to more specific. Items discovered lower/more specific locations will override
-# more general items with the same slug.
-if sys.platform == "win32":
-    RAW_LIB_LOCATIONS = [
-        r'%PROGRAMDATA\beaker',
-        r'%APPDATA%\beaker',
-        r'%LOCALAPPDATA%\beaker',
-        os.path.join(sys.prefix, "share", "beaker"),
-    ]
-elif sys.platform == "darwin":
-    RAW_LIB_LOCATIONS = [
-        "/usr/share/beaker",
-        "/usr/local/share/beaker",
-        os.path.join(sys.prefix, "share", "beaker"),
-        os.path.expanduser("~/.local/share/beaker"),
-        os.path.expanduser("~/Library/Beaker"),
-    ]
-else:
-    RAW_LIB_LOCATIONS = [
-        "/usr/share/beaker",
-        "/usr/local/share/beaker",
-        os.path.join(sys.prefix, "share", "beaker"),
-        os.path.expanduser("~/.local/share/beaker"),
-    ]
-    if "XDG_DATA_HOME" in os.environ:
-        RAW_LIB_LOCATIONS.append(os.path.join(os.environ["XDG_DATA_HOME"], "beaker"))
-
-RAW_LIB_LOCATIONS.extend(
-    [
-        os.path.expanduser("~/.config/beaker"),
-        os.path.expanduser("~/.beaker"),
-        os.path.abspath("./beaker"),
-        os.path.abspath("./.beaker"),
-    ]
-)
-# Ensure locations are unique without affecting order
-LIB_LOCATIONS = []
-for location in RAW_LIB_LOCATIONS:
-    if location not in LIB_LOCATIONS and os.path.exists(location):
-        LIB_LOCATIONS.append(location)
+def lib_locations() -> list[str]:
+    """
+    Returns the existing library locations for the current home directory, environment and working directory.
+    """
+    # Sorted from more general to more specific. Items discovered lower/more specific locations will override
+    # more general items with the same slug.
+    if sys.platform == "win32":
+        raw_lib_locations = [
+            r'%PROGRAMDATA\beaker',
+            r'%APPDATA%\beaker',
+            r'%LOCALAPPDATA%\beaker',
+            os.path.join(sys.prefix, "share", "beaker"),
+        ]
+    elif sys.platform == "darwin":
+        raw_lib_locations = [
+            "/usr/share/beaker",
+            "/usr/local/share/beaker",
+            os.path.join(sys.prefix, "share", "beaker"),
+            os.path.expanduser("~/.local/share/beaker"),
+            os.path.expanduser("~/Library/Beaker"),
+        ]
+    else:
+        raw_lib_locations = [
+            "/usr/share/beaker",
+            "/usr/local/share/beaker",
+            os.path.join(sys.prefix, "share", "beaker"),
+            os.path.expanduser("~/.local/share/beaker"),
+        ]
+        if "XDG_DATA_HOME" in os.environ:
+            raw_lib_locations.append(os.path.join(os.environ["XDG_DATA_HOME"], "beaker"))
+
+    raw_lib_locations.extend(
+        [
+            os.path.expanduser("~/.config/beaker"),
+            os.path.expanduser("~/.beaker"),
+            os.path.abspath("./beaker"),
+            os.path.abspath("./.beaker"),
+        ]
+    )
+    # Ensure locations are unique without affecting order
+    locations = []
+    for location in raw_lib_locations:
+        if location not in locations and os.path.exists(location):
+            locations.append(location)
+    return locations
+
+
+LIB_LOCATIONS = lib_locations()
 
 ResourceType = typing.Literal["contexts", "subkernels", "apps", "commands", "integrations", "data"]
 
@@ -69,22 +78,29 @@ def find_resource_dirs(resource_type: str, extra_locations: typing.Optional[list
             yield resource_dir
 
 
-def find_mappings(resource_type: ResourceType) -> typing.Generator[typing.Dict[str, any], None, None]:
+def find_mapping_files(resource_type: ResourceType) -> typing.Generator[str, None, None]:
     """
-    Finds, reads, and parses all mappings of the provided type.
+    Finds the paths of all mapping files of the provided type.
     """
     for resource_dir in find_resource_dirs(resource_type):
         for mapping in os.listdir(resource_dir):
             fullpath = os.path.join(resource_dir, mapping)
-            if not fullpath.endswith(".json"):
-                continue
-            try:
-                with open(fullpath) as mapping_file:
-                    data = json.load(mapping_file)
-                    yield fullpath, data
-            except (json.JSONDecodeError, KeyError) as err:
-                logger.error(f"Unable to parse the {resource_type} file '{fullpath}", exc_info=err)
-                continue
+            if fullpath.endswith(".json"):
+                yield fullpath
+
+
+def find_mappings(resource_type: ResourceType) -> typing.Generator[typing.Dict[str, any], None, None]:
+    """
+    Finds, reads, and parses all mappings of the provided type.
+    """
+    for fullpath in find_mapping_files(resource_type):
+        try:
+            with open(fullpath) as mapping_file:
+                data = json.load(mapping_file)
+                yield fullpath, data
+        except (json.JSONDecodeError, KeyError) as err:
+            logger.error(f"Unable to parse the {resource_type} file '{fullpath}", exc_info=err)
+            continue
 
 
 class AutodiscoveryItems(Mapping[str, type|dict[str, str]]):
@@ -134,12 +150,125 @@ class AutodiscoveryItems(Mapping[str, type|dict[str, str]]):
         return len(self.raw)
 
 
-def autodiscover(mapping_type: ResourceType) -> typing.Dict[str, type]:
+# Optional file in which the parsed mappings are kept between processes, so that starting the CLI or a kernel doesn't
+# need to list the resource directories and parse every mapping.
+AUTODISCOVERY_INDEX_PATH = os.environ.get("BEAKER_AUTODISCOVERY_INDEX", None)
+AUTODISCOVERY_INDEX_VERSION = 1
+
+# Parsed mappings and imported classes for each resource type, shared by all `autodiscover()` calls in this process.
+# Entries hold the modification times of the resource directories and mapping files they were read from, and are
+# only used while those are unchanged.
+_registry: dict[str, dict] = {}
+_index: dict[str, dict] | None = None
+
+
+def mtime_ns(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def mappings_signature(resource_type: ResourceType, mapping_files: list[str]) -> dict[str, list]:
     """
-    Auto discovers installed classes of specified types.
+    Returns the modification times that determine whether the mappings of a resource type have changed. Directory
+    times change when mapping files are added, removed or renamed, and file times when a mapping is edited in place.
+    Directories that don't exist are included so that creating them is noticed.
     """
-    items: AutodiscoveryItems = AutodiscoveryItems()
+    return {
+        "dirs": [
+            [resource_dir, mtime_ns(resource_dir)]
+            for resource_dir in (os.path.join(location, resource_type) for location in LIB_LOCATIONS)
+        ],
+        "files": [[path, mtime_ns(path)] for path in mapping_files],
+    }
+
+
+def signature_is_current(signature: dict[str, list]) -> bool:
+    return all(mtime_ns(path) == mtime for path, mtime in itertools.chain(signature["dirs"], signature["files"]))
+
+
+def read_index() -> dict[str, dict]:
+    global _index
+    if _index is None:
+        _index = {}
+        if AUTODISCOVERY_INDEX_PATH:
+            try:
+                with open(AUTODISCOVERY_INDEX_PATH) as index_file:
+                    index = json.load(index_file)
+                if index.get("version") == AUTODISCOVERY_INDEX_VERSION and index.get("locations") == LIB_LOCATIONS:
+                    _index = index.get("resources", {})
+            except (OSError, json.JSONDecodeError):
+                pass
+    return _index
+
+
+def write_index():
+    if not AUTODISCOVERY_INDEX_PATH:
+        return
+    index = {
+        "version": AUTODISCOVERY_INDEX_VERSION,
+        "locations": LIB_LOCATIONS,
+        "resources": {
+            **read_index(),
+            **{
+                resource_type: {"signature": entry["signature"], "mappings": entry["mappings"]}
+                for resource_type, entry in _registry.items()
+            },
+        },
+    }
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(AUTODISCOVERY_INDEX_PATH)), exist_ok=True)
+        partial_path = f"{AUTODISCOVERY_INDEX_PATH}.{os.getpid()}"
+        with open(partial_path, "w") as index_file:
+            json.dump(index, index_file)
+        os.replace(partial_path, AUTODISCOVERY_INDEX_PATH)
+    except OSError as err:
+        logger.warning(f"Unable to write autodiscovery index '{AUTODISCOVERY_INDEX_PATH}': {err}")
+
+
+def registry_entry(mapping_type: ResourceType) -> dict:
+    """
+    Returns the cached mappings of the provided type, scanning the resource directories again if they have changed.
+    """
+    entry = _registry.get(mapping_type)
+    if entry is not None and signature_is_current(entry["signature"]):
+        return entry
+    indexed = read_index().pop(mapping_type, None)
+    if entry is None and indexed is not None and signature_is_current(indexed["signature"]):
+        entry = _registry[mapping_type] = {**indexed, "classes": {}}
+        return entry
+
+    # Taken before parsing so that mappings edited while parsing are read again by the next call
+    signature = mappings_signature(mapping_type, list(find_mapping_files(mapping_type)))
+    mappings = {}
     for mapping_file, data in find_mappings(mapping_type):
         slug = data["slug"]
-        items[slug] = {"mapping_file": mapping_file, **data}
+        mappings[slug] = {"mapping_file": mapping_file, **data}
+    entry = _registry[mapping_type] = {"signature": signature, "mappings": mappings, "classes": {}}
+    write_index()
+    return entry
+
+
+def reset_autodiscovery():
+    """
+    Finds the library locations again and forgets everything discovered so far, for processes that switched to another
+    user, environment or working directory since, such as kernels forked from the kernel zygote.
+    """
+    global AUTODISCOVERY_INDEX_PATH, _index
+    # Updated in place, as the list is imported by other modules
+    LIB_LOCATIONS[:] = lib_locations()
+    AUTODISCOVERY_INDEX_PATH = os.environ.get("BEAKER_AUTODISCOVERY_INDEX", None)
+    _registry.clear()
+    _index = None
+
+
+def autodiscover(mapping_type: ResourceType) -> typing.Dict[str, type]:
+    """
+    Auto discovers installed classes of specified types.
+    """
+    entry = registry_entry(mapping_type)
+    items: AutodiscoveryItems = AutodiscoveryItems(entry["mappings"])
+    # Imported classes are shared, so each class is only imported once per process
+    items.mapping = entry["classes"]
     return items
@@ -0,0 +1,221 @@
+"""
+Helpers for storing, compressing and measuring checkpoint files on disk.
+"""
+import gzip
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Compression codecs in order of preference, with the suffix added to compressed files. gzip is always available.
+COMPRESSION_SUFFIXES = {
+    "zstd": "zst",
+    "lz4": "lz4",
+    "gzip": "gz",
+}
+COMPRESSION_MODULES = {
+    "zstd": "zstandard",
+    "lz4": "lz4.frame",
+    "gzip": "gzip",
+}
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def codec_available(codec: str) -> bool:
+    module = COMPRESSION_MODULES.get(codec)
+    if module is None:
+        return False
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def resolve_compression(setting: Optional[str]) -> Optional[str]:
+    """
+    Returns the codec to compress checkpoints with for a `checkpoint_compression` config value, or None if checkpoints
+    should not be compressed.
+
+    "auto" picks the first available codec. Codecs whose library isn't installed fall back to gzip.
+    """
+    setting = (setting or "").strip().lower()
+    if setting in ("", "none", "off", "false"):
+        return None
+    if setting == "auto":
+        return next(codec for codec in COMPRESSION_SUFFIXES if codec_available(codec))
+    if setting not in COMPRESSION_SUFFIXES:
+        logger.warning(f"Unknown checkpoint compression '{setting}'. Checkpoints will not be compressed.")
+        return None
+    if not codec_available(setting):
+        logger.warning(
+            f"Checkpoint compression '{setting}' requires the '{COMPRESSION_MODULES[setting]}' package. Using gzip."
+        )
+        return "gzip"
+    return setting
+
+
+def compress_file(source: str, destination: str, codec: str):
+    """
+    Streams `source` into `destination`, compressed with `codec`.
+    """
+    with open(source, "rb") as infile:
+        if codec == "zstd":
+            import zstandard
+            with open(destination, "wb") as outfile:
+                with zstandard.ZstdCompressor().stream_writer(outfile, closefd=False) as writer:
+                    shutil.copyfileobj(infile, writer, CHUNK_SIZE)
+        elif codec == "lz4":
+            import lz4.frame
+            with lz4.frame.open(destination, "wb") as writer:
+                shutil.copyfileobj(infile, writer, CHUNK_SIZE)
+        elif codec == "gzip":
+            with gzip.open(destination, "wb", compresslevel=6) as writer:
+                shutil.copyfileobj(infile, writer, CHUNK_SIZE)
+        else:
+            raise ValueError(f"Unknown compression codec '{codec}'")
+
+
+def hash_file(path: str) -> str:
+    """
+    Returns the sha256 hash of the contents of `path`, used as the content address of checkpoint files.
+    """
+    hash = hashlib.new("sha256")
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def storage_usage(path: str) -> int:
+    """
+    Returns the total size in bytes of all files under `path`. Hard linked files are only counted once.
+    """
+    total = 0
+    seen = set()
+    for root, _dirs, files in os.walk(path):
+        for filename in files:
+            try:
+                stat = os.stat(os.path.join(root, filename))
+            except OSError:
+                # Removed by another session while walking
+                continue
+            if stat.st_nlink > 1:
+                if (stat.st_dev, stat.st_ino) in seen:
+                    continue
+                seen.add((stat.st_dev, stat.st_ino))
+            total += stat.st_size
+    return total
+
+
+class BlobStore:
+    """
+    Content-addressed store of checkpoint files shared by all sessions of a user on a server.
+
+    Sessions reference blobs through hard links in their own storage directories, so identical files are only stored
+    once and the link count of a blob is one more than the number of session files using it. Blobs are only ever
+    added by hard linking a completely written file into place, so other sessions never see partial blobs and
+    concurrent writers of the same content don't conflict. No locking is needed: a session that loses a race with
+    garbage collection still holds its own link to the data.
+
+    Restoring a checkpoint unpickles its files, so a blob planted by another user would run code in the sessions that
+    link to it. Each user therefore has their own store, which is only used if no other user can write to it.
+    """
+
+    def __init__(self, root: str):
+        self.path = os.path.join(root, str(os.getuid()))
+        self.enabled = False
+
+    def create(self) -> bool:
+        """
+        Creates the store of the current user, returning whether it can be used. If it can't, files are not shared.
+        """
+        root = os.path.dirname(self.path)
+        try:
+            # Like /tmp, so that every user can add their own store but not remove anyone else's
+            os.makedirs(root, exist_ok=True, mode=0o1777)
+            if os.stat(root).st_uid == os.getuid():
+                os.chmod(root, 0o1777)
+            os.makedirs(self.path, exist_ok=True, mode=0o700)
+            stat = os.stat(self.path)
+        except OSError as err:
+            logger.warning(f"Unable to create checkpoint blob store '{self.path}': {err}")
+            return False
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            logger.warning(
+                f"Checkpoint blob store '{self.path}' is accessible to other users and will not be used."
+            )
+            return False
+        self.enabled = True
+        return True
+
+    def blob_path(self, name: str) -> str:
+        return os.path.join(self.path, name[:2], name)
+
+    def link(self, name: str, destination: str) -> bool:
+        """
+        Links the blob `name` to `destination` if it is stored, returning whether it was.
+        """
+        if not self.enabled:
+            return False
+        try:
+            os.link(self.blob_path(name), destination)
+            return True
+        except OSError:
+            return False
+
+    def publish(self, source: str, name: str, destination: str) -> bool:
+        """
+        Adds the complete file `source` to the store as `name` and moves it to `destination`, linked to the blob.
+        Returns False, leaving `source` in place, if the file system doesn't support hard links.
+        """
+        if not self.enabled:
+            return False
+        blob = self.blob_path(name)
+        try:
+            os.makedirs(os.path.dirname(blob), exist_ok=True, mode=0o700)
+            try:
+                os.link(source, blob)
+            except FileExistsError:
+                # Stored by another session in the meantime
+                pass
+            os.link(blob, destination)
+        except OSError as err:
+            logger.debug(f"Unable to share checkpoint file '{name}': {err}")
+            return False
+        os.remove(source)
+        return True
+
+    def release(self, name: str) -> int:
+        """
+        Removes the blob `name` if no session links to it anymore, returning the number of bytes freed.
+        """
+        if not self.enabled:
+            return 0
+        blob = self.blob_path(name)
+        try:
+            stat = os.stat(blob)
+            if stat.st_nlink <= 1:
+                os.remove(blob)
+                return stat.st_size
+        except FileNotFoundError:
+            pass
+        return 0
+
+    def collect_garbage(self):
+        """
+        Removes all blobs that no session links to anymore.
+        """
+        if not self.enabled:
+            return
+        for root, _dirs, files in os.walk(self.path):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    if os.stat(path).st_nlink <= 1:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -1,7 +1,11 @@
-from .analyzer import AnalysisEngine
-from .analysis_types import AnalysisAnnotation, AnalysisCategory, AnalysisIssue
-from .rules import AnalysisRule, AnalysisASTRule, AnalysisLLMRule
-from .analysis_agent import AnalysisAgent, AnalysisResult
+import importlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .analyzer import AnalysisEngine
+    from .analysis_types import AnalysisAnnotation, AnalysisCategory, AnalysisIssue
+    from .rules import AnalysisRule, AnalysisASTRule, AnalysisLLMRule
+    from .analysis_agent import AnalysisAgent, AnalysisResult
 
 __all__ = [
     # Primary classes
@@ -17,3 +21,25 @@ __all__ = [
     "AnalysisIssue",
     "AnalysisResult",
 ]
+
+# Imported on first access, as the analyzer, rules and agent import tree-sitter and archytas. This keeps importing
+# e.g. `code_analysis.analysis_types` cheap.
+_LAZY_EXPORTS = {
+    "AnalysisEngine": ".analyzer",
+    "AnalysisAgent": ".analysis_agent",
+    "AnalysisResult": ".analysis_agent",
+    "AnalysisRule": ".rules",
+    "AnalysisASTRule": ".rules",
+    "AnalysisLLMRule": ".rules",
+    "AnalysisAnnotation": ".analysis_types",
+    "AnalysisCategory": ".analysis_types",
+    "AnalysisIssue": ".analysis_types",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -232,6 +232,64 @@ class ConfigClass:
         normalize_function=normalize_bool,
         label="Enable Checkpointing?"
     )
+    incremental_checkpoints: bool = configfield(
+        "Flag as to whether checkpoints only re-serialize variables that changed since the previous checkpoint.",
+        "INCREMENTAL_CHECKPOINTS",
+        default=True,
+        sensitive=False,
+        normalize_function=normalize_bool,
+        label="Incremental Checkpoints?"
+    )
+    background_checkpoints: bool = configfield(
+        "Flag as to whether checkpoints taken before running agent code are written in the background while the code "
+        "runs, where the subkernel supports it. Python subkernels fork the kernel process to take a snapshot, which "
+        "isn't available on Windows, where the checkpoint is written before running the code instead.",
+        "BACKGROUND_CHECKPOINTS",
+        default=False,
+        sensitive=False,
+        normalize_function=normalize_bool,
+        label="Background Checkpoints?"
+    )
+    checkpoint_restore_threads: int = configfield(
+        "Number of threads used to load variables when rolling back to a checkpoint.",
+        "CHECKPOINT_RESTORE_THREADS",
+        default=4,
+        sensitive=False,
+        normalize_function=int,
+        label="Checkpoint Restore Threads",
+    )
+    checkpoint_compression: str = configfield(
+        "Compression for checkpoint files: 'none', 'auto', 'zstd', 'lz4' or 'gzip'. zstd and lz4 fall back to gzip if "
+        "their package is not installed.",
+        "CHECKPOINT_COMPRESSION",
+        default="none",
+        sensitive=False,
+        label="Checkpoint Compression",
+    )
+    checkpoint_session_quota: int = configfield(
+        "Maximum number of bytes of checkpoint data to keep per session. 0 for no limit.",
+        "CHECKPOINT_SESSION_QUOTA",
+        default=0,
+        sensitive=False,
+        normalize_function=int,
+        label="Checkpoint Quota Per Session (bytes)",
+    )
+    checkpoint_global_quota: int = configfield(
+        "Maximum number of bytes of checkpoint data to keep across all sessions. 0 for no limit.",
+        "CHECKPOINT_GLOBAL_QUOTA",
+        default=0,
+        sensitive=False,
+        normalize_function=int,
+        label="Checkpoint Quota Overall (bytes)",
+    )
+    checkpoints_keep_recent: int = configfield(
+        "Number of most recent checkpoints that are never evicted to stay within the checkpoint quotas.",
+        "CHECKPOINTS_KEEP_RECENT",
+        default=5,
+        sensitive=False,
+        normalize_function=int,
+        label="Recent Checkpoints To Keep",
+    )
     beaker_run_path: os.PathLike = configfield(
         description="Path to use for beaker run items such as kernel json files and checkpoint data",
         env_var="BEAKER_RUN_PATH",
@@ -254,11 +312,69 @@ class ConfigClass:
         normalize_function=normalize_bool,
         label="Send kernel state on query?"
     )
+    reuse_subkernel_on_context_switch: bool = configfield(
+        "Flag as to whether switching to a context with the same language keeps the running subkernel instead of "
+        "starting a new one.",
+        "REUSE_SUBKERNEL_ON_CONTEXT_SWITCH",
+        default=False,
+        sensitive=False,
+        normalize_function=normalize_bool,
+        label="Reuse Subkernel On Context Switch?"
+    )
+    use_kernel_zygote: bool = configfield(
+        "Flag as to whether Beaker kernels are forked from a long-running process that has already imported Beaker, "
+        "instead of each being started as a new Python process. Contexts and subkernels are still discovered for the "
+        "user and working directory of each kernel.",
+        "USE_KERNEL_ZYGOTE",
+        default=False,
+        sensitive=False,
+        normalize_function=normalize_bool,
+        label="Fork Beaker Kernels From Zygote?"
+    )
+    stream_coalesce_window_ms: float = configfield(
+        "Milliseconds for which consecutive stdout/stderr output of the same execution is merged into one message "
+        "before it is sent to the front-end. 0 sends every message as it arrives. Contexts may override this.",
+        "STREAM_COALESCE_WINDOW_MS",
+        default=0,
+        sensitive=False,
+        normalize_function=float,
+        label="Stream Coalescing Window (ms)",
+    )
+    stream_coalesce_max_bytes: int = configfield(
+        "Size in bytes at which merged stdout/stderr output is sent without waiting for the window to end.",
+        "STREAM_COALESCE_MAX_BYTES",
+        default=65536,
+        sensitive=False,
+        normalize_function=int,
+        label="Stream Coalescing Max Bytes",
+    )
+    output_max_bytes: int = configfield(
+        "Maximum number of bytes of output a single execution may send to the front-end. Output beyond this is saved "
+        "to a file that can be paged through instead. 0 for no limit.",
+        "OUTPUT_MAX_BYTES",
+        default=0,
+        sensitive=False,
+        normalize_function=int,
+        label="Output Max Bytes",
+    )
+    output_max_bytes_per_second: int = configfield(
+        "Maximum rate, in bytes per second, at which a single execution may send output to the front-end before "
+        "further output is saved to a file instead. 0 for no limit.",
+        "OUTPUT_MAX_BYTES_PER_SECOND",
+        default=0,
+        sensitive=False,
+        normalize_function=int,
+        label="Output Max Bytes Per Second",
+    )
 
     @property
     def checkpoint_storage_path(self):
         return os.path.join(self.beaker_run_path, "checkpoints")
 
+    @property
+    def checkpoint_blob_path(self):
+        return os.path.join(self.checkpoint_storage_path, "blobs")
+
     tools_enabled: Table[bool] = configfield(
         description="This table allows you to enable/disable tools. The key is the name of the tool, and the value is a \
 boolean value which will enable/disable the tool based on the value.",
@@ -270,6 +386,14 @@ boolean value which will enable/disable the tool based on the value.",
         save_default_value=True,
     )
 
+    subkernel_pool_sizes: Table[int] = configfield(
+        description="This table sets how many idle kernels the Beaker server keeps started ahead of time so that \
+contexts can be set up without waiting for a subkernel to start. The key is the kernel name (e.g. python3), and the \
+value is the number of idle kernels to keep.",
+        default_factory=lambda: {},
+        label="Idle Kernels",
+    )
+
     providers: Table[LLM_Service_Provider] = configfield(
         description="Allows switching between LLM Model providers/APIs.",
         save_default_value=True,
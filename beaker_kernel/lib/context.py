@@ -5,9 +5,7 @@ import json
 import logging
 import os.path
 from pathlib import Path
-import urllib.parse
 from uuid import uuid4
-import requests
 import itertools
 from dataclasses import asdict
 from functools import wraps
@@ -17,14 +15,15 @@ from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
 import yaml
 
 from beaker_kernel.lib.autodiscovery import autodiscover
-from beaker_kernel.lib.utils import action, get_socket, ExecutionTask, get_execution_context, get_parent_message, ExecutionError, ensure_async
+from beaker_kernel.lib.utils import action, ExecutionTask, get_execution_context, get_parent_message, ExecutionError, ensure_async
 from beaker_kernel.lib.config import config as beaker_config
 from beaker_kernel.lib.integrations.base import BaseIntegrationProvider
 from beaker_kernel.lib.types import Integration
 from beaker_kernel.lib.workflow import Workflow, WorkflowState, WorkflowStageProgress, create_available_workflows_prompt
 
 
-from .jupyter_kernel_proxy import InterceptionFilter, JupyterMessage
+from .jupyter_kernel_proxy import JupyterMessage
+from .subkernel_state import SubkernelStateTracker
 
 if TYPE_CHECKING:
     from archytas.react import ReActAgent
@@ -70,6 +69,9 @@ class BeakerContext:
 
     SLUG: Optional[str]
     WEIGHT: int = 50  # Used for auto-sorting in drop-downs, etc. Lower weights are listed earlier.
+    # Overrides of the `stream_coalesce_window_ms` and `stream_coalesce_max_bytes` config settings for this context
+    STREAM_COALESCE_WINDOW_MS: ClassVar[Optional[float]] = None
+    STREAM_COALESCE_MAX_BYTES: ClassVar[Optional[int]] = None
 
     def __init__(self, beaker_kernel: "BeakerKernel", agent_cls: "BeakerAgent", config: Dict[str, Any],
                  integrations: list[BaseIntegrationProvider] = None):
@@ -81,7 +83,14 @@ class BeakerContext:
         self.current_workflow_state = None
         self.beaker_kernel = beaker_kernel
         self.config = config
+        self.subkernel_state_version = 0
+        self._subkernel_state_snapshot = None
+        # Executions known not to change the subkernel's state, e.g. state fetches and checkpoints
+        self._stateless_execution_ids = set()
+        self.subkernel_state = SubkernelStateTracker()
+        self._kernel_state_sent_version = None
         self.subkernel = self.get_subkernel()
+        self.beaker_kernel.add_intercept(msg_type="execute_reply", func=self.track_subkernel_state_version, stream="shell")
 
         self.agent = agent_cls(
             context=self,
@@ -194,6 +203,7 @@ class BeakerContext:
 
     def cleanup(self):
         self.subkernel.cleanup()
+        self.beaker_kernel.remove_intercept(msg_type="execute_reply", func=self.track_subkernel_state_version, stream="shell")
         for msg_type, intercept_func, stream in self.intercepts:
             self.beaker_kernel.remove_intercept(msg_type=msg_type, func=intercept_func, stream=stream)
         del self.agent
@@ -251,10 +261,11 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
         content = "\n\n".join(parts)
         return content
 
-    def get_subkernel(self):
-        config = beaker_config
-        language = self.config.get("language", "python3")
-        self.beaker_kernel.debug("new_kernel", f"Setting new kernel of `{language}`")
+    @classmethod
+    def resolve_subkernel_class(cls, language: str) -> "type[BeakerSubkernel]":
+        """
+        Returns the subkernel class for `language`, which can be either a kernel name or a subkernel slug.
+        """
         kernel_opts = {
             subkernel.KERNEL_NAME: subkernel
             for subkernel in autodiscover("subkernels").values()
@@ -265,17 +276,23 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
         }
         if language not in kernel_opts and language in subkernel_opts:
             language = subkernel_opts[language].KERNEL_NAME
+        return kernel_opts[language]
 
-        url = urllib.parse.urljoin(self.beaker_kernel.jupyter_server, "/api/kernels")
-        res = requests.post(
-            url,
-            json={"name": language, "path": ""},
-            headers={"Authorization": f"token {config.jupyter_token}"},
-        )
-        kernel_info = res.json()
+    def get_subkernel(self):
+        language = self.config.get("language", "python3")
+        self.beaker_kernel.debug("new_kernel", f"Setting new kernel of `{language}`")
+        subkernel_cls = self.resolve_subkernel_class(language)
+
+        # The kernel is started by `BeakerKernel.set_context()` before the context is created, as it can't be awaited
+        # here without blocking the event loop.
+        subkernel_id = self.beaker_kernel.take_started_subkernel(subkernel_cls.KERNEL_NAME)
+        if subkernel_id is None:
+            raise RuntimeError(
+                f"No {subkernel_cls.KERNEL_NAME} subkernel was started for the context. Contexts must be created via "
+                "`BeakerKernel.set_context()`, or after `await beaker_kernel.start_subkernel(kernel_name)`."
+            )
         self.beaker_kernel.update_running_kernels()
         kernels = self.beaker_kernel.kernels
-        subkernel_id = kernel_info["id"]
         # NOTE: MODIFIED `connect_to`
         # TODO: Refactor this into `lib/kernel_proxy_manager.py`
         matching = next((n for n in kernels if subkernel_id in n), None)
@@ -283,7 +300,7 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
             raise ValueError("Unknown kernel " + subkernel_id)
         if kernels[matching] == self.beaker_kernel.server.config:
             raise ValueError("Refusing loopback connection")
-        subkernel = kernel_opts[language](subkernel_id, kernels[matching], self)
+        subkernel = subkernel_cls(subkernel_id, kernels[matching], self)
         self.beaker_kernel.server.set_proxy_target(subkernel.connected_kernel)
         return subkernel
 
@@ -457,23 +474,130 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
                 raise NotImplementedError
         return result
 
-    async def get_subkernel_state(self):
-        fetch_state_code = self.subkernel.FETCH_STATE_CODE
-        state = await self.evaluate(fetch_state_code)
+    async def track_subkernel_state_version(self, server, target_stream, data):
+        """
+        Bumps the subkernel state version whenever an execution that may have changed the state of the subkernel
+        finishes, invalidating any cached state snapshot.
+        """
+        message = JupyterMessage.parse(data)
+        parent_id = message.parent_header.get("msg_id", None)
+        if parent_id in self._stateless_execution_ids:
+            self._stateless_execution_ids.discard(parent_id)
+        else:
+            self.subkernel_state_version += 1
+        return data
+
+    async def _fetch_subkernel_state(self):
+        tracker = self.subkernel_state
+        delta_code = getattr(self.subkernel, "FETCH_STATE_DELTA_CODE", "")
+        if delta_code:
+            code = delta_code.format(version=tracker.remote_version)
+        else:
+            code = self.subkernel.FETCH_STATE_CODE
+        # Fetching the state doesn't change it, so the reply for this execution should not invalidate the snapshot.
+        state = await self.execute(code, changes_state=False)
+        try:
+            state["return"] = self.subkernel.parse_subkernel_return(state)
+        except Exception:
+            logger.error("Unable to parse result.")
+            logger.debug("Subkernel: %s\nResult:\n%s", self.subkernel.connected_kernel, state)
         for warning in state["stderr_list"]:
             logger.warning(warning)
-        return state["return"]
+        result = state["return"]
+        if not isinstance(result, dict):
+            return result
+        tracker.update(result)
+        return tracker.state
+
+    async def get_subkernel_state(self):
+        """
+        Returns a snapshot of the subkernel's state.
+
+        The snapshot is shared by everything that requests the state (preview, kernel state, auto context, etc.) until
+        the next execution in the subkernel finishes, so concurrent and repeated requests only run the fetch once.
+        """
+        snapshot = self._subkernel_state_snapshot
+        if snapshot is None or snapshot[0] != self.subkernel_state_version:
+            snapshot = (self.subkernel_state_version, asyncio.ensure_future(self._fetch_subkernel_state()))
+            self._subkernel_state_snapshot = snapshot
+        try:
+            # Shielded so that one cancelled caller doesn't cancel the fetch for everyone else sharing it.
+            return await asyncio.shield(snapshot[1])
+        except Exception:
+            if self._subkernel_state_snapshot is snapshot:
+                self._subkernel_state_snapshot = None
+            raise
 
     async def send_kernel_state(self):
         """
         Gets the subkernel state and also applies subkernel formatting as to
         prepare it for display.
         """
-        state = await self.get_subkernel_state()
+        await self.get_subkernel_state()
+        tracker = self.subkernel_state
+        state, version = tracker.state, tracker.version
+        self._kernel_state_sent_version = version
+        tracker.forget_removals(version)
         return {
             "x-application/beaker-subkernel-state": {
                 "application/json": self.subkernel.format_kernel_state(state or {})
             },
+            "version": version,
+        }
+
+    async def kernel_state_delta(self) -> Optional[dict]:
+        """
+        Returns the changes to the subkernel state since the kernel state was last sent in full, or None if a full
+        kernel state must be sent instead.
+
+        Contexts that override the kernel state function always get the full state as their payload can't be diffed.
+        """
+        if self._kernel_state_sent_version is None or self.kernel_state != self.send_kernel_state:
+            return None
+        if type(self).send_kernel_state is not BeakerContext.send_kernel_state:
+            return None
+        await self.get_subkernel_state()
+        tracker = self.subkernel_state
+        base_version = self._kernel_state_sent_version
+        changes = tracker.changes_since(base_version)
+        if changes is None:
+            return None
+        updated, removed = changes
+        self._kernel_state_sent_version = tracker.version
+        # Later deltas are based on this version, so earlier removals aren't needed anymore
+        tracker.forget_removals(tracker.version)
+        return {
+            "version": tracker.version,
+            "base_version": base_version,
+            "updated": self.subkernel.format_kernel_state(updated),
+            "removed": removed,
+        }
+
+    @action(default_payload="{}")
+    async def resync_kernel_state(self, message):
+        """
+        Sends the full kernel state, for use by clients that missed a kernel state delta.
+        """
+        await self.beaker_kernel.send_kernel_state_info(parent_header=message.header, full=True)
+
+    @action(default_payload='{"msg_id": "", "offset": 0, "length": 65536}')
+    async def fetch_output_range(self, message):
+        """
+        Returns a page of the output that an execution produced beyond its output limit, which was saved to a file
+        instead of being sent. `msg_id` is the id of the execute request, and `offset` and `length` are in bytes.
+        """
+        content = message.content
+        msg_id = content.get("msg_id", "")
+        offset = int(content.get("offset", 0))
+        length = int(content.get("length", 65536))
+        output_spill = self.beaker_kernel.output_spill
+        data = output_spill.read(msg_id, offset, length)
+        return {
+            "msg_id": msg_id,
+            "offset": offset,
+            "length": len(data),
+            "total_length": output_spill.spilled_bytes(msg_id),
+            "text": data.decode(errors="replace"),
         }
 
     @action(action_name="get_subkernel_state")
@@ -693,6 +817,7 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
         identities=None,
         cc_messages=True,
         raise_on_error=True,
+        changes_state=True,
     ) -> ExecutionTask:
 
         self.beaker_kernel.debug("execution_start", {"command": command}, parent_header=parent_header)
@@ -721,8 +846,9 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
             identities=identities,
         )
         execute_request_msg = JupyterMessage.parse(execute_request_multipart)
+        if not changes_state:
+            self._stateless_execution_ids.add(execute_request_msg.header.get("msg_id"))
         async def execution_coro():
-            stream.send_multipart(execute_request_multipart)
             message_id = execute_request_msg.header.get("msg_id")
             self.beaker_kernel.internal_executions.add(message_id)
 
@@ -740,10 +866,17 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
             }
             message_metadata = {}
 
-            filter_list = self.beaker_kernel.server.filters
+            server = self.beaker_kernel.server
 
-            shell_socket = get_socket("shell")
-            iopub_socket = get_socket("iopub")
+            # Per the Jupyter messaging spec, all output for a request has been published on iopub once the kernel
+            # reports an idle status for it. The execution is complete once both that and the execute_reply have been
+            # received, regardless of which arrives first.
+            completion = asyncio.get_running_loop().create_future()
+            completion_state = {"reply": False, "idle": False}
+
+            def check_completion():
+                if completion_state["reply"] and completion_state["idle"] and not completion.done():
+                    completion.set_result(None)
 
             # Internal decorator to send relabeled copies of certain messages to the front-end
             def carbon_copy(fn):
@@ -756,23 +889,26 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
                         destination_server = server.manager.server
                         destination_stream = destination_server.streams.iopub
 
-                        relabeled_message = JupyterMessage(*message)
                         context_type = execution_context.get("type", "unknown")
                         context_name = execution_context.get("name", None)
 
+                        # The decoded message is shared with the rest of the filter chain, so build the relabeled
+                        # copy from new dicts rather than modifying it in place.
                         original_parent_message: JupyterMessage = outer_parent_context.get("parent_message")
                         if original_parent_message:
-                            # As this is a tuple, we can't update the reference pointed to by
-                            # `relabled_message.parent_header` but we can  change the values of the referenced dict
-                            parent_header: dict = relabeled_message.parent_header
-                            parent_header.clear()
-                            parent_header.update(original_parent_message.header)
-
-                        relabeled_message.header["msg_type"] = f"beaker__{msg_type}"
-                        relabeled_message.content["execution_type"] = context_type
+                            parent_header = dict(original_parent_message.header)
+                        else:
+                            parent_header = message.parent_header
+
+                        relabeled_content = {**message.content, "execution_type": context_type}
                         if context_name:
-                            relabeled_message.content["execution_item_name"] = context_name
-                        relabeled_data = relabeled_message.sign_using(destination_server.config.get("key")).parts
+                            relabeled_content["execution_item_name"] = context_name
+                        relabeled_message = message._replace(
+                            header={**message.header, "msg_type": f"beaker__{msg_type}"},
+                            parent_header=parent_header,
+                            content=relabeled_content,
+                        )
+                        relabeled_data = relabeled_message.signed_parts(destination_server.config.get("key"))
                         destination_stream.send_multipart(relabeled_data)
                         destination_stream.flush()
 
@@ -783,17 +919,12 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
             # Generate a handler to catch and silence the output
             @carbon_copy
             async def silence_message(server, target_stream, data):
-                message = JupyterMessage.parse(data)
-
-                if not surpress_messages or message.parent_header.get("msg_id", None) != message_id:
+                if not surpress_messages:
                     return data
                 return None
 
             async def collect_result(server, target_stream, data):
                 message = JupyterMessage.parse(data)
-                # Ensure we are only working on handlers for this message response
-                if message.parent_header.get("msg_id", None) != message_id:
-                    return data
 
                 content_data = message.content["data"].get("text/plain", None)
                 message_context["return"] = content_data
@@ -802,9 +933,6 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
 
             async def collect_display_data(server, target_stream, data):
                 message = JupyterMessage.parse(data)
-                # Ensure we are only working on handlers for this message response
-                if message.parent_header.get("msg_id", None) != message_id:
-                    return data
                 display_data = message.content["data"]
                 message_context["display_data_list"].append(display_data)
                 if not surpress_messages:
@@ -812,9 +940,6 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
 
             async def collect_stream(server, target_stream, data):
                 message = JupyterMessage.parse(data)
-                # Ensure we are only working on handlers for this message response
-                if message.parent_header.get("msg_id", None) != message_id:
-                    return data
                 stream = message.content["name"]
                 message_context[f"{stream}_list"].append(message.content["text"])
                 if not surpress_messages:
@@ -839,69 +964,47 @@ loop was running and chronologically fit "inside" the query cell, as opposed to
             @carbon_copy
             async def cleanup(server, target_stream, data):
                 message = JupyterMessage.parse(data)
-                # Ensure we are only working on handlers for this message response
-                if message.parent_header.get("msg_id", None) != message_id:
-                    return data
-                if response_handler:
-                    filter_list.remove(
-                        InterceptionFilter(iopub_socket, "stream", response_handler)
-                    )
-                filter_list.remove(
-                    InterceptionFilter(iopub_socket, "stream", collect_stream)
-                )
-                filter_list.remove(
-                    InterceptionFilter(iopub_socket, "display_data", collect_display_data)
-                )
-                filter_list.remove(
-                    InterceptionFilter(iopub_socket, "execute_input", silence_message)
-                )
-                filter_list.remove(
-                    InterceptionFilter(iopub_socket, "execute_request", silence_message)
-                )
-                filter_list.remove(
-                    InterceptionFilter(iopub_socket, "execute_result", collect_result)
-                )
-                filter_list.remove(InterceptionFilter(iopub_socket, "error", handle_error))
-                filter_list.remove(
-                    InterceptionFilter(shell_socket, "execute_reply", cleanup)
-                )
                 message_context["result"] = message.content
                 message_context["done"] = True
+                completion_state["reply"] = True
+                check_completion()
                 if not surpress_messages:
                     return data
 
-            filter_list.append(
-                InterceptionFilter(iopub_socket, "execute_input", silence_message)
-            )
-            filter_list.append(
-                InterceptionFilter(iopub_socket, "execute_request", silence_message)
-            )
-            filter_list.append(
-                InterceptionFilter(iopub_socket, "execute_result", collect_result)
-            )
-            filter_list.append(InterceptionFilter(shell_socket, "execute_reply", cleanup))
-            filter_list.append(InterceptionFilter(iopub_socket, "stream", collect_stream))
-            filter_list.append(InterceptionFilter(iopub_socket, "display_data", collect_display_data))
-            filter_list.append(InterceptionFilter(iopub_socket, "error", handle_error))
+            async def track_status(server, target_stream, data):
+                message = JupyterMessage.parse(data)
+                if message.content.get("execution_state") == "idle":
+                    completion_state["idle"] = True
+                    check_completion()
+                return data
+
+            # Collectors are routed by msg_id so they only ever see the messages generated by this execution
+            server.route_message(message_id, "iopub", "execute_input", silence_message)
+            server.route_message(message_id, "iopub", "execute_request", silence_message)
+            server.route_message(message_id, "iopub", "execute_result", collect_result)
+            server.route_message(message_id, "shell", "execute_reply", cleanup)
+            server.route_message(message_id, "iopub", "stream", collect_stream)
+            server.route_message(message_id, "iopub", "display_data", collect_display_data)
+            server.route_message(message_id, "iopub", "error", handle_error)
+            server.route_message(message_id, "iopub", "status", track_status)
 
             if response_handler:
-                filter_list.append(
-                    InterceptionFilter(iopub_socket, "stream", response_handler)
-                )
+                server.route_message(message_id, "iopub", "stream", response_handler)
+
+            stream.send_multipart(execute_request_multipart)
 
-            await asyncio.sleep(0.1)
-            while not message_context["done"]:
-                await asyncio.sleep(0.2)
-            # Wait for any straggling messages
-            await asyncio.sleep(0.2)
-            self.beaker_kernel.internal_executions.remove(message_id)
+            try:
+                await completion
+            finally:
+                server.clear_message_routes(message_id)
+                self.beaker_kernel.internal_executions.discard(message_id)
             self.beaker_kernel.debug("execution_end", message_context, parent_header=parent_header)
             return message_context
         task = ExecutionTask(coro=execution_coro(), execute_request_msg=execute_request_msg)
         return task
 
-    async def evaluate(self, expression, parent_header={}):
-        result = await self.execute(expression, parent_header=parent_header)
+    async def evaluate(self, expression, parent_header={}, changes_state=True):
+        result = await self.execute(expression, parent_header=parent_header, changes_state=changes_state)
         try:
             parsed_result = self.subkernel.parse_subkernel_return(result)
             result["return"] = parsed_result
@@ -0,0 +1,96 @@
+"""
+Non-blocking calls to the Jupyter server's REST API for starting, interrupting and shutting down subkernels.
+
+Requests are made with a tornado HTTP client that is configured once and shared per event loop. The curl based client
+is used when pycurl is installed (`pip install beaker-kernel[curl]`), as it keeps connections to the server alive between
+requests instead of reconnecting each time.
+"""
+import importlib.util
+import json
+import logging
+import urllib.parse
+from typing import Optional
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPResponse
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+CURL_AVAILABLE = importlib.util.find_spec("pycurl") is not None
+# Number of concurrent requests (and, with curl, connections kept alive) to the Jupyter server per event loop
+MAX_CONNECTIONS = 10
+
+if CURL_AVAILABLE:
+    from tornado.curl_httpclient import CurlAsyncHTTPClient as BaseHTTPClient
+else:
+    from tornado.simple_httpclient import SimpleAsyncHTTPClient as BaseHTTPClient
+
+
+class JupyterAPIHTTPClient(BaseHTTPClient):
+    """
+    Client for requests to the Jupyter server, shared by all requests on an event loop. It is configured separately
+    from `AsyncHTTPClient`, so that its settings don't change the client used by the rest of the process.
+    """
+
+    @classmethod
+    def configurable_base(cls):
+        return JupyterAPIHTTPClient
+
+    @classmethod
+    def configurable_default(cls):
+        return JupyterAPIHTTPClient
+
+
+JupyterAPIHTTPClient.configure(None, max_clients=MAX_CONNECTIONS)
+
+
+def http_client() -> AsyncHTTPClient:
+    return JupyterAPIHTTPClient()
+
+
+async def jupyter_api_request(
+    server_url: str, method: str, path: str, body: Optional[dict] = None, timeout: Optional[float] = None
+) -> HTTPResponse:
+    """
+    Makes a request to the Jupyter server's REST API, raising `tornado.httpclient.HTTPClientError` for error
+    responses.
+    """
+    url = urllib.parse.urljoin(server_url, path)
+    headers = {"Authorization": f"token {config.jupyter_token}"}
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+    request_options = {}
+    if timeout is not None:
+        request_options["request_timeout"] = timeout
+    return await http_client().fetch(
+        url,
+        method=method,
+        headers=headers,
+        body=json.dumps(body) if body is not None else None,
+        **request_options,
+    )
+
+
+async def start_kernel(server_url: str, kernel_name: str) -> str:
+    """
+    Starts a new kernel on the server, returning its id.
+    """
+    response = await jupyter_api_request(server_url, "POST", "/api/kernels", {"name": kernel_name, "path": ""})
+    return json.loads(response.body)["id"]
+
+
+async def interrupt_kernel(server_url: str, kernel_id: str, timeout: Optional[float] = None):
+    await jupyter_api_request(server_url, "POST", f"/api/kernels/{kernel_id}/interrupt", {}, timeout=timeout)
+
+
+async def shutdown_kernel(server_url: str, kernel_id: str, timeout: Optional[float] = None) -> bool:
+    """
+    Shuts down a kernel on the server, returning whether the server confirmed it.
+    """
+    try:
+        response = await jupyter_api_request(server_url, "DELETE", f"/api/kernels/{kernel_id}", timeout=timeout)
+    except HTTPClientError as err:
+        logger.debug(f"Unable to shut down kernel {kernel_id}: {err}")
+        return False
+    return response.code == 204
@@ -61,6 +61,47 @@ JupyterMessageTuple = namedtuple(
 )
 
 
+# Pre-keyed HMACs, copied for each message so that the key doesn't have to be processed again every time.
+_SIGNERS: dict[bytes, hmac.HMAC] = {}
+
+
+def message_signer(key):
+    """
+    Returns a new HMAC for signing messages with `key`.
+    """
+    key = six.ensure_binary(key)
+    template = _SIGNERS.get(key)
+    if template is None:
+        template = _SIGNERS[key] = hmac.HMAC(key, digestmod=hashlib.sha256)
+    return template.copy()
+
+
+def frame_buffer(frame):
+    """
+    Returns the contents of a frame for hashing or comparing, without copying the buffer of a `zmq.Frame`.
+    """
+    if isinstance(frame, zmq.Frame):
+        return frame.buffer
+    return six.ensure_binary(frame)
+
+
+def materialize_frames(frames):
+    """
+    Converts the frames of a message received with `copy=False` to bytes, except for its binary buffers. These are
+    kept as `zmq.Frame`s so that large payloads (e.g. images) are forwarded without being copied.
+    """
+    parts = []
+    for index, frame in enumerate(frames):
+        data = frame.bytes if isinstance(frame, zmq.Frame) else frame
+        parts.append(data)
+        if data == JupyterMessage.DELIMITER:
+            end = index + 6
+            parts.extend(f.bytes if isinstance(f, zmq.Frame) else f for f in frames[index + 1:end])
+            parts.extend(frames[end:])
+            break
+    return parts
+
+
 class JupyterMessage(JupyterMessageTuple):
     # As defined here:
     # https://jupyter-client.readthedocs.io/en/stable/messaging.html#the-wire-protocol
@@ -68,6 +109,11 @@ class JupyterMessage(JupyterMessageTuple):
 
     @classmethod
     def parse(cls, parts, verify_using=None):
+        # Frames that have already been decoded once carry their parsed form, so reuse it instead of decoding the
+        # JSON fields again. Identities are copied so that callers appending to them do not affect other parsers.
+        decoded = getattr(parts, "decoded", None)
+        if decoded is not None and not verify_using:
+            return decoded._replace(identities=list(decoded.identities))
         i = parts.index(cls.DELIMITER)
         if i < 0:
             raise ValueError
@@ -78,7 +124,50 @@ class JupyterMessage(JupyterMessageTuple):
         raw_msg = cls._make([identities, signature] + payloads + [buffers])
         if verify_using and not raw_msg.has_valid_signature(verify_using):
             raise ValueError("Signature verification failed")
-        return raw_msg.parsed
+        parsed = raw_msg.parsed
+        if isinstance(parts, JupyterMessageFrames):
+            parts.decoded = parsed
+        return parsed
+
+    @classmethod
+    def parse_headers(cls, parts):
+        """
+        Returns the header and parent header of message frames, decoding only those two fields.
+        """
+        decoded = getattr(parts, "decoded", None)
+        if decoded is not None:
+            return decoded.header, decoded.parent_header
+        i = parts.index(cls.DELIMITER)
+        return json.loads(parts[i + 2]), json.loads(parts[i + 3])
+
+    @classmethod
+    def frames_signature(cls, parts, key):
+        i = parts.index(cls.DELIMITER)
+        h = message_signer(key)
+        for f in parts[i + 2 :]:
+            h.update(frame_buffer(f))
+        return six.ensure_binary(h.hexdigest())
+
+    @classmethod
+    def verify_frames(cls, parts, key):
+        """
+        Checks the signature of message frames without decoding any of the JSON fields.
+        """
+        i = parts.index(cls.DELIMITER)
+        return hmac.compare_digest(six.ensure_binary(parts[i + 1]), cls.frames_signature(parts, key))
+
+    @classmethod
+    def sign_frames(cls, parts, key):
+        """
+        Replaces the signature of already serialized message frames without decoding or re-encoding any of the
+        JSON fields.
+        """
+        i = parts.index(cls.DELIMITER)
+        signature = cls.frames_signature(parts, key)
+        decoded = getattr(parts, "decoded", None)
+        if decoded is not None:
+            decoded = decoded._replace(signature=signature)
+        return JupyterMessageFrames(list(parts[: i + 1]) + [signature] + list(parts[i + 2 :]), decoded=decoded)
 
     @property
     def _json_fields_slice(self):
@@ -116,18 +205,28 @@ class JupyterMessage(JupyterMessageTuple):
 
     @property
     def parts(self):
-        return (
+        frames = (
             self.identities
             + [self.DELIMITER, self.signature]
             + list(self.serialized.json_fields)
             + self.buffers
         )
+        # Keep the decoded form alongside the frames if it is fully available so the next filter doesn't decode again.
+        if any(isinstance(f, six.binary_type) for f in self.json_fields):
+            decoded = None
+        else:
+            decoded = self
+        return JupyterMessageFrames(frames, decoded=decoded)
+
+    @staticmethod
+    def _signature_of(json_fields, buffers, key):
+        h = message_signer(key)
+        for f in list(json_fields) + buffers:
+            h.update(frame_buffer(f))
+        return six.ensure_binary(h.hexdigest())
 
     def _compute_signature(self, key):
-        h = hmac.HMAC(six.ensure_binary(key), digestmod=hashlib.sha256)
-        for f in list(self.serialized.json_fields) + self.buffers:
-            h.update(six.ensure_binary(f))
-        return six.ensure_binary(h.hexdigest())
+        return self._signature_of(self.serialized.json_fields, self.buffers, key)
 
     def has_valid_signature(self, key):
         return self.signature == self._compute_signature(key)
@@ -135,6 +234,35 @@ class JupyterMessage(JupyterMessageTuple):
     def sign_using(self, key):
         return self._replace(signature=self._compute_signature(key))
 
+    def signed_parts(self, key):
+        """
+        Same as `sign_using(key).parts`, but serializes the JSON fields only once, for both signing and the frames.
+        """
+        json_fields = list(self.serialized.json_fields)
+        signature = self._signature_of(json_fields, self.buffers, key)
+        frames = self.identities + [self.DELIMITER, signature] + json_fields + self.buffers
+        if any(isinstance(f, six.binary_type) for f in self.json_fields):
+            decoded = None
+        else:
+            decoded = self._replace(signature=signature)
+        return JupyterMessageFrames(frames, decoded=decoded)
+
+
+class JupyterMessageFrames(list):
+    """
+    The raw multipart frames of a message, along with a cached copy of the decoded message.
+
+    Messages are wrapped in this class as they enter the proxy so that every interception filter in the chain which
+    calls `JupyterMessage.parse()` shares a single decoding of the JSON fields. The frames themselves remain the source
+    of truth for what is sent on the wire: filters that wish to change a message must return new frames (e.g. via
+    `JupyterMessage.parts`) rather than mutating the decoded message in place.
+    """
+    decoded: "JupyterMessage | None"
+
+    def __init__(self, parts=(), decoded=None):
+        super().__init__(parts)
+        self.decoded = decoded
+
 
 class AbstractProxyKernel(object):
     def __init__(self, config, role, zmq_context=zmq.Context.instance(), session_id=None):
@@ -174,9 +302,9 @@ class AbstractProxyKernel(object):
     def sign(self, message, key=None):
         if key is None:
             key = self.config.get("key")
-        h = hmac.HMAC(six.ensure_binary(key), digestmod=hashlib.sha256)
+        h = message_signer(key)
         for m in message:
-            h.update(m)
+            h.update(frame_buffer(m))
         return six.ensure_binary(h.hexdigest())
 
     def make_multipart_message(
@@ -202,7 +330,7 @@ class AbstractProxyKernel(object):
             "version": "5.0",
         }
         msg = JupyterMessage(identities, None, header, parent_header, metadata, content, [])
-        return msg.sign_using(self.config.get("key")).parts
+        return msg.signed_parts(self.config.get("key"))
 
 
 class ProxyKernelClient(AbstractProxyKernel):
@@ -215,11 +343,153 @@ InterceptionFilter = namedtuple(
 )
 
 
+class InterceptionFilterIndex(object):
+    """
+    Collection of interception filters indexed by (stream_type, msg_type).
+
+    Looking up the filters for a message, adding a filter and removing a filter are all O(1). Filters that share a key
+    are returned in the order they were registered. Supports the subset of the list interface (`append`, `remove`,
+    `in`, iteration) that was used when filters were stored in a flat list.
+    """
+
+    def __init__(self):
+        # Dicts are used as insertion-ordered sets for each key
+        self._index = {}
+
+    def append(self, interception_filter):
+        key = (interception_filter.stream_type, interception_filter.msg_type)
+        self._index.setdefault(key, {})[interception_filter] = None
+
+    def remove(self, interception_filter):
+        key = (interception_filter.stream_type, interception_filter.msg_type)
+        bucket = self._index.get(key)
+        if bucket is None or interception_filter not in bucket:
+            raise ValueError("Interception filter is not registered")
+        del bucket[interception_filter]
+        if not bucket:
+            del self._index[key]
+
+    def discard(self, interception_filter):
+        if interception_filter in self:
+            self.remove(interception_filter)
+
+    def match(self, stream_type, msg_type):
+        bucket = self._index.get((stream_type, msg_type))
+        # Return a copy so that filters can be added or removed while the matches are being dispatched
+        return list(bucket) if bucket else []
+
+    def __contains__(self, interception_filter):
+        key = (interception_filter.stream_type, interception_filter.msg_type)
+        return interception_filter in self._index.get(key, ())
+
+    def __iter__(self):
+        for bucket in list(self._index.values()):
+            yield from list(bucket)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._index.values())
+
+
+class CoalescingStream(object):
+    """
+    Wraps the server's iopub stream, merging consecutive `stream` messages with the same parent and stream name into a
+    single message.
+
+    A chatty subkernel can otherwise produce one iopub message per line printed, each of which is signed and forwarded
+    to the front-end separately. Merged text is held for at most `window_ms` or until it reaches `max_bytes`. Any other
+    message sent on the stream first sends the held text, so the order of messages is preserved. A window of 0
+    disables merging. All other attributes are those of the wrapped stream.
+    """
+
+    def __init__(self, stream, key, window_ms=0, max_bytes=65536):
+        self.stream = stream
+        self.key = key
+        self.window_ms = window_ms
+        self.max_bytes = max_bytes
+        self._pending = None
+        self._pending_parts = None
+        self._pending_texts = []
+        self._pending_bytes = 0
+        self._timeout = None
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def configure(self, window_ms, max_bytes):
+        self.flush_pending()
+        self.window_ms = window_ms
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _merge_key(msg):
+        return (tuple(msg.identities), msg.parent_header.get("msg_id"), msg.content.get("name"))
+
+    def _parse_stream_message(self, msg_parts):
+        """
+        Returns the parsed message if it is a `stream` message that can be merged, without decoding other messages.
+        """
+        try:
+            i = msg_parts.index(JupyterMessage.DELIMITER)
+        except ValueError:
+            return None, 0
+        if len(msg_parts) != i + 6:
+            # Has buffers
+            return None, 0
+        decoded = getattr(msg_parts, "decoded", None)
+        if decoded is None and b'"stream"' not in six.ensure_binary(msg_parts[i + 2]):
+            return None, 0
+        msg = JupyterMessage.parse(msg_parts)
+        if msg.header.get("msg_type") != "stream" or not isinstance(msg.content.get("text"), str):
+            return None, 0
+        return msg, len(msg_parts[i + 5])
+
+    def send_multipart(self, msg_parts, *args, **kwargs):
+        if self.window_ms > 0 and not args and not kwargs:
+            msg, size = self._parse_stream_message(msg_parts)
+            if msg is not None:
+                if self._pending is None or self._merge_key(msg) != self._merge_key(self._pending):
+                    self.flush_pending()
+                    self._pending = msg
+                    self._pending_parts = msg_parts
+                    self._timeout = ioloop.IOLoop.current().call_later(self.window_ms / 1000, self.flush_pending)
+                self._pending_texts.append(msg.content["text"])
+                self._pending_bytes += size
+                if self._pending_bytes >= self.max_bytes:
+                    self.flush_pending()
+                return
+        self.flush_pending()
+        return self.stream.send_multipart(msg_parts, *args, **kwargs)
+
+    def flush_pending(self):
+        if self._pending is None:
+            return
+        if self._timeout is not None:
+            ioloop.IOLoop.current().remove_timeout(self._timeout)
+        if len(self._pending_texts) == 1:
+            # Nothing was merged, so the original frames can be sent as they are
+            msg_parts = self._pending_parts
+        else:
+            merged = self._pending._replace(
+                content={**self._pending.content, "text": "".join(self._pending_texts)}
+            )
+            msg_parts = merged.signed_parts(self.key)
+        self._pending = None
+        self._pending_parts = None
+        self._pending_texts = []
+        self._pending_bytes = 0
+        self._timeout = None
+        self.stream.send_multipart(msg_parts)
+        self.stream.flush()
+
+
 class ProxyKernelServer(AbstractProxyKernel):
     def __init__(self, config, role="server", zmq_context=zmq.Context.instance(), session_id=None):
         self.manager = None
         super(ProxyKernelServer, self).__init__(config, role, zmq_context, session_id=session_id)
-        self.filters = []
+        self.filters = InterceptionFilterIndex()
+        self.streams = self.streams._replace(iopub=CoalescingStream(self.streams.iopub, self.config.get("key")))
+        # Filters that only apply to messages whose parent has a specific msg_id, keyed by that msg_id
+        self.message_routes = {}
         self.session_id = session_id
         self.proxy_target = None
 
@@ -237,27 +507,39 @@ class ProxyKernelServer(AbstractProxyKernel):
         else:
             validate_using = validate_using or self.config.get("key")
             resign_using = resign_using or self.proxy_target.config.get("key")
+        shared_key = bool(validate_using and resign_using) and (
+            six.ensure_binary(validate_using) == six.ensure_binary(resign_using)
+        )
 
         async def handler(data):
+            send_options = {}
             if socktype.signed:
-                msg = JupyterMessage.parse(data, validate_using)
-                if is_reply and msg.header.get("msg_type", "").endswith("_reply"):
-                    if not isinstance(msg.identities, list):
-                        msg.identities = []
-                    if self.session_id and self.session_id not in msg.identities:
-                        msg.identities.append(msg.parent_header.get("session"))
-                for stream_type, msg_type, callback in self.filters:
-                    if stream_type == socktype and msg_type == msg.header.get(
-                        "msg_type"
-                    ):
-                        new_data = await callback(self, other_stream, data)
-                        if new_data is None:
-                            return
-                        else:
-                            data = new_data
-                if resign_using:
-                    data = JupyterMessage.parse(data).sign_using(resign_using).parts
-            other_stream.send_multipart(data)
+                data = received = JupyterMessageFrames(materialize_frames(data))
+                if validate_using and not JupyterMessage.verify_frames(data, validate_using):
+                    raise ValueError("Signature verification failed")
+                # Only the headers are needed to find the filters. Filters decode the rest of the message if they
+                # need it, so messages without any matching filters are forwarded without decoding their content.
+                header, parent_header = JupyterMessage.parse_headers(data)
+                msg_type = header.get("msg_type")
+                matching_filters = self.filters.match(socktype, msg_type)
+                if self.message_routes:
+                    routes = self.message_routes.get(parent_header.get("msg_id"))
+                    if routes:
+                        matching_filters.extend(routes.match(socktype, msg_type))
+                for _, _, callback in matching_filters:
+                    new_data = await callback(self, other_stream, data)
+                    if new_data is None:
+                        return
+                    else:
+                        data = new_data
+                # Unmodified messages already carry a valid signature if both sides share a key, so they were only
+                # hashed once, to verify them.
+                if resign_using and (data is not received or not shared_key):
+                    data = JupyterMessage.sign_frames(data, resign_using)
+                if len(data) > data.index(JupyterMessage.DELIMITER) + 6:
+                    # Forward binary buffers without copying them
+                    send_options["copy"] = False
+            other_stream.send_multipart(data, **send_options)
             other_stream.flush()
         return handler
 
@@ -270,14 +552,14 @@ class ProxyKernelServer(AbstractProxyKernel):
         for i, socktype in enumerate(KERNEL_SOCKETS):
             if socktype.server_type != zmq.PUB:
                 self.streams[i].on_recv(
-                    self._proxy_to(proxy_client.streams[i], socktype=socktype)
+                    self._proxy_to(proxy_client.streams[i], socktype=socktype), copy=False
                 )
             if socktype.client_type != zmq.PUB:
                 proxy_client.streams[i].on_recv(
-                    self._proxy_to(self.streams[i], socktype=socktype)
+                    self._proxy_to(self.streams[i], socktype=socktype), copy=False
                 )
 
-    def intercept_message(self, stream_type=None, msg_type=None, callback=None):
+    def _make_filter(self, stream_type=None, msg_type=None, callback=None):
         if stream_type in KERNEL_SOCKETS_NAMES:
             stream_type = KERNEL_SOCKETS[KERNEL_SOCKETS_NAMES.index(stream_type)]
         if stream_type not in KERNEL_SOCKETS:
@@ -286,7 +568,21 @@ class ProxyKernelServer(AbstractProxyKernel):
             )
         if not callable(callback):
             raise ValueError("callback must be callable")
-        self.filters.append(InterceptionFilter(stream_type, msg_type, callback))
+        return InterceptionFilter(stream_type, msg_type, callback)
+
+    def intercept_message(self, stream_type=None, msg_type=None, callback=None):
+        self.filters.append(self._make_filter(stream_type, msg_type, callback))
+
+    def route_message(self, parent_msg_id, stream_type=None, msg_type=None, callback=None):
+        """
+        Registers a filter which is only applied to messages whose parent header has the msg_id `parent_msg_id`.
+        Routed filters run after any global filters registered for the same message type.
+        """
+        routes = self.message_routes.setdefault(parent_msg_id, InterceptionFilterIndex())
+        routes.append(self._make_filter(stream_type, msg_type, callback))
+
+    def clear_message_routes(self, parent_msg_id):
+        self.message_routes.pop(parent_msg_id, None)
 
 
 class KernelProxyManager(object):
@@ -0,0 +1,134 @@
+"""
+Limits on how much output an execution can send to the front-end.
+
+Each execution (identified by the msg_id of its request) gets an `OutputBudget` of total bytes and bytes per second.
+Output beyond the budget is appended to a per-session spill file instead of being sent, so that runaway prints can't
+exhaust the memory of the Beaker kernel or the browser. The spilled output of an execution can be read back in pages
+with `OutputSpill.read()`.
+"""
+import collections
+import os
+import time
+from typing import Optional
+
+# Spilled output is discarded beyond this size, so a runaway loop can't fill the disk
+SPILL_FILE_MAX_BYTES = 1024 ** 3
+# Number of executions whose budgets and spilled ranges are remembered
+MAX_TRACKED_EXECUTIONS = 256
+
+
+class OutputBudget:
+    """
+    Total and per-second byte allowance for the output of a single execution. Once exceeded, the budget stays
+    exhausted so that the output isn't sent with gaps in it.
+    """
+
+    def __init__(self, max_bytes: int, bytes_per_second: int):
+        self.max_bytes = max_bytes
+        self.bytes_per_second = bytes_per_second
+        self.used = 0
+        self.exhausted = False
+        # Token bucket allowing up to a second's worth of output in a burst
+        self._tokens = float(bytes_per_second)
+        self._updated = time.monotonic()
+
+    def admit(self, size: int) -> bool:
+        """
+        Returns whether output of `size` bytes may be sent, consuming the allowance if so.
+        """
+        if self.exhausted:
+            return False
+        if self.bytes_per_second:
+            now = time.monotonic()
+            self._tokens = min(self.bytes_per_second, self._tokens + (now - self._updated) * self.bytes_per_second)
+            self._updated = now
+            # A single message larger than the bucket (e.g. a big plot) is let through if nothing else was sent in the
+            # last second, leaving the bucket in debt for the output that follows it.
+            if size > self._tokens and self._tokens < self.bytes_per_second:
+                self.exhausted = True
+                return False
+            self._tokens -= size
+        if self.max_bytes and self.used + size > self.max_bytes:
+            self.exhausted = True
+            return False
+        self.used += size
+        return True
+
+
+class OutputSpill:
+    """
+    Spill file for the output of a session, along with the byte ranges of the file belonging to each execution.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0, bytes_per_second: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bytes_per_second = bytes_per_second
+        self.size = 0
+        self.budgets: collections.OrderedDict[str, OutputBudget] = collections.OrderedDict()
+        self.ranges: collections.OrderedDict[str, list[tuple[int, int]]] = collections.OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_bytes or self.bytes_per_second)
+
+    def budget(self, msg_id: str) -> OutputBudget:
+        budget = self.budgets.get(msg_id)
+        if budget is None:
+            budget = self.budgets[msg_id] = OutputBudget(self.max_bytes, self.bytes_per_second)
+            while len(self.budgets) > MAX_TRACKED_EXECUTIONS:
+                self.budgets.popitem(last=False)
+        return budget
+
+    def spill(self, msg_id: str, text: str) -> int:
+        """
+        Appends the output to the spill file, returning the number of bytes written.
+        """
+        data = text.encode()
+        if self.size + len(data) > SPILL_FILE_MAX_BYTES:
+            return 0
+        if self.size == 0:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as spill_file:
+            spill_file.write(data)
+        ranges = self.ranges.get(msg_id)
+        if ranges is None:
+            ranges = self.ranges[msg_id] = []
+            while len(self.ranges) > MAX_TRACKED_EXECUTIONS:
+                self.ranges.popitem(last=False)
+        ranges.append((self.size, len(data)))
+        self.size += len(data)
+        return len(data)
+
+    def spilled_bytes(self, msg_id: str) -> int:
+        return sum(length for _, length in self.ranges.get(msg_id, ()))
+
+    def read(self, msg_id: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        """
+        Reads `length` bytes (or all) of the output spilled by an execution, starting at `offset` within that output.
+        """
+        if msg_id not in self.ranges:
+            return b""
+        chunks = []
+        remaining = length
+        with open(self.path, "rb") as spill_file:
+            for start, size in self.ranges.get(msg_id, ()):
+                if offset >= size:
+                    offset -= size
+                    continue
+                read_size = size - offset if remaining is None else min(size - offset, remaining)
+                spill_file.seek(start + offset)
+                chunks.append(spill_file.read(read_size))
+                offset = 0
+                if remaining is not None:
+                    remaining -= read_size
+                    if remaining <= 0:
+                        break
+        return b"".join(chunks)
+
+    def cleanup(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.size = 0
+        self.budgets.clear()
+        self.ranges.clear()
@@ -1,8 +1,8 @@
 import abc
 import asyncio
+import collections
 import json
-from typing import Any, Callable, TYPE_CHECKING
-import hashlib
+from typing import Any, Callable, Optional, TYPE_CHECKING
 import shutil
 from tempfile import mkdtemp
 import os
@@ -12,13 +12,17 @@ import requests
 from archytas.tool_utils import AgentRef, tool, LoopControllerRef, ReactContextRef
 
 from .autodiscovery import autodiscover
+from .checkpoint_store import (
+    BlobStore, COMPRESSION_SUFFIXES, compress_file, hash_file, resolve_compression, storage_usage
+)
 from .utils import env_enabled, action, ExecutionTask, slugify
+from .jupyter_api import shutdown_kernel
 from .jupyter_kernel_proxy import ProxyKernelClient
 from .config import config
 from .context import BeakerContext, WorkflowStageProgress
-from .code_analysis.analysis_types import AnalysisCodeCells
 
 if TYPE_CHECKING:
+    from .code_analysis.analysis_types import AnalysisCodeCells
     from langchain_core.messages import ToolMessage, AIMessage, BaseMessage, ToolCall
     from archytas.models.base import BaseArchytasModel
     from archytas.agent import Agent
@@ -29,6 +33,10 @@ if TYPE_CHECKING:
         from typing import Any as TreeSitterLanguage
 
 Checkpoint = dict[str, str]
+# Variables stored by a subkernel for a new checkpoint, either as the path to a serialization file or as a dict with
+# the "sha256" hash of the serialization, its "format" (file extension) and, unless the file from the previous
+# checkpoint is to be reused, its "path".
+FetchedCheckpoint = dict[str, str | dict[str, str]]
 
 
 class JsonStateEncoder(json.JSONEncoder):
@@ -333,13 +341,7 @@ async def run_code(code: str, agent: AgentRef, loop: LoopControllerRef, react_co
             logger.error(f"Successfully ran code, but failed to fetch preview: {e}")
 
         try:
-            kernel_state_payload = await agent.context.kernel_state()
-            agent.context.send_response(
-                "iopub",
-                "kernel_state_info",
-                kernel_state_payload,
-                parent_header=message.header,
-            )
+            await agent.context.beaker_kernel.send_kernel_state_info(parent_header=message.header)
         except Exception as e:
             logger.error(f"Successfully ran code, but failed to fetch kernel state: {e}")
 
@@ -370,6 +372,9 @@ class BeakerSubkernel(abc.ABC):
     ]
 
     FETCH_STATE_CODE: str = ""
+    # Code returning the changes to the state since the fetch whose version is substituted for `{version}`.
+    # Subkernels that leave this empty always have their full state fetched.
+    FETCH_STATE_DELTA_CODE: str = ""
 
     @classmethod
     @abc.abstractmethod
@@ -384,17 +389,37 @@ class BeakerSubkernel(abc.ABC):
         self.jupyter_id = jupyter_id
         self.connected_kernel = ProxyKernelClient(subkernel_configuration, session_id=context.beaker_kernel.session_id)
         self.context = context
-
+        self.shutdown_task: Optional[asyncio.Task] = None
 
     def get_treesitter_language(self) -> "TreeSitterLanguage":
         raise NotImplementedError()
 
-    async def lint_code(self, cells: AnalysisCodeCells):
+    async def lint_code(self, cells: "AnalysisCodeCells"):
         pass
 
 
+    async def shutdown(self):
+        jupyter_id = self.jupyter_id
+        print(f"Shutting down connected subkernel {jupyter_id}")
+        try:
+            if await shutdown_kernel(self.context.beaker_kernel.jupyter_server, jupyter_id, timeout=0.5):
+                self.jupyter_id = None
+        except OSError as err:
+            message = f"Error while shutting down subkernel: {err}\n  Subkernel or server may have already been shut down."
+            logger.error(message, exc_info=err)
+
     def cleanup(self):
-        if self.jupyter_id is not None:
+        if self.jupyter_id is None or (self.shutdown_task is not None and not self.shutdown_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            # Shut down without blocking message proxying. The task is kept so callers can wait for it if needed.
+            self.shutdown_task = loop.create_task(self.shutdown())
+        else:
+            # Called outside of the event loop, e.g. when exiting
             try:
                 print(f"Shutting down connected subkernel {self.jupyter_id}")
                 res = requests.delete(
@@ -421,55 +446,251 @@ def is_checkpointing_enabled():
 
 class CheckpointableBeakerSubkernel(BeakerSubkernel):
     SERIALIZATION_EXTENSION: str = "storage"
+    # Serialization formats that are never compressed, e.g. because they are memory mapped when restored.
+    UNCOMPRESSED_FORMATS: tuple[str, ...] = ()
 
     def __init__(self, jupyter_id: str, subkernel_configuration: dict, context):
         super().__init__(jupyter_id, subkernel_configuration, context)
         self.checkpoints_enabled = is_checkpointing_enabled()
         self.storage_prefix = os.path.join(config.checkpoint_storage_path, self.jupyter_id)
-        self.checkpoints : list[Checkpoint] = []
+        # Evicted checkpoints are replaced with None so that the indexes of the remaining checkpoints don't change
+        self.checkpoints : list[Optional[Checkpoint]] = []
+        # Number of checkpoints referencing each stored file, and the size of each stored file
+        self.storage_refcounts: collections.Counter[str] = collections.Counter()
+        self.storage_sizes: dict[str, int] = {}
+        self.compression = None
+        # Completes the checkpoint being written in the background, if any
+        self.pending_checkpoint: Optional[asyncio.Task] = None
+        # Stored files are hard links to blobs shared with the user's other sessions on the server
+        self.blob_store = BlobStore(config.checkpoint_blob_path)
         if self.checkpoints_enabled:
             os.makedirs(self.storage_prefix, exist_ok=True, mode=0o777)
-            os.chmod(self.storage_prefix, 0o777)
-
-    def store_serialization(self, filename: str) -> str:
-        with open(filename, "rb") as file:
-            chunksize = 4 * 1024 * 1024
-            hash = hashlib.new("sha256")
-            while chunk := file.read(chunksize):
-                hash.update(chunk)
-            identifier = hash.hexdigest()
-            new_filename = f"{self.storage_prefix}/{identifier}.{self.SERIALIZATION_EXTENSION}"
-
-        shutil.move(filename, new_filename)
+            if os.stat(self.storage_prefix).st_mode & 0o777 != 0o777:
+                os.chmod(self.storage_prefix, 0o777)
+            self.blob_store.create()
+            self.compression = resolve_compression(getattr(config, "checkpoint_compression", None))
+
+    def serialization_path(self, identifier: str, extension: Optional[str] = None) -> str:
+        return f"{self.storage_prefix}/{identifier}.{extension or self.SERIALIZATION_EXTENSION}"
+
+    def compression_for(self, extension: Optional[str] = None) -> Optional[str]:
+        if (extension or self.SERIALIZATION_EXTENSION) in self.UNCOMPRESSED_FORMATS:
+            return None
+        return self.compression
+
+    def stored_path(self, identifier: str, extension: Optional[str] = None) -> str:
+        """
+        Returns the path a serialization with the given hash and format is stored at, including any compression suffix.
+        """
+        extension = extension or self.SERIALIZATION_EXTENSION
+        compression = self.compression_for(extension)
+        if compression:
+            extension = f"{extension}.{COMPRESSION_SUFFIXES[compression]}"
+        return self.serialization_path(identifier, extension)
+
+    def store_serialization(
+        self, filename: str, identifier: Optional[str] = None, extension: Optional[str] = None
+    ) -> str:
+        if identifier is None:
+            identifier = hash_file(filename)
+        compression = self.compression_for(extension)
+        new_filename = self.stored_path(identifier, extension)
+        blob_name = os.path.basename(new_filename)
+
+        # Files are content-addressed, so if an identical file is already stored by this or any other session, it is
+        # reused as is.
+        if os.path.exists(new_filename) or self.blob_store.link(blob_name, new_filename):
+            os.remove(filename)
+            return new_filename
+
+        if compression:
+            partial_filename = f"{new_filename}.partial"
+            try:
+                compress_file(filename, partial_filename, compression)
+            except Exception:
+                if os.path.exists(partial_filename):
+                    os.remove(partial_filename)
+                raise
+            os.remove(filename)
+            filename = partial_filename
+        if not self.blob_store.publish(filename, blob_name, new_filename):
+            shutil.move(filename, new_filename)
         return new_filename
 
+    @property
+    def latest_checkpoint(self) -> Optional[Checkpoint]:
+        return next((checkpoint for checkpoint in reversed(self.checkpoints) if checkpoint is not None), None)
+
+    def previous_serializations(self) -> dict[str, str]:
+        """
+        Returns the serialization hash of each variable in the most recent checkpoint, which subkernels can pass on to
+        avoid re-serializing variables that haven't changed since. Empty if incremental checkpoints are disabled.
+        """
+        if self.latest_checkpoint is None or not getattr(config, "incremental_checkpoints", True):
+            return {}
+        return {
+            varname: os.path.basename(filename).partition(".")[0]
+            for varname, filename in self.latest_checkpoint.items()
+        }
+
     @abc.abstractmethod
-    async def generate_checkpoint_from_state(self) -> Checkpoint:
+    async def generate_checkpoint_from_state(self) -> FetchedCheckpoint:
         ...
 
     @abc.abstractmethod
     async def load_checkpoint(self, checkpoint: Checkpoint):
         ...
 
+    async def start_background_checkpoint(self) -> Any:
+        """
+        Captures a snapshot of the current state which is then serialized in the background, returning a job to pass
+        to `complete_background_checkpoint()`. Returns None if the subkernel can't checkpoint in the background.
+        """
+        return None
+
+    async def complete_background_checkpoint(self, job: Any) -> FetchedCheckpoint:
+        """
+        Waits for the background checkpoint `job` to be serialized and returns it.
+        """
+        raise NotImplementedError()
+
+    async def wait_for_pending_checkpoint(self):
+        if self.pending_checkpoint is not None and not self.pending_checkpoint.done():
+            await asyncio.shield(self.pending_checkpoint)
+
     async def add_checkpoint(self) :
         if not self.checkpoints_enabled:
             raise RuntimeError("Checkpoints are not enabled")
+        await self.wait_for_pending_checkpoint()
         fetched_checkpoint = await self.generate_checkpoint_from_state()
-        checkpoint = {
-            varname: self.store_serialization(filename) for
-            varname, filename in fetched_checkpoint.items()
-        }
+        return self._store_checkpoint(fetched_checkpoint)
+
+    async def _complete_pending_checkpoint(self, job: Any):
+        try:
+            fetched_checkpoint = await self.complete_background_checkpoint(job)
+            self._store_checkpoint(fetched_checkpoint)
+        except Exception as err:
+            # The index of the checkpoint was already handed out, so a placeholder keeps later indexes valid.
+            logger.warning(f"Unable to complete background checkpoint: {err}")
+            self.checkpoints.append(None)
+
+    def _store_checkpoint(self, fetched_checkpoint: FetchedCheckpoint) -> int:
+        previous_checkpoint = self.latest_checkpoint or {}
+        checkpoint = {}
+        for varname, serialization in fetched_checkpoint.items():
+            if isinstance(serialization, str):
+                checkpoint[varname] = self.store_serialization(serialization)
+            elif serialization.get("path"):
+                checkpoint[varname] = self.store_serialization(
+                    serialization["path"], serialization["sha256"], serialization.get("format")
+                )
+            else:
+                # Unchanged since the previous checkpoint, so the file stored for it then is reused
+                checkpoint[varname] = self._stored_serialization(
+                    previous_checkpoint.get(varname), serialization["sha256"], serialization.get("format")
+                )
+        self._retain_checkpoint(checkpoint)
         self.checkpoints.append(checkpoint)
+        self.enforce_checkpoint_quota()
         return len(self.checkpoints) - 1
 
+    def _stored_serialization(self, previous: Optional[str], identifier: str, extension: Optional[str]) -> str:
+        if previous and os.path.basename(previous).partition(".")[0] == identifier:
+            return previous
+        filename = self.stored_path(identifier, extension)
+        if not os.path.exists(filename) and not self.blob_store.link(os.path.basename(filename), filename):
+            raise FileNotFoundError(f"Serialization '{identifier}' to reuse is no longer stored")
+        return filename
+
+    def _retain_checkpoint(self, checkpoint: Checkpoint):
+        for filename in checkpoint.values():
+            if filename not in self.storage_sizes:
+                try:
+                    self.storage_sizes[filename] = os.path.getsize(filename)
+                except OSError:
+                    self.storage_sizes[filename] = 0
+            self.storage_refcounts[filename] += 1
+
+    def _release_checkpoint(self, checkpoint: Optional[Checkpoint]) -> int:
+        """
+        Drops the references a checkpoint holds to its stored files, removing files that are no longer used by any
+        checkpoint. Returns the number of bytes freed on disk, which excludes files still linked by other sessions.
+        """
+        freed = 0
+        if checkpoint is None:
+            return freed
+        for filename in checkpoint.values():
+            self.storage_refcounts[filename] -= 1
+            if self.storage_refcounts[filename] <= 0:
+                del self.storage_refcounts[filename]
+                self.storage_sizes.pop(filename, None)
+                try:
+                    stat = os.stat(filename)
+                    os.remove(filename)
+                    if stat.st_nlink <= 1:
+                        # Not shared through the blob store
+                        freed += stat.st_size
+                except FileNotFoundError:
+                    pass
+                freed += self.blob_store.release(os.path.basename(filename))
+        return freed
+
+    @property
+    def storage_used(self) -> int:
+        return sum(self.storage_sizes.values())
+
+    def evict_checkpoint(self, checkpoint_index: int) -> int:
+        checkpoint = self.checkpoints[checkpoint_index]
+        self.checkpoints[checkpoint_index] = None
+        return self._release_checkpoint(checkpoint)
+
+    def _over_quota(self, global_usage: int) -> bool:
+        session_quota = getattr(config, "checkpoint_session_quota", 0)
+        if session_quota and self.storage_used > session_quota:
+            return True
+        global_quota = getattr(config, "checkpoint_global_quota", 0)
+        if global_quota and global_usage > global_quota:
+            return True
+        return False
+
+    def enforce_checkpoint_quota(self):
+        """
+        Evicts older checkpoints until the checkpoint storage is within the per-session and global quotas.
+
+        The most recent `checkpoints_keep_recent` checkpoints are always kept. Older checkpoints are thinned out by
+        evicting every other one per pass, so that some history remains available for as long as possible.
+        Only this session's checkpoints can be evicted, so the global quota may still be exceeded afterwards.
+        """
+        keep_recent = max(1, getattr(config, "checkpoints_keep_recent", 5))
+        # The shared storage is only measured once, after which the bytes freed by each eviction are subtracted.
+        global_usage = 0
+        if getattr(config, "checkpoint_global_quota", 0):
+            global_usage = storage_usage(config.checkpoint_storage_path)
+        while self._over_quota(global_usage):
+            live = [index for index, checkpoint in enumerate(self.checkpoints) if checkpoint is not None]
+            older = live[:-keep_recent]
+            if not older:
+                logger.warning(
+                    f"Checkpoint storage is over quota but only the {keep_recent} most recent checkpoints remain."
+                )
+                return
+            for index in older[1::2] or older:
+                global_usage -= self.evict_checkpoint(index)
+                if not self._over_quota(global_usage):
+                    return
 
     async def rollback(self, checkpoint_index: int):
         if not self.checkpoints_enabled:
             raise RuntimeError("Checkpoints are not enabled")
+        await self.wait_for_pending_checkpoint()
         if checkpoint_index >= len(self.checkpoints):
             raise IndexError(f"Checkpoint at index {checkpoint_index} does not exist")
         checkpoint = self.checkpoints[checkpoint_index]
+        if checkpoint is None:
+            raise IndexError(f"Checkpoint at index {checkpoint_index} was evicted or could not be stored")
         await self.load_checkpoint(checkpoint)
+        for discarded in self.checkpoints[checkpoint_index + 1:]:
+            self._release_checkpoint(discarded)
         self.checkpoints = self.checkpoints[:checkpoint_index + 1]
 
     @action(action_name="rollback", enabled=is_checkpointing_enabled)
@@ -486,13 +707,31 @@ class CheckpointableBeakerSubkernel(BeakerSubkernel):
 
     def cleanup(self):
         super().cleanup()
+        if self.pending_checkpoint is not None:
+            self.pending_checkpoint.cancel()
+            self.pending_checkpoint = None
         if self.checkpoints_enabled:
             shutil.rmtree(self.storage_prefix, ignore_errors=True)
+            self.blob_store.collect_garbage()
             self.checkpoints = []
+            self.storage_refcounts.clear()
+            self.storage_sizes.clear()
 
     async def checkpoint_and_execute(self, code: str, surpress_messages: bool = False, parent_header = None, identities = None) -> tuple[int, ExecutionTask]:
-        checkpoint_index = await self.add_checkpoint()
+        job = None
+        if self.checkpoints_enabled and getattr(config, "background_checkpoints", False):
+            await self.wait_for_pending_checkpoint()
+            job = await self.start_background_checkpoint()
+        if job is None:
+            checkpoint_index = await self.add_checkpoint()
+            task = self.context.execute(code, store_history=True, surpress_messages=surpress_messages, parent_header=parent_header, identities=identities)
+            return checkpoint_index, task
+
+        checkpoint_index = len(self.checkpoints)
         task = self.context.execute(code, store_history=True, surpress_messages=surpress_messages, parent_header=parent_header, identities=identities)
+        # Created after the execution task, so the request completing the checkpoint is queued in the subkernel behind
+        # the code and the checkpoint is stored as soon as the code has run.
+        self.pending_checkpoint = asyncio.create_task(self._complete_pending_checkpoint(job))
         return checkpoint_index, task
 
     async def execute_and_rollback(self, code: str, surpress_messages: bool = False, parent_header = None, identities=None):
@@ -0,0 +1,98 @@
+from typing import Any, Optional
+
+StateEntries = dict[str, dict[str, Any]]
+
+
+class SubkernelStateTracker:
+    """
+    Materialized copy of a subkernel's state (modules, variables, functions, classes, ...) that can be updated either
+    with a full state or with a delta of added/changed and removed entries, as returned by subkernels that support
+    incremental state fetches.
+
+    Every update that changes the state bumps `version`, and the version at which each entry last changed is recorded
+    so that the changes since an earlier version can be sent on without re-sending the whole state. Removed entries are
+    remembered until `forget_removals()` is called for a version after their removal.
+    """
+    state: StateEntries
+    version: int
+    remote_version: Any
+    changed_at: dict[tuple[str, str], int]
+    removed_at: dict[tuple[str, str], int]
+    forgotten_version: int
+
+    def __init__(self):
+        self.state = {}
+        self.version = 0
+        self.remote_version = None
+        self.changed_at = {}
+        self.removed_at = {}
+        self.forgotten_version = 0
+
+    def update(self, payload: dict):
+        """
+        Applies a state fetch result, which is either a full state or a delta in the form:
+        `{"full": bool, "version": ..., "state": {category: {name: details}}, "removed": {category: [name, ...]}}`
+        """
+        if "full" not in payload:
+            # Plain full state, as returned by subkernels that don't support incremental fetches
+            self._apply(payload or {}, removed=None, full=True)
+            return
+        self._apply(payload.get("state") or {}, removed=payload.get("removed") or {}, full=payload["full"])
+        self.remote_version = payload.get("version")
+
+    def _apply(self, entries: StateEntries, removed: Optional[dict[str, list[str]]], full: bool):
+        # Dicts are copied instead of modified in place so that previously returned states remain unchanged
+        new_state = {category: dict(items) for category, items in self.state.items()}
+        changes = []
+        if full:
+            removed = {
+                category: [name for name in items if name not in entries.get(category, {})]
+                for category, items in self.state.items()
+            }
+        for category, names in removed.items():
+            for name in names:
+                if new_state.get(category, {}).pop(name, None) is not None:
+                    changes.append((category, name, True))
+        for category, items in entries.items():
+            category_state = new_state.setdefault(category, {})
+            for name, details in items.items():
+                if category_state.get(name) != details:
+                    category_state[name] = details
+                    changes.append((category, name, False))
+        if not changes:
+            return
+        self.version += 1
+        for category, name, is_removal in changes:
+            if is_removal:
+                self.removed_at[(category, name)] = self.version
+                self.changed_at.pop((category, name), None)
+            else:
+                self.changed_at[(category, name)] = self.version
+                self.removed_at.pop((category, name), None)
+        self.state = new_state
+
+    def forget_removals(self, version: int):
+        """
+        Forgets the entries removed up to `version`, once no changes since an earlier version will be asked for.
+        """
+        self.removed_at = {
+            key: removed_version for key, removed_version in self.removed_at.items() if removed_version > version
+        }
+        self.forgotten_version = max(self.forgotten_version, version)
+
+    def changes_since(self, version: int) -> Optional[tuple[StateEntries, dict[str, list[str]]]]:
+        """
+        Returns the entries that were added or changed and the names that were removed after `version`, or None if the
+        removals since then were forgotten.
+        """
+        if version < self.forgotten_version:
+            return None
+        updated: StateEntries = {category: {} for category in self.state}
+        removed: dict[str, list[str]] = {}
+        for (category, name), changed_version in self.changed_at.items():
+            if changed_version > version:
+                updated[category][name] = self.state[category][name]
+        for (category, name), removed_version in self.removed_at.items():
+            if removed_version > version:
+                removed.setdefault(category, []).append(name)
+        return updated, removed
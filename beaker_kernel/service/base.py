@@ -1,3 +1,4 @@
+import asyncio
 import getpass
 import logging
 import os
@@ -11,11 +12,13 @@ from jupyter_server.services.kernels.kernelmanager import AsyncMappingKernelMana
 from jupyter_server.services.sessions.sessionmanager import SessionManager
 from jupyter_server.serverapp import ServerApp
 from jupyterlab_server import LabServerApp
+from tornado.ioloop import IOLoop
 
 from beaker_kernel.lib.app import BeakerApp
 from beaker_kernel.lib.config import config
 from beaker_kernel.lib.utils import import_dotted_class
 from beaker_kernel.service.handlers import register_handlers, SummaryHandler, request_log_handler, sanitize_env
+from beaker_kernel.service.zygote import KernelZygote
 
 logger = logging.getLogger("beaker_server")
 HERE = os.path.dirname(__file__)
@@ -87,6 +90,32 @@ class BeakerKernelManager(AsyncIOLoopKernelManager):
         return cmd, kw
     pre_start_kernel = _async_pre_start_kernel
 
+    async def _async_launch_kernel(self, kernel_cmd: list[str], **kw):
+        zygote = self.parent.kernel_zygote() if self.kernel_name == "beaker_kernel" else None
+        if zygote is None or not KernelZygote.can_start(kernel_cmd):
+            return await super()._async_launch_kernel(kernel_cmd, **kw)
+        try:
+            process = await zygote.spawn(
+                kernel_cmd,
+                env=kw.get("env", {}),
+                cwd=kw.get("cwd"),
+                user=kw.get("user"),
+                group=kw.get("group"),
+                extra_groups=kw.get("extra_groups"),
+                stdout=KernelZygote.output_fd(kw.get("stdout")),
+                stderr=KernelZygote.output_fd(kw.get("stderr")),
+            )
+        except Exception as err:
+            logger.warning(f"Unable to start kernel from zygote, starting it directly instead: {err}")
+            return await super()._async_launch_kernel(kernel_cmd, **kw)
+        # Fill in the provisioner as `LocalProvisioner.launch_kernel()` would have. The kernel leads its own session.
+        self.provisioner.process = process
+        self.provisioner.pid = process.pid
+        self.provisioner.pgid = process.pid
+        self.provisioner.cwd = kw.get("cwd", os.getcwd())
+        self._reconcile_connection_info(self.provisioner.connection_info)
+    _launch_kernel = _async_launch_kernel
+
     async def _async_interrupt_kernel(self):
         if self.shutting_down and self.kernel_name == "beaker_kernel":
             # During shutdown, interrupt Beaker kernel instances without interrupting the subkernel which is being
@@ -109,11 +138,105 @@ class BeakerKernelMappingManager(AsyncMappingKernelManager):
         else:
             os.chmod(self.connection_dir, 0o0755)
         super().__init__(**kwargs)
+        # Idle kernels started ahead of time so that they can be handed out without waiting for them to start, keyed
+        # by kernel name.
+        self.warm_kernels: dict[str, list[str]] = {}
+        self._filling_pools: set[str] = set()
+        self._pool_tasks: set[asyncio.Task] = set()
+        self._kernel_zygote: KernelZygote | None = None
+        # Filled as soon as the server's event loop runs, so warm kernels are ready for the first session
+        IOLoop.current().add_callback(self.fill_pools)
 
     @property
     def beaker_config(self):
         return getattr(self.parent, 'beaker_config', None)
 
+    async def _async_start_kernel(self, *, kernel_id=None, path=None, **kwargs):
+        kernel_name = kwargs.get("kernel_name") or self.default_kernel_name
+        warm_kernel_id = None
+        if kernel_id is None and self.matches_warm_kernels(path, kwargs):
+            warm_kernel_id = self.claim_warm_kernel(kernel_name)
+        self.fill_pools()
+        if warm_kernel_id is not None:
+            logger.info(f"Using warm {kernel_name} kernel {warm_kernel_id}")
+            return warm_kernel_id
+        return await super()._async_start_kernel(kernel_id=kernel_id, path=path, **kwargs)
+    start_kernel = _async_start_kernel
+
+    def kernel_zygote(self) -> KernelZygote | None:
+        """
+        Returns the zygote Beaker kernels are forked from, if enabled. It is started along with the first kernel.
+        """
+        if not getattr(config, "use_kernel_zygote", False):
+            return None
+        if self._kernel_zygote is None:
+            self._kernel_zygote = KernelZygote()
+        return self._kernel_zygote
+
+    async def _async_shutdown_all(self, now: bool = False) -> None:
+        await super()._async_shutdown_all(now=now)
+        # Stopped after the kernels so that their exit codes are still collected while they shut down
+        if self._kernel_zygote is not None:
+            self._kernel_zygote.stop()
+            self._kernel_zygote = None
+    shutdown_all = _async_shutdown_all
+
+    @staticmethod
+    def matches_warm_kernels(path: str | None, kwargs: dict) -> bool:
+        """
+        Returns whether a kernel started with these arguments would be started the same way as the warm kernels, which
+        are started in the root directory with the default environment and launch arguments.
+        """
+        return not path and not any(value for key, value in kwargs.items() if key != "kernel_name")
+
+    def is_warm_kernel(self, kernel_id: str) -> bool:
+        return any(kernel_id in warm_kernels for warm_kernels in self.warm_kernels.values())
+
+    async def cull_kernel_if_idle(self, kernel_id: str):
+        # Warm kernels are idle until they are claimed, so culling them would only have them restarted by the next
+        # `fill_pools()`.
+        if self.is_warm_kernel(kernel_id):
+            return
+        return await super().cull_kernel_if_idle(kernel_id)
+
+    def claim_warm_kernel(self, kernel_name: str) -> str | None:
+        warm_kernels = self.warm_kernels.get(kernel_name, [])
+        while warm_kernels:
+            kernel_id = warm_kernels.pop(0)
+            # Skip kernels that were culled or shut down while waiting
+            if kernel_id in self:
+                return kernel_id
+        return None
+
+    def fill_pools(self):
+        """
+        Starts kernels in the background until each pool configured in `subkernel_pool_sizes` is full.
+        """
+        pool_sizes = getattr(config, "subkernel_pool_sizes", None) or {}
+        for kernel_name, size in pool_sizes.items():
+            if kernel_name in self._filling_pools or len(self.warm_kernels.get(kernel_name, [])) >= size:
+                continue
+            self._filling_pools.add(kernel_name)
+            fill_task = asyncio.get_running_loop().create_task(self._fill_pool(kernel_name, size))
+            # Referenced until done so that the task isn't garbage collected while running
+            self._pool_tasks.add(fill_task)
+            fill_task.add_done_callback(self._pool_task_done)
+
+    def _pool_task_done(self, task: asyncio.Task):
+        self._pool_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Unable to fill kernel pool: {task.exception()}", exc_info=task.exception())
+
+    async def _fill_pool(self, kernel_name: str, size: int):
+        warm_kernels = self.warm_kernels.setdefault(kernel_name, [])
+        try:
+            while len(warm_kernels) < size:
+                warm_kernels.append(await super()._async_start_kernel(kernel_name=kernel_name))
+        except Exception as err:
+            logger.warning(f"Unable to start warm {kernel_name} kernel: {err}")
+        finally:
+            self._filling_pools.discard(kernel_name)
+
 
 class BeakerServerApp(ServerApp):
     """
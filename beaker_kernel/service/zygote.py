@@ -0,0 +1,350 @@
+"""
+Fork server ("zygote") for starting Beaker kernel processes.
+
+Starting `beaker_kernel.kernel` from scratch imports archytas, langchain, jinja2, tree-sitter, etc. and autodiscovers
+all contexts and subkernels, which takes seconds per session. The zygote is a single long-running process that does
+all of that once. The server then asks it over a unix socket to fork a child for each new Beaker kernel. The child
+switches to the requested user, groups, working directory and environment before running the kernel, like `Popen`
+does for regularly launched kernels.
+
+The zygote reaps its children and records their exit codes in files, so that the server can track kernels that are
+not its own child processes with `ZygoteProcess`. The server passes the file descriptors the kernel's stdout and stderr
+should be written to along with each request, so kernel output ends up where it would if the kernel had been started
+directly. The zygote exits if the server dies.
+
+The kernel module is imported by the zygote as the user and in the working directory of the server, so everything it
+discovered there (library locations, contexts and subkernels, the config, the user's site-packages) is discovered again
+by each child once it has switched to the kernel's user, environment and working directory.
+
+Run by the server as:
+    python -m beaker_kernel.service.zygote <socket path> <exit code directory> [<kernel module>]
+"""
+import asyncio
+import importlib
+import json
+import os
+import pwd
+import shutil
+import signal
+import site
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from typing import Optional
+
+KERNEL_MODULE = "beaker_kernel.kernel"
+START_TIMEOUT_SECONDS = 60
+# How often the zygote checks whether the server that started it is still running
+PARENT_CHECK_SECONDS = 1.0
+
+
+class ZygoteProcess:
+    """
+    Stand-in for the `subprocess.Popen` object of a kernel forked by the zygote, used by the kernel provisioner to
+    poll, wait for and signal the kernel.
+    """
+
+    def __init__(self, pid: int, exit_code_path: str, zygote: Optional[subprocess.Popen] = None):
+        self.pid = pid
+        self.exit_code_path = exit_code_path
+        self.zygote = zygote
+        self.returncode: Optional[int] = None
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            with open(self.exit_code_path) as exit_code_file:
+                self.returncode = int(exit_code_file.read())
+            os.remove(self.exit_code_path)
+        except (FileNotFoundError, ValueError):
+            try:
+                os.kill(self.pid, 0)
+            except ProcessLookupError:
+                # Reaped by the zygote, which records the exit code right after. If the zygote is gone, it never will.
+                if self.zygote is None or self.zygote.poll() is not None:
+                    self.returncode = -signal.SIGKILL
+            except PermissionError:
+                # Running as another user
+                pass
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired(KERNEL_MODULE, timeout)
+            time.sleep(0.05)
+        return self.returncode
+
+    def send_signal(self, signum: int):
+        if self.poll() is None:
+            os.kill(self.pid, signum)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class KernelZygote:
+    """
+    Server side handle for a zygote process.
+    """
+
+    def __init__(self, kernel_module: str = KERNEL_MODULE):
+        self.kernel_module = kernel_module
+        # Only the server's user may connect, as the zygote can start processes as other users.
+        self.directory = tempfile.mkdtemp(prefix="beaker-zygote-")
+        os.chmod(self.directory, 0o700)
+        self.socket_path = os.path.join(self.directory, "zygote.sock")
+        self.exit_code_dir = os.path.join(self.directory, "exit_codes")
+        os.makedirs(self.exit_code_dir, mode=0o700)
+        self.process: Optional[subprocess.Popen] = None
+        self._starting: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def output_fd(target) -> Optional[int]:
+        """
+        Returns the file descriptor for a `stdout`/`stderr` argument of `Popen`, or None if it is not set. Raises
+        ValueError for targets the zygote can't pass on to the kernel, such as pipes.
+        """
+        if target is None:
+            return None
+        if hasattr(target, "fileno"):
+            return target.fileno()
+        if isinstance(target, int) and target >= 0:
+            return target
+        raise ValueError(f"Unsupported kernel output {target!r}")
+
+    @staticmethod
+    def can_start(kernel_cmd: list[str]) -> bool:
+        """
+        Returns whether the command runs the Beaker kernel in this interpreter, so that it can be forked from the zygote.
+        """
+        return kernel_cmd[:3] == [sys.executable, "-m", KERNEL_MODULE]
+
+    async def ensure_running(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        if self._starting is None or self._starting.done():
+            self._starting = asyncio.create_task(self._start())
+        await asyncio.shield(self._starting)
+
+    async def _start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "beaker_kernel.service.zygote",
+                self.socket_path, self.exit_code_dir, self.kernel_module,
+            ],
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + START_TIMEOUT_SECONDS
+        while not os.path.exists(self.socket_path):
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Kernel zygote exited with code {self.process.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError("Timed out waiting for kernel zygote to start")
+            await asyncio.sleep(0.05)
+
+    async def spawn(
+        self,
+        kernel_cmd: list[str],
+        env: dict[str, str],
+        cwd: Optional[str] = None,
+        user: Optional[str] = None,
+        group: Optional[int] = None,
+        extra_groups: Optional[list[int]] = None,
+        stdout: Optional[int] = None,
+        stderr: Optional[int] = None,
+    ) -> ZygoteProcess:
+        """
+        Forks a kernel from the zygote. `stdout` and `stderr` are the file descriptors the kernel writes its output to,
+        defaulting to the server's own, as for a kernel started with `Popen`.
+        """
+        await self.ensure_running()
+        request = {
+            "argv": kernel_cmd[3:],
+            "env": dict(env),
+            "cwd": cwd,
+            "user": user,
+            "group": group,
+            "extra_groups": extra_groups,
+        }
+        # Like `Popen`, the server's file descriptors 1 and 2 are inherited by default
+        output_fds = [1 if stdout is None else stdout, 2 if stderr is None else stderr]
+        response = await asyncio.to_thread(self._request, request, output_fds)
+        if "error" in response:
+            raise RuntimeError(f"Kernel zygote failed to start kernel: {response['error']}")
+        return ZygoteProcess(response["pid"], os.path.join(self.exit_code_dir, str(response["pid"])), self.process)
+
+    def _request(self, request: dict, fds: list[int]) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(self.socket_path)
+            # File descriptors are sent along with the first byte, followed by the request itself
+            socket.send_fds(connection, [b"\0"], fds)
+            connection.sendall(json.dumps(request).encode() + b"\n")
+            return json.loads(connection.makefile("rb").readline())
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def use_user_site():
+    """
+    Replaces the user site-packages directory of the zygote's user on `sys.path` with the one of the current user.
+    """
+    previous_user_site = site.getusersitepackages()
+    index = sys.path.index(previous_user_site) if previous_user_site in sys.path else len(sys.path)
+    if previous_user_site in sys.path:
+        sys.path.remove(previous_user_site)
+    # Cached by `site`, computed again from the current environment and user
+    site.USER_BASE = None
+    site.USER_SITE = None
+    user_site = site.getusersitepackages()
+    if site.ENABLE_USER_SITE and os.path.isdir(user_site):
+        sys.path.insert(index, user_site)
+        # Processes the .pth files, as the directory is already on the path
+        site.addsitedir(user_site)
+    importlib.invalidate_caches()
+
+
+def rediscover(kernel):
+    """
+    Discovers everything that depends on the user, environment or working directory again in the child, as the zygote
+    discovered it for its own.
+    """
+    from beaker_kernel.lib.autodiscovery import reset_autodiscovery
+    from beaker_kernel.lib.config import reset_config
+    use_user_site()
+    reset_autodiscovery()
+    reset_config()
+    if kernel.__name__ == KERNEL_MODULE:
+        kernel.AVAILABLE_CONTEXTS = kernel.autodiscover_contexts()
+
+
+def run_kernel(
+    request: dict, output_fds: list[int], listener: socket.socket, kernel_module: str = KERNEL_MODULE
+) -> int:
+    """
+    Runs in the forked child. Switches to the requested user, environment and output, then runs the kernel.
+    """
+    listener.close()
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.setsid()
+
+    for fd, target in zip(output_fds, (1, 2)):
+        if fd != target:
+            os.dup2(fd, target)
+            os.close(fd)
+
+    # Same order as `subprocess.Popen`, as groups can't be changed after giving up root.
+    if request.get("extra_groups") is not None:
+        os.setgroups(request["extra_groups"])
+    if request.get("group") is not None:
+        os.setgid(request["group"])
+    if request.get("user") is not None:
+        os.setuid(pwd.getpwnam(request["user"]).pw_uid)
+    if request.get("cwd"):
+        os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, sys.stdin.fileno())
+    os.close(devnull)
+
+    kernel = importlib.import_module(kernel_module)
+    rediscover(kernel)
+    sys.argv = [kernel_module, *request["argv"]]
+    try:
+        kernel.main()
+    except SystemExit as exit:
+        return exit.code if isinstance(exit.code, int) else 0
+    return 0
+
+
+def serve(socket_path: str, exit_code_dir: str, kernel_module: str = KERNEL_MODULE):
+    # Preload everything needed by the kernel, including context and subkernel autodiscovery
+    importlib.import_module(kernel_module)
+
+    def reap_children(signum, frame):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            exit_code_path = os.path.join(exit_code_dir, str(pid))
+            with open(f"{exit_code_path}.partial", "w") as exit_code_file:
+                exit_code_file.write(str(os.waitstatus_to_exitcode(status)))
+            os.replace(f"{exit_code_path}.partial", exit_code_path)
+
+    signal.signal(signal.SIGCHLD, reap_children)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The zygote runs in its own session, so it isn't signalled when the server dies and has to check for it instead.
+    parent_pid = os.getppid()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Bound under a temporary name and then moved into place, so the server only sees the socket once it is listening.
+    partial_socket_path = f"{socket_path}.partial"
+    listener.bind(partial_socket_path)
+    os.chmod(partial_socket_path, 0o600)
+    listener.listen()
+    listener.settimeout(PARENT_CHECK_SECONDS)
+    os.replace(partial_socket_path, socket_path)
+
+    while True:
+        try:
+            connection, _ = listener.accept()
+        except socket.timeout:
+            if os.getppid() != parent_pid:
+                # Orphaned, so clean up after the server, which can no longer do so
+                shutil.rmtree(os.path.dirname(socket_path), ignore_errors=True)
+                return
+            continue
+        connection.settimeout(None)
+        output_fds = []
+        with connection:
+            try:
+                _, output_fds, _, _ = socket.recv_fds(connection, 1, 2)
+                if len(output_fds) != 2:
+                    raise ValueError("Expected the kernel's stdout and stderr file descriptors")
+                request = json.loads(connection.makefile("rb").readline())
+            except (OSError, ValueError) as err:
+                for fd in output_fds:
+                    os.close(fd)
+                connection.sendall(json.dumps({"error": str(err)}).encode() + b"\n")
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    connection.close()
+                    status = run_kernel(request, output_fds, listener, kernel_module)
+                except BaseException:
+                    traceback.print_exc()
+                finally:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(status)
+            for fd in output_fds:
+                os.close(fd)
+            connection.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+
+
+if __name__ == "__main__":
+    serve(*sys.argv[1:4])
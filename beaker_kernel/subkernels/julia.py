@@ -3,7 +3,7 @@ import json
 import logging
 from typing import Any
 
-from ..lib.subkernel import BeakerSubkernel
+from ..lib.subkernel import CheckpointableBeakerSubkernel, Checkpoint, FetchedCheckpoint
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +17,13 @@ def get_kernel_name():
             return kernel
     return None
 
-class JuliaSubkernel(BeakerSubkernel):
+
+def julia_string(value: str) -> str:
+    # JSON string escapes are valid in Julia, but `$` has to be escaped to prevent interpolation
+    return json.dumps(value).replace("$", "\\$")
+
+
+class JuliaSubkernel(CheckpointableBeakerSubkernel):
     """
     Beaker subkernel for the Julia language, using the IJulia kernel from the IJulia.jl package.
 
@@ -48,6 +54,19 @@ JSON3.write(Dict(
 
     WEIGHT = 30
 
+    SERIALIZATION_EXTENSION = "jls"
+    # Read back with Serialization.deserialize, which can't read compressed files
+    UNCOMPRESSED_FORMATS = ("jls",)
+
+    # Constant bindings (functions, types, modules and `const` globals) can't be reassigned, so they are neither
+    # stored in nor restored from checkpoints.
+    CHECKPOINT_VARIABLES_CODE = """
+filter(
+    k -> !(k in [:Base, :Core, :IJulia, :In, :Main, :Out, :ans, :clear_history, :eval, :include]) &&
+        !startswith(string(k), "_") && isdefined(Main, k) && !isconst(Main, k),
+    names(Main; imported=true)
+)"""
+
     @classmethod
     def parse_subkernel_return(cls, execution_result) -> Any:
         return_raw = execution_result.get("return")
@@ -58,3 +77,42 @@ JSON3.write(Dict(
             except json.JSONDecodeError:
                 raise
             return python_obj
+
+    async def generate_checkpoint_from_state(self) -> FetchedCheckpoint:
+        save_state_code = f"""
+using JSON3
+using DisplayAs
+using Serialization
+
+let _result = Dict{{String, String}}()
+    for _name in {self.CHECKPOINT_VARIABLES_CODE.strip()}
+        _path = joinpath({julia_string(self.storage_prefix)}, string(_name) * ".jls")
+        try
+            Serialization.serialize(_path, getfield(Main, _name))
+            _result[string(_name)] = _path
+        catch
+            rm(_path; force=true)
+        end
+    end
+    JSON3.write(_result) |> DisplayAs.unlimited
+end
+"""
+        response = await self.context.evaluate(save_state_code, changes_state=False)
+        return response["return"]
+
+    async def load_checkpoint(self, checkpoint: Checkpoint):
+        entries = ", ".join(f"{julia_string(name)} => {julia_string(path)}" for name, path in checkpoint.items())
+        load_state_code = f"""
+using Serialization
+
+let _checkpoint = Dict{{String, String}}({entries})
+    # Globals can't be removed in Julia, so variables that didn't exist at the checkpoint are cleared instead.
+    for _name in {self.CHECKPOINT_VARIABLES_CODE.strip()}
+        haskey(_checkpoint, string(_name)) || Core.eval(Main, Expr(:(=), _name, nothing))
+    end
+    for (_name, _path) in _checkpoint
+        Core.eval(Main, Expr(:(=), Symbol(_name), QuoteNode(Serialization.deserialize(_path))))
+    end
+end;
+"""
+        await self.context.execute(load_state_code)
@@ -1,12 +1,43 @@
 import ast
-from typing import Any
+import asyncio
+import json
+import os.path
+from functools import cache
+from typing import Any, Optional
 
-from ..lib.subkernel import CheckpointableBeakerSubkernel, Checkpoint
+from ..lib.config import config
+from ..lib.subkernel import CheckpointableBeakerSubkernel, Checkpoint, FetchedCheckpoint
 
 import logging
 logger = logging.getLogger(__name__)
 
 VARIABLE_MAX_SHORT_CONTENTS_DISPLAY = 10
+BACKGROUND_CHECKPOINT_POLL_SECONDS = 0.1
+
+
+HELPER_MODULE_PATH = os.path.join(os.path.dirname(__file__), "python_helpers.py")
+# Installs the helper `source` as the `_beaker` module when run in the subkernel
+INSTALL_HELPERS_CODE = """\
+import sys, types
+module = types.ModuleType('_beaker')
+exec(compile(source, filename, 'exec'), module.__dict__)
+sys.modules['_beaker'] = module
+"""
+# Evaluates to the `_beaker` module in the subkernel. The helpers are sent by `setup()`, but if they are missing, e.g.
+# because the subkernel was restarted since, they are loaded from this package instead. This must not contain braces,
+# as the code that uses it is formatted with `str.format()`.
+HELPERS = (
+    "(__import__('sys').modules.get('_beaker') or "
+    f"exec({INSTALL_HELPERS_CODE!r}, dict(filename={HELPER_MODULE_PATH!r}, "
+    f"source=__import__('pathlib').Path({HELPER_MODULE_PATH!r}).read_text())) or __import__('_beaker'))"
+)
+
+
+@cache
+def get_helper_module_source() -> str:
+    with open(HELPER_MODULE_PATH) as helper_file:
+        return helper_file.read()
+
 
 class PythonSubkernel(CheckpointableBeakerSubkernel):
     """
@@ -23,105 +54,13 @@ class PythonSubkernel(CheckpointableBeakerSubkernel):
     WEIGHT = 20
 
     SERIALIZATION_EXTENSION = "pickle"
+    # Restored from memory maps or lazily, so these are left uncompressed
+    UNCOMPRESSED_FORMATS = ("npy", "feather", "nc", "dataarray.nc")
 
-    FETCH_STATE_CODE: str = """
-import inspect as _inspect
-import json as _json
-import dill as _dill
-import logging as _logging
-_logger = _logging.getLogger(__name__)
-
-class _SubkernelStateEncoder(_json.JSONEncoder):
-    def default(self, o):
-        # if callable(o):
-            # return f"Function named"
-            # return super().default(o)
-        try:
-            return super().default(o)
-        except:
-            return str(o)
-
-_result = {
-    "modules": {},
-    "variables": {},
-    "functions": {},
-    "classes": {}
-}
-for _name, _value in dict(locals()).items():
-    try:
-        if _name.startswith('_') or _name in ('In', 'Out', 'get_ipython', 'exit', 'quit', 'open'):
-            continue
-        if callable(_value):
-            if isinstance(_value, type):
-                _result["classes"][_name] = {
-                    'docstring': _inspect.getdoc(_value)
-                }
-            else:
-                _fndetails = {
-                    'docstring': _inspect.getdoc(_value),
-                    'signature': str(_inspect.signature(_value))
-                }
-                _result["functions"][_name] = _fndetails
-        elif _inspect.ismodule(_value):
-
-            try:
-                _path = str(_value.__file__)
-            except AttributeError:
-                _path = "(built in)"
-            _result["modules"][_name] = {
-                'path': _path,
-                'full_name': str(_value.__name__)
-            }
-        else:
-            import pandas as _pandas
-            _size = ''
-            if id(_value) in (id(globals()), id(locals)):
-                _vardetails = {
-                    'value': "{...skipped...}",
-                    'type': str(type(_value)),
-                    'size': '',
-                }
-            else:
-                _size = ''
-                if hasattr(_value, "shape"):
-                    _size = _value.shape
-                elif hasattr(_value, "__len__"):
-                    try:
-                        _size = len(_value)
-                    except Exception:
-                        pass
-
-                # bounds check long sequences for size and things like Ellipsis not being serializable
-                _safe_value = _value
-                _truncated = False
-                try:
-                    _safe_value = _value.head()
-                    _truncated = True
-                except AttributeError:
-                    pass
-                try:
-                    _safe_value = _value[:99]
-                    if len(_value) > 99:
-                        _truncated = True
-                except Exception:
-                    pass
-
-                _vardetails = {
-                    'value': _safe_value,
-                    'type': type(_value).__name__,
-                    'size': str(_size),
-                    'truncated': _truncated
-                }
-            _result["variables"][_name] = _vardetails
-    except Exception as e:
-        _logger.warning(f"FETCH_STATE_CODE: failed to get variable details for variable `{_name}` of type `{type(_value)}`: {e}")
-try:
-    _result = _json.loads(_json.dumps(_result, cls=_SubkernelStateEncoder))
-except Exception as e:
-    _logger.warning(f"FETCH_STATE_CODE: failed to serialize state: {e}")
-    _result = {}
-_result
-"""
+    # Helper functions live in the `_beaker` module which is installed in the subkernel during setup. It is accessed
+    # via `HELPERS` so that calls still work if the user clears their namespace (e.g. `%reset`) or the subkernel restarts.
+    FETCH_STATE_CODE: str = f"{HELPERS}.state()"
+    FETCH_STATE_DELTA_CODE: str = HELPERS + ".state_delta({version!r})"
 
     @classmethod
     def parse_subkernel_return(cls, execution_result) -> Any:
@@ -130,58 +69,36 @@ _result
             python_obj = ast.literal_eval(return_str)
             return python_obj
 
-    async def generate_checkpoint_from_state(self) -> Checkpoint:
-        save_state_code = """
-import inspect as _inspect
-import json as _json
-import dill as _dill
-class _SubkernelStateEncoder(_json.JSONEncoder):
-    def default(self, o):
-        # if callable(o):
-            # return f"Function named"
-            # return super().default(o)
-        try:
-            return super().default(o)
-        except:
-            return str(o)
-
-_result = {}
-for _name, _value in dict(locals()).items():
-    if _name.startswith('_') or _name in ('In', 'Out', 'get_ipython', 'exit', 'quit', 'open'):
-        continue
-    _path = f"%s/{_name}.pkl"
-    with open(_path, "wb") as _f:
-        try:
-            _dill.dump(_value, _f)
-        except Exception as e:
-            continue
-        _result[_name] = _path
+    async def generate_checkpoint_from_state(self) -> FetchedCheckpoint:
+        previous = self.previous_serializations()
+        response = await self.context.evaluate(
+            f"{HELPERS}.checkpoint({self.storage_prefix!r}, {previous!r})",
+            changes_state=False,
+        )
+        return response["return"]
 
-_result = _json.loads(_json.dumps(_result, cls=_SubkernelStateEncoder))
-del _inspect, _json, _dill
-_result
-""" % self.storage_prefix
-        response = await self.context.evaluate(save_state_code)
+    async def start_background_checkpoint(self) -> Optional[int]:
+        previous = self.previous_serializations()
+        response = await self.context.evaluate(
+            f"{HELPERS}.checkpoint_in_background({self.storage_prefix!r}, {previous!r})",
+            changes_state=False,
+        )
         return response["return"]
 
+    async def complete_background_checkpoint(self, job: int) -> FetchedCheckpoint:
+        # Polled rather than waited for in the subkernel, so that other executions aren't held up behind the wait.
+        while True:
+            response = await self.context.evaluate(
+                f"{HELPERS}.checkpoint_result({self.storage_prefix!r}, {job!r})",
+                changes_state=False,
+            )
+            if response["return"] is not None:
+                return response["return"]
+            await asyncio.sleep(BACKGROUND_CHECKPOINT_POLL_SECONDS)
 
     async def load_checkpoint(self, checkpoint: Checkpoint):
-        vars = await self.context.evaluate("""
-import dill as _dill
-_exclusion_critieria = lambda name: name.startswith('_') or name in ('In', 'Out', 'get_ipython', 'exit', 'quit', 'open')
-[ name for name, value in dict(locals()).items() if not _exclusion_critieria(name) ]
-""")
-        await self.context.execute(f"del {', '.join(vars['return'])}")
-        deserialization_code = ""
-        for varname, filename in checkpoint.items():
-            deserialization_code += f"""
-
-with open("{filename}", "rb") as _file:
-    {varname} = _dill.load(_file)
-
-"""
-        deserialization_code += "del _dill"
-        await self.context.execute(deserialization_code)
+        workers = max(1, getattr(config, "checkpoint_restore_threads", 1))
+        await self.context.execute(f"{HELPERS}.restore({json.dumps(checkpoint)}, workers={workers})")
 
     async def setup(self):
         setup_code = f"""
@@ -194,6 +111,8 @@ if site.USER_SITE not in sys.path:
     sys.path.append(site.USER_SITE)
     importlib.invalidate_caches()
 del importlib, os, site, sys
+
+exec({INSTALL_HELPERS_CODE!r}, dict(source={get_helper_module_source()!r}, filename="<beaker helpers>"))
 """
         await self.context.execute(setup_code)
 
@@ -0,0 +1,675 @@
+"""
+Helper module installed into Python subkernels.
+
+This file is not imported by Beaker itself. Its source is sent to the subkernel once, during `PythonSubkernel.setup()`,
+where it is installed as the `_beaker` module so that state fetching and checkpointing can be done with short
+one-line calls instead of sending and compiling large code cells each time. If the module is missing when a call is
+made, e.g. after the subkernel restarted, the subkernel loads it from this file.
+
+As it runs inside the user's kernel, it must only depend on the standard library at import time. Everything else is
+imported lazily when needed.
+"""
+import hashlib
+import inspect
+import itertools
+import json
+import logging
+import os
+
+logger = logging.getLogger("_beaker")
+
+EXCLUDED_NAMES = ('In', 'Out', 'get_ipython', 'exit', 'quit', 'open')
+
+
+class SubkernelStateEncoder(json.JSONEncoder):
+    def default(self, o):
+        try:
+            return super().default(o)
+        except:
+            return str(o)
+
+
+class Result(dict):
+    """
+    Return value of the functions evaluated by Beaker, which are parsed back from their displayed text. IPython
+    abbreviates the pretty-printed form of containers with more than 1000 items, so the full repr is displayed instead.
+    """
+
+    def _repr_pretty_(self, p, cycle):
+        p.text(repr(self))
+
+
+def is_excluded(name):
+    return name.startswith('_') or name in EXCLUDED_NAMES
+
+
+def user_namespace():
+    from IPython import get_ipython
+    return get_ipython().user_ns
+
+
+def describe_variable(value, namespace):
+    if value is namespace:
+        return {
+            'value': "{...skipped...}",
+            'type': str(type(value)),
+            'size': '',
+        }
+    size = ''
+    if hasattr(value, "shape"):
+        size = value.shape
+    elif hasattr(value, "__len__"):
+        try:
+            size = len(value)
+        except Exception:
+            pass
+
+    # bounds check long sequences for size and things like Ellipsis not being serializable
+    safe_value = value
+    truncated = False
+    try:
+        safe_value = value.head()
+        truncated = True
+    except AttributeError:
+        pass
+    try:
+        safe_value = value[:99]
+        if len(value) > 99:
+            truncated = True
+    except Exception:
+        pass
+
+    return {
+        'value': safe_value,
+        'type': type(value).__name__,
+        'size': str(size),
+        'truncated': truncated,
+    }
+
+
+def describe(name, value, namespace):
+    """
+    Returns the state category and the details for an item in the user namespace.
+    """
+    if callable(value):
+        if isinstance(value, type):
+            return "classes", {
+                'docstring': inspect.getdoc(value)
+            }
+        return "functions", {
+            'docstring': inspect.getdoc(value),
+            'signature': str(inspect.signature(value)),
+        }
+    elif inspect.ismodule(value):
+        try:
+            path = str(value.__file__)
+        except AttributeError:
+            path = "(built in)"
+        return "modules", {
+            'path': path,
+            'full_name': str(value.__name__),
+        }
+    return "variables", describe_variable(value, namespace)
+
+
+def empty_state():
+    return {
+        "modules": {},
+        "variables": {},
+        "functions": {},
+        "classes": {},
+    }
+
+
+def state():
+    namespace = user_namespace()
+    result = empty_state()
+    for name, value in list(namespace.items()):
+        try:
+            if is_excluded(name):
+                continue
+            category, details = describe(name, value, namespace)
+            result[category][name] = details
+        except Exception as e:
+            logger.warning(f"state: failed to get variable details for variable `{name}` of type `{type(value)}`: {e}")
+    try:
+        return Result(json.loads(json.dumps(result, cls=SubkernelStateEncoder)))
+    except Exception as e:
+        logger.warning(f"state: failed to serialize state: {e}")
+        return Result()
+
+
+# Fingerprints of the items reported by the last call to `state_delta()`, keyed by name, along with a version number
+# identifying that report.
+state_tracking = {
+    "version": 0,
+    "fingerprints": {},
+}
+
+# Values of these types can't change without being rebound, so their hash is enough to tell if they have changed
+# without having to describe them.
+IMMUTABLE_TYPES = (bool, int, float, complex, str, bytes, type(None), range)
+
+
+# Number of items of builtin containers whose identities are part of their fingerprint, matching the number of items
+# that are described.
+FINGERPRINTED_ITEMS = 99
+
+# Largest number of bytes of array data hashed to detect changes made in place to the part of an array that is shown.
+STATE_CONTENT_MAX_BYTES = 1024 * 1024
+
+
+def state_content_digest(value):
+    """
+    Returns a digest of the part of a value that is shown in its details, so that changes made to it in place are
+    detected, or None if that would be too costly.
+    """
+    value_type = type(value)
+    if callable(value) or inspect.ismodule(value):
+        # Only their docstring and signature are shown, which don't change without the value being rebound
+        return None
+    if is_ndarray(value):
+        shown = value[:FINGERPRINTED_ITEMS] if value.ndim else value
+        if shown.dtype.hasobject:
+            text = repr(shown)
+        elif shown.nbytes > STATE_CONTENT_MAX_BYTES:
+            return None
+        else:
+            import numpy
+            return hashlib.blake2b(numpy.ascontiguousarray(shown).data, digest_size=16).hexdigest()
+    elif value_type.__module__.split(".")[0] == "pandas" and value_type.__name__ in ("DataFrame", "Series"):
+        import pandas
+        shown = value.iloc[:FINGERPRINTED_ITEMS]
+        try:
+            hashes = pandas.util.hash_pandas_object(shown, index=True).to_numpy()
+            return hashlib.blake2b(hashes.data, digest_size=16).hexdigest()
+        except TypeError:
+            # Unhashable values, e.g. lists in object columns
+            text = repr(shown)
+    elif isinstance(value, (list, tuple)):
+        text = repr(value[:FINGERPRINTED_ITEMS])
+    elif isinstance(value, (dict, set, frozenset)):
+        text = repr(value)
+    else:
+        # Other values are shown as text
+        try:
+            text = str(value)
+        except Exception:
+            return None
+    return hashlib.blake2b(text.encode(errors="replace"), digest_size=16).hexdigest()
+
+
+def state_fingerprint(value):
+    """
+    Returns a fingerprint of a value that is cheap to compute compared to describing it. It changes when the value is
+    rebound, resized or reshaped, when items of a builtin container are replaced, when the arrays holding the data of
+    an ndarray or DataFrame are replaced, or when the part of the value that is shown changes in place. Changes to the
+    rows of an array that are shown are not detected if they take up more than `STATE_CONTENT_MAX_BYTES`.
+    """
+    parts = [type(value).__qualname__, id(value)]
+    if isinstance(value, IMMUTABLE_TYPES):
+        parts.append(hash(value))
+        return tuple(parts)
+    try:
+        parts.append(len(value))
+    except Exception:
+        pass
+    if isinstance(value, (list, tuple)):
+        parts.append(tuple(map(id, value[:FINGERPRINTED_ITEMS])))
+    elif isinstance(value, dict):
+        items = itertools.islice(value.items(), FINGERPRINTED_ITEMS)
+        parts.append(tuple((id(key), id(item)) for key, item in items))
+    elif isinstance(value, (set, frozenset)):
+        parts.append(tuple(map(id, itertools.islice(value, FINGERPRINTED_ITEMS))))
+    value_type = type(value)
+    if is_ndarray(value):
+        parts.extend((value.shape, value.dtype.str, value.nbytes, value.__array_interface__["data"][0]))
+    elif value_type.__module__.split(".")[0] == "pandas" and value_type.__name__ in ("DataFrame", "Series"):
+        parts.extend((value.shape, id(value.index)))
+        if value_type.__name__ == "DataFrame":
+            parts.append(id(value.columns))
+        try:
+            # Columns are stored in blocks, which are replaced rather than modified by most operations
+            parts.append(tuple(map(id, value._mgr.arrays)))
+        except AttributeError:
+            pass
+    parts.append(state_content_digest(value))
+    return tuple(parts)
+
+
+def state_delta(since=None):
+    """
+    Returns the items in the user namespace that were added or changed, and the names of items that were removed, since
+    the report identified by `since` was generated. If `since` doesn't match the last report, the full state is
+    returned instead.
+    """
+    namespace = user_namespace()
+    full = since is None or since != state_tracking["version"]
+    previous = {} if full else state_tracking["fingerprints"]
+    fingerprints = {}
+    changed = empty_state()
+    removed = {}
+    for name, value in list(namespace.items()):
+        try:
+            if is_excluded(name):
+                continue
+            value_fingerprint = state_fingerprint(value)
+            if name in previous and previous[name][1] == value_fingerprint:
+                fingerprints[name] = previous[name]
+                continue
+            # Only values whose fingerprint changed are described and serialized
+            category, details = describe(name, value, namespace)
+            changed[category][name] = json.loads(json.dumps(details, cls=SubkernelStateEncoder))
+            fingerprints[name] = (category, value_fingerprint)
+            if name in previous and previous[name][0] != category:
+                removed.setdefault(previous[name][0], []).append(name)
+        except Exception as e:
+            logger.warning(f"state_delta: failed to get variable details for variable `{name}` of type `{type(value)}`: {e}")
+    for name, previous_fingerprint in previous.items():
+        if name not in fingerprints:
+            removed.setdefault(previous_fingerprint[0], []).append(name)
+
+    if full or removed or any(changed.values()):
+        state_tracking["version"] += 1
+    state_tracking["fingerprints"] = fingerprints
+    return Result(
+        version=state_tracking["version"],
+        full=full,
+        state=changed,
+        removed=removed,
+    )
+
+
+# Content fingerprint and file hash of each variable as of the last checkpoint, used to skip re-serializing variables
+# that haven't changed since.
+checkpoint_tracking = {}
+
+
+class HashingWriter:
+    """
+    File wrapper that hashes everything written through it, so that checkpoint files don't need to be read back in
+    order to be content-addressed.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.file.write(data)
+
+
+def hash_file(path):
+    hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(4 * 1024 * 1024):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+# Suffixes added to checkpoint files that were compressed after being written
+COMPRESSION_SUFFIXES = ("zst", "lz4", "gz")
+
+
+def split_checkpoint_filename(path):
+    """
+    Splits a checkpoint filename into its content hash, serialization format and compression suffix (or None).
+    """
+    digest, _, extension = os.path.basename(path).partition(".")
+    base, _, suffix = extension.rpartition(".")
+    if base and suffix in COMPRESSION_SUFFIXES:
+        return digest, base, suffix
+    return digest, extension, None
+
+
+def open_checkpoint_file(path):
+    compression = split_checkpoint_filename(path)[2]
+    if compression == "zst":
+        import io
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")))
+    elif compression == "lz4":
+        import lz4.frame
+        return lz4.frame.open(path, "rb")
+    elif compression == "gz":
+        import gzip
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def is_ndarray(value):
+    # Arrays restored from a checkpoint are backed by a memory map, so `numpy.memmap` is included.
+    value_type = type(value)
+    return value_type.__module__ == "numpy" and value_type.__name__ in ("ndarray", "memmap")
+
+
+class Serializer:
+    """
+    Writes and reads checkpoint files for the values it `matches`. Files are named after their extension so that the
+    serializer to restore them with can be found again.
+    """
+    extension = "pickle"
+
+    def matches(self, value):
+        return True
+
+    def dump(self, value, path):
+        """
+        Serializes `value` to `path`, returning the sha256 hash of the written file.
+        """
+        import dill
+        with open(path, "wb") as f:
+            writer = HashingWriter(f)
+            dill.dump(value, writer)
+        return writer.hash.hexdigest()
+
+    def load(self, path):
+        import dill
+        with open_checkpoint_file(path) as f:
+            return dill.load(f)
+
+
+class NumpySerializer(Serializer):
+    extension = "npy"
+
+    def matches(self, value):
+        return is_ndarray(value) and not value.dtype.hasobject
+
+    def dump(self, value, path):
+        import numpy
+        with open(path, "wb") as f:
+            writer = HashingWriter(f)
+            numpy.save(writer, value, allow_pickle=False)
+        return writer.hash.hexdigest()
+
+    def load(self, path):
+        import numpy
+        # Copy-on-write, so the array can still be modified without changing the checkpoint file.
+        return numpy.load(path, mmap_mode="c", allow_pickle=False).view(numpy.ndarray)
+
+
+class DataFrameSerializer(Serializer):
+    extension = "feather"
+
+    def matches(self, value):
+        value_type = type(value)
+        if value_type.__module__.split(".")[0] != "pandas" or value_type.__name__ != "DataFrame":
+            return False
+        try:
+            import pyarrow
+        except ImportError:
+            return False
+        return all(isinstance(column, str) for column in value.columns)
+
+    def dump(self, value, path):
+        import pyarrow
+        import pyarrow.feather
+        table = pyarrow.Table.from_pandas(value, preserve_index=True)
+        # Left uncompressed so that it can be memory mapped when restored
+        pyarrow.feather.write_feather(table, path, compression="uncompressed")
+        return hash_file(path)
+
+    def load(self, path):
+        import pyarrow.feather
+        return pyarrow.feather.read_table(path, memory_map=True).to_pandas()
+
+
+class XarraySerializer(Serializer):
+    extension = "nc"
+    xarray_type = "Dataset"
+
+    def matches(self, value):
+        value_type = type(value)
+        return value_type.__module__.split(".")[0] == "xarray" and value_type.__name__ == self.xarray_type
+
+    def dump(self, value, path):
+        value.to_netcdf(path)
+        return hash_file(path)
+
+    def load(self, path):
+        import xarray
+        # Opened lazily, so data is only read from the file as it is accessed.
+        return xarray.open_dataset(path)
+
+
+class XarrayDataArraySerializer(XarraySerializer):
+    extension = "dataarray.nc"
+    xarray_type = "DataArray"
+
+    def load(self, path):
+        import xarray
+        return xarray.open_dataarray(path)
+
+
+# Checked in order, with the dill based fallback serializer used for anything that isn't matched.
+SERIALIZERS = [NumpySerializer(), DataFrameSerializer(), XarraySerializer(), XarrayDataArraySerializer()]
+FALLBACK_SERIALIZER = Serializer()
+
+
+def register_serializer(serializer, index=None):
+    SERIALIZERS.insert(len(SERIALIZERS) if index is None else index, serializer)
+
+
+def serializer_for_value(value):
+    for serializer in SERIALIZERS:
+        try:
+            if serializer.matches(value):
+                return serializer
+        except Exception:
+            continue
+    return FALLBACK_SERIALIZER
+
+
+def serializer_for_path(path):
+    extension = split_checkpoint_filename(path)[1]
+    for serializer in SERIALIZERS:
+        if serializer.extension == extension:
+            return serializer
+    return FALLBACK_SERIALIZER
+
+
+def serialize(value, storage_prefix, name):
+    """
+    Serializes `value` with the first matching serializer, falling back to dill if that fails. Returns the path
+    written to, its sha256 hash and its extension.
+    """
+    serializer = serializer_for_value(value)
+    for serializer in dict.fromkeys((serializer, FALLBACK_SERIALIZER)):
+        path = f"{storage_prefix}/{name}.{serializer.extension}"
+        try:
+            digest = serializer.dump(value, path)
+        except Exception as e:
+            logger.debug(f"checkpoint: unable to serialize `{name}` as {serializer.extension}: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        return path, digest, serializer.extension
+    return None
+
+
+def content_fingerprint(value):
+    """
+    Returns a fingerprint of `value` that changes whenever it is reassigned or modified in place, or None if there is
+    no way to fingerprint the value that is cheaper than serializing it.
+    """
+    value_type = type(value)
+    if isinstance(value, IMMUTABLE_TYPES):
+        return (value_type.__qualname__, id(value), hash(value))
+    if inspect.ismodule(value):
+        return ("module", id(value))
+    package = value_type.__module__.split(".")[0]
+    if is_ndarray(value) and not value.dtype.hasobject:
+        import numpy
+        digest = hashlib.blake2b(numpy.ascontiguousarray(value).data, digest_size=16).hexdigest()
+        return ("ndarray", id(value), value.shape, value.dtype.str, digest)
+    if package == "pandas" and value_type.__name__ in ("DataFrame", "Series"):
+        import pandas
+        hashes = pandas.util.hash_pandas_object(value, index=True).to_numpy()
+        digest = hashlib.blake2b(hashes.data, digest_size=16).hexdigest()
+        return (
+            value_type.__name__, id(value), repr(value.dtypes), repr(getattr(value, "name", None)),
+            tuple(value.index.names), digest,
+        )
+    return None
+
+
+def collect_checkpoint(storage_prefix, previous=None, file_prefix=""):
+    """
+    Serializes the variables in the user namespace as described in `checkpoint()`, returning the result along with the
+    fingerprints to track for the next checkpoint.
+    """
+    previous = previous or {}
+    tracking = {}
+    result = {}
+    for name, value in list(user_namespace().items()):
+        if is_excluded(name):
+            continue
+        try:
+            value_fingerprint = content_fingerprint(value)
+        except Exception:
+            value_fingerprint = None
+        last = checkpoint_tracking.get(name)
+        if value_fingerprint is not None and last and last[:2] == (value_fingerprint, previous.get(name)):
+            tracking[name] = last
+            result[name] = {"sha256": last[1], "format": last[2]}
+            continue
+        serialized = serialize(value, storage_prefix, f"{file_prefix}{name}")
+        if serialized is None:
+            continue
+        path, digest, extension = serialized
+        if value_fingerprint is not None:
+            tracking[name] = (value_fingerprint, digest, extension)
+        result[name] = {"sha256": digest, "format": extension, "path": path}
+    return result, tracking
+
+
+def checkpoint(storage_prefix, previous=None):
+    """
+    Serializes each variable in the user namespace to a file under `storage_prefix`. Variables that can't be
+    serialized are skipped.
+
+    `previous` maps variable names to the hash of their file in the last checkpoint. Variables whose fingerprint hasn't
+    changed since they were serialized to that file are not serialized again.
+
+    Returns a mapping of variable name to `{"sha256": ..., "format": ..., "path": ...}`, where "format" is the file
+    extension and "path" is left out for variables whose previous file is to be reused.
+    """
+    result, tracking = collect_checkpoint(storage_prefix, previous)
+    checkpoint_tracking.clear()
+    checkpoint_tracking.update(tracking)
+    return Result(result)
+
+
+def background_result_path(storage_prefix, pid):
+    return f"{storage_prefix}/{pid}.checkpoint"
+
+
+def checkpoint_in_background(storage_prefix, previous=None):
+    """
+    Forks the kernel process so that a copy-on-write snapshot of the user namespace can be serialized by the child
+    process while the kernel carries on running code. Returns the process id to pass to `checkpoint_result()`, or None
+    if the process can't be forked.
+
+    Only the forking thread exists in the child, so a lock held by another thread at the time of the fork is never
+    released there. Python reinitializes the import and logging locks in the child and the kernel's heartbeat, IOPub
+    and control threads only hold locks around its ZMQ sockets and output streams, which the child never uses: its
+    output goes to /dev/null, logging is disabled and it exits without running any cleanup. The fork is only done from
+    the main thread, which runs the code of the kernel, so that no user code is part way through on the forking thread.
+    """
+    import threading
+    if not hasattr(os, "fork") or threading.current_thread() is not threading.main_thread():
+        return None
+    pid = os.fork()
+    if pid:
+        return pid
+
+    status = 1
+    try:
+        import pickle
+        import sys
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        sys.stdout = sys.stderr = open(devnull, "w", closefd=False)
+        logging.disable(logging.CRITICAL)
+        pid = os.getpid()
+        result, tracking = collect_checkpoint(storage_prefix, previous, file_prefix=f"{pid}-")
+        path = background_result_path(storage_prefix, pid)
+        with open(f"{path}.partial", "wb") as f:
+            pickle.dump((result, tracking), f)
+        os.replace(f"{path}.partial", path)
+        status = 0
+    finally:
+        os._exit(status)
+
+
+def checkpoint_result(storage_prefix, pid):
+    """
+    Returns the checkpoint written by `checkpoint_in_background()` in process `pid` in the same form as `checkpoint()`,
+    or None if the process hasn't finished yet.
+    """
+    import pickle
+    finished_pid, status = os.waitpid(pid, os.WNOHANG)
+    if finished_pid == 0:
+        return None
+    path = background_result_path(storage_prefix, pid)
+    try:
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code != 0 or not os.path.exists(path):
+            raise RuntimeError(f"Background checkpoint process exited with status {exit_code}")
+        with open(path, "rb") as f:
+            result, tracking = pickle.load(f)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    checkpoint_tracking.clear()
+    checkpoint_tracking.update(tracking)
+    return Result(result)
+
+
+def restore(checkpoint, workers=1):
+    """
+    Replaces the variables in the user namespace with the ones stored in `checkpoint`, a mapping of variable name to
+    the content-addressed file the variable was stored in.
+
+    Variables whose current value is known to match the file they are to be restored from are kept as they are. The
+    remaining files are loaded using up to `workers` threads.
+    """
+    namespace = user_namespace()
+    unchanged = set()
+    for name, path in checkpoint.items():
+        last = checkpoint_tracking.get(name)
+        if name not in namespace or not last or last[1] != split_checkpoint_filename(path)[0]:
+            continue
+        try:
+            if content_fingerprint(namespace[name]) == last[0]:
+                unchanged.add(name)
+        except Exception:
+            pass
+    for name in [name for name in namespace if not is_excluded(name) and name not in unchanged]:
+        del namespace[name]
+    tracking = {name: checkpoint_tracking[name] for name in unchanged}
+
+    def load(item):
+        name, path = item
+        return name, path, serializer_for_path(path).load(path)
+
+    to_load = [(name, path) for name, path in checkpoint.items() if name not in unchanged]
+    if workers > 1 and len(to_load) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(workers, len(to_load))) as executor:
+            loaded = list(executor.map(load, to_load))
+    else:
+        loaded = map(load, to_load)
+    for name, path, value in loaded:
+        namespace[name] = value
+        # The restored value matches the file it was loaded from, so it doesn't need to be serialized again
+        try:
+            value_fingerprint = content_fingerprint(value)
+        except Exception:
+            value_fingerprint = None
+        if value_fingerprint is not None:
+            digest, extension, _ = split_checkpoint_filename(path)
+            tracking[name] = (value_fingerprint, digest, extension)
+    checkpoint_tracking.clear()
+    checkpoint_tracking.update(tracking)
@@ -4,12 +4,12 @@ import logging
 import re
 from typing import Any
 
-from ..lib.subkernel import BeakerSubkernel
+from ..lib.subkernel import CheckpointableBeakerSubkernel, Checkpoint, FetchedCheckpoint
 
 logger = logging.getLogger(__name__)
 
 
-class RSubkernel(BeakerSubkernel):
+class RSubkernel(CheckpointableBeakerSubkernel):
     """
     Beaker subkernel for the R language using the `ir` (IRkernel) kernel.
 
@@ -22,6 +22,10 @@ class RSubkernel(BeakerSubkernel):
 
     WEIGHT = 60
 
+    SERIALIZATION_EXTENSION = "rds"
+    # saveRDS already compresses its output
+    UNCOMPRESSED_FORMATS = ("rds",)
+
     @classmethod
     def parse_subkernel_return(cls, execution_result) -> Any:
         # irkernel annoyingly does not return the last item in the code execution as the "return" item, so we print the response as part of the output
@@ -35,3 +39,34 @@ class RSubkernel(BeakerSubkernel):
             except json.JSONDecodeError:
                 raise
             return python_obj
+
+    async def generate_checkpoint_from_state(self) -> FetchedCheckpoint:
+        # JSON string escapes are valid in R string literals
+        save_state_code = f"""
+local({{
+    .result <- setNames(list(), character(0))
+    for (.name in ls(envir = globalenv())) {{
+        .path <- file.path({json.dumps(self.storage_prefix)}, paste0(.name, ".rds"))
+        tryCatch({{
+            saveRDS(get(.name, envir = globalenv()), .path)
+            .result[[.name]] <- .path
+        }}, error = function(e) unlink(.path))
+    }}
+    print(as.character(jsonlite::toJSON(.result, auto_unbox = TRUE)))
+}})
+"""
+        response = await self.context.evaluate(save_state_code, changes_state=False)
+        return response["return"]
+
+    async def load_checkpoint(self, checkpoint: Checkpoint):
+        entries = ", ".join(f"{json.dumps(name)} = {json.dumps(path)}" for name, path in checkpoint.items())
+        load_state_code = f"""
+local({{
+    .checkpoint <- list({entries})
+    rm(list = ls(envir = globalenv()), envir = globalenv())
+    for (.name in names(.checkpoint)) {{
+        assign(.name, readRDS(.checkpoint[[.name]]), envir = globalenv())
+    }}
+}})
+"""
+        await self.context.execute(load_state_code)
@@ -0,0 +1,278 @@
+"""
+Cost of checkpointing and rolling back a local python3 kernel with synthetic namespaces.
+
+Each scenario starts a fresh kernel, fills its namespace and then times `add_checkpoint()`, `rollback()` and
+`execute_and_rollback()`. Before each timed run, part of the namespace is modified so that incremental checkpoints
+still have work to do. Reported per scenario:
+
+- wall time of each operation
+- bytes of checkpoint data added per checkpoint
+- time split of `add_checkpoint()` between serializing in the subkernel and storing (moving/compressing) files in the
+  beaker process. The subkernel hashes files as it writes them and fingerprints values to skip unchanged ones, so
+  "hash" and "fingerprint" are the parts of "serialize" spent on those, as timed in the subkernel itself.
+- peak RSS of the subkernel and of the benchmarking (beaker) process
+
+Scenarios whose libraries aren't installed in the kernel (numpy, pandas) are skipped.
+
+Usage:
+    python -m tests.benchmarks.bench_checkpoint [--runs N] [--scale X] [--scenario NAME ...]
+        [--output results.json] [--baseline results.json [--tolerance 1.5]]
+
+With `--baseline`, the median wall times are compared against a previous `--output` file and the exit code is 1 if
+any of them regressed by more than `--tolerance` times, so this can be used in CI.
+"""
+import argparse
+import asyncio
+import collections
+import functools
+import resource
+import sys
+import time
+
+from .harness import BenchmarkSession, add_baseline_arguments, report, summarize
+
+
+# Code to fill the namespace and code to modify it before each timed run, formatted with the scenario sizes.
+SCENARIOS = {
+    "small_objects": (
+        """
+for _i in range({small_count}):
+    globals()[f"small_{{_i}}"] = {{"index": _i, "name": str(_i), "values": list(range(10))}}
+""",
+        "small_0 = {{'index': 0, 'name': str(__import__('time').time())}}",
+    ),
+    "large_arrays": (
+        """
+import numpy
+_rng = numpy.random.default_rng(0)
+array_0, array_1, array_2 = (_rng.random({array_bytes} // 8) for _ in range(3))
+""",
+        "array_0[:1000] = numpy.random.random(1000)",
+    ),
+    "dataframes": (
+        """
+import numpy
+import pandas
+_rng = numpy.random.default_rng(0)
+frame_0, frame_1 = (
+    pandas.DataFrame({{
+        "a": _rng.random({frame_rows}),
+        "b": _rng.integers(0, 1000, {frame_rows}),
+        "c": _rng.choice(["x", "y", "z"], {frame_rows}),
+    }})
+    for _ in range(2)
+)
+""",
+        "frame_0.loc[0, 'a'] = numpy.random.random()",
+    ),
+    "unpicklable": (
+        """
+import socket
+import threading
+lock = threading.Lock()
+generator = (_i for _i in range(10))
+connection = socket.socket()
+values = list(range(1000))
+""",
+        "values = list(range(__import__('random').randint(0, 1000)))",
+    ),
+}
+
+
+# Run in the subkernel to time the hashing done while checkpointing, which happens in the `_beaker` helper module.
+SUBKERNEL_TIMERS_CODE = """
+def _install_timers(beaker):
+    import functools
+    import time
+    totals = beaker.benchmark_totals = {"hash": 0.0, "fingerprint": 0.0}
+
+    def timed(phase, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                totals[phase] += time.perf_counter() - start
+        return wrapper
+
+    def write(self, data):
+        start = time.perf_counter()
+        self.hash.update(data)
+        totals["hash"] += time.perf_counter() - start
+        return self.file.write(data)
+
+    beaker.hash_file = timed("hash", beaker.hash_file)
+    beaker.content_fingerprint = timed("fingerprint", beaker.content_fingerprint)
+    beaker.HashingWriter.write = write
+
+_install_timers(__import__("_beaker"))
+del _install_timers
+"""
+# Returns the subkernel phase totals in seconds and resets them
+SUBKERNEL_TOTALS_CODE = (
+    "(lambda totals: (dict(totals), totals.update(dict.fromkeys(totals, 0.0)))[0])"
+    "(__import__('_beaker').benchmark_totals)"
+)
+
+
+class PhaseTimer:
+    """
+    Accumulates the time spent in wrapped functions, per phase.
+    """
+
+    def __init__(self):
+        self.totals: dict[str, float] = collections.defaultdict(float)
+        self.originals = []
+
+    def wrap(self, owner, name: str, phase: str):
+        original = getattr(owner, name)
+        self.originals.append((owner, name, original))
+        if asyncio.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self.totals[phase] += time.perf_counter() - start
+        else:
+            @functools.wraps(original)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.totals[phase] += time.perf_counter() - start
+        setattr(owner, name, timed)
+
+    def reset(self):
+        self.totals.clear()
+
+    def unwrap(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals.clear()
+
+
+def max_rss_bytes(max_rss: int) -> int:
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+async def subkernel_peak_rss(context) -> int:
+    # Includes forked children, e.g. from background checkpoints. The kernel runs on the same platform as this process.
+    response = await context.evaluate(
+        "(lambda resource: max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "
+        "resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))(__import__('resource'))"
+    )
+    return max_rss_bytes(response["return"])
+
+
+async def bench_scenario(name: str, sizes: dict, runs: int) -> dict:
+    from beaker_kernel.lib.utils import ExecutionError
+
+    setup_code, mutate_code = (code.format(**sizes) for code in SCENARIOS[name])
+    async with BenchmarkSession() as session:
+        context = session.context
+        subkernel = context.subkernel
+        try:
+            await context.execute(setup_code)
+        except ExecutionError as err:
+            return {"skipped": f"{err.args[0]}: {err.args[1]}"}
+
+        timer = PhaseTimer()
+        timer.wrap(subkernel, "generate_checkpoint_from_state", "serialize")
+        timer.wrap(subkernel, "store_serialization", "store")
+        timer.wrap(subkernel, "load_checkpoint", "restore")
+        await context.execute(SUBKERNEL_TIMERS_CODE)
+
+        async def mutate():
+            await context.execute(mutate_code)
+
+        async def subkernel_phases() -> dict[str, float]:
+            response = await context.evaluate(SUBKERNEL_TOTALS_CODE, changes_state=False)
+            return response["return"]
+
+        result = {}
+        try:
+            # The first checkpoint serializes everything, later ones only what the mutation changed
+            await subkernel_phases()
+            start = time.perf_counter()
+            await subkernel.add_checkpoint()
+            elapsed = time.perf_counter() - start
+            phases = {**timer.totals, **await subkernel_phases()}
+            result["first_checkpoint"] = {
+                "ms": elapsed * 1000,
+                "bytes_written": subkernel.storage_used,
+                **{f"{phase}_ms": total * 1000 for phase, total in phases.items()},
+            }
+
+            timer.reset()
+            timings = []
+            bytes_written = []
+            for _ in range(runs):
+                await mutate()
+                used = subkernel.storage_used
+                start = time.perf_counter()
+                await subkernel.add_checkpoint()
+                timings.append(time.perf_counter() - start)
+                bytes_written.append(subkernel.storage_used - used)
+            phases = {**timer.totals, **await subkernel_phases()}
+            result["add_checkpoint"] = {
+                **summarize(timings),
+                "mean_bytes_written": sum(bytes_written) / len(bytes_written),
+                **{f"{phase}_mean_ms": total / runs * 1000 for phase, total in phases.items()},
+            }
+
+            timer.reset()
+            timings = []
+            for _ in range(runs):
+                await mutate()
+                start = time.perf_counter()
+                await subkernel.rollback(0)
+                timings.append(time.perf_counter() - start)
+            result["rollback"] = {
+                **summarize(timings),
+                **{f"{phase}_mean_ms": total / runs * 1000 for phase, total in timer.totals.items()},
+            }
+
+            timings = await session.time_calls(lambda: subkernel.execute_and_rollback(mutate_code), runs=runs, warmup=1)
+            result["execute_and_rollback"] = summarize(timings)
+
+            result["peak_rss_bytes"] = {
+                "subkernel": await subkernel_peak_rss(context),
+                # Cumulative across scenarios, as all of them run in this process
+                "beaker": max_rss_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+            }
+        finally:
+            timer.unwrap()
+    return result
+
+
+def scenario_sizes(scale: float) -> dict:
+    return {
+        "small_count": int(2000 * scale),
+        "array_bytes": int(32 * 1024 * 1024 * scale),
+        "frame_rows": int(500_000 * scale),
+    }
+
+
+async def bench_checkpoint(scenarios: list[str], sizes: dict, runs: int) -> dict:
+    return {name: await bench_scenario(name, sizes, runs) for name in scenarios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the size of the namespaces")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), dest="scenarios")
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    results = asyncio.run(bench_checkpoint(args.scenarios or list(SCENARIOS), scenario_sizes(args.scale), args.runs))
+    report(results, args)
+
+
+if __name__ == "__main__":
+    main()
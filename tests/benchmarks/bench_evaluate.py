@@ -0,0 +1,33 @@
+"""
+Round-trip latency of an internal evaluation (`BeakerContext.evaluate("1")`) against a local python3 kernel.
+
+baselines/evaluate_before_future.json holds the results from before execution completion was driven by the kernel's
+execute_reply and idle status, when it was detected by polling with fixed sleeps. Compare against it with `--baseline`.
+
+Usage:
+    python -m tests.benchmarks.bench_evaluate [--runs N]
+        [--output results.json] [--baseline results.json [--tolerance 1.5]]
+"""
+import argparse
+import asyncio
+
+from .harness import BenchmarkSession, add_baseline_arguments, report, summarize
+
+
+async def bench_evaluate(runs: int) -> dict:
+    async with BenchmarkSession() as session:
+        timings = await session.time_calls(lambda: session.context.evaluate("1"), runs=runs)
+    return summarize(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=50)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+    result = asyncio.run(bench_evaluate(args.runs))
+    report({"evaluate": result}, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Cost of verifying and re-signing messages forwarded by the proxy, for typical message sizes.
+
+Compares the full path (decode the message, verify it, re-serialize and sign it with a new HMAC) with signing the
+already serialized frames using a copied, pre-keyed HMAC, and with the single verification done when both sides of
+the proxy share a key. Runs offline, without starting a kernel.
+
+Usage:
+    python -m tests.benchmarks.bench_signing [--runs N]
+        [--output results.json] [--baseline results.json [--tolerance 1.5]]
+"""
+import argparse
+import base64
+import os
+import timeit
+import uuid
+
+from beaker_kernel.lib.jupyter_kernel_proxy import JupyterMessage, JupyterMessageFrames
+
+from .harness import add_baseline_arguments, report, summarize
+
+KEY = uuid.uuid4().hex.encode()
+OTHER_KEY = uuid.uuid4().hex.encode()
+
+
+def make_frames(msg_type: str, content: dict, buffers: list[bytes] = ()) -> JupyterMessageFrames:
+    header = {
+        "msg_id": str(uuid.uuid4()),
+        "msg_type": msg_type,
+        "session": str(uuid.uuid4()),
+        "username": "kernel",
+        "date": "2024-01-01T00:00:00.000000Z",
+        "version": "5.3",
+    }
+    parent_header = {**header, "msg_id": str(uuid.uuid4()), "msg_type": "execute_request"}
+    msg = JupyterMessage([b"kernel"], None, header, parent_header, {}, content, list(buffers))
+    return JupyterMessageFrames(msg.sign_using(KEY).serialized.parts)
+
+
+MESSAGES = {
+    "status": make_frames("status", {"execution_state": "idle"}),
+    "execute_reply": make_frames("execute_reply", {"status": "ok", "execution_count": 1, "user_expressions": {}}),
+    "stream_1kb": make_frames("stream", {"name": "stdout", "text": "x" * 1024}),
+    "display_data_100kb": make_frames("display_data", {
+        "data": {"image/png": base64.b64encode(os.urandom(75 * 1024)).decode(), "text/plain": "<Figure>"},
+        "metadata": {},
+    }),
+    "comm_msg_1mb_buffer": make_frames("comm_msg", {"comm_id": str(uuid.uuid4()), "data": {}}, [os.urandom(1024 ** 2)]),
+}
+
+
+def full_resign(frames):
+    msg = JupyterMessage.parse(JupyterMessageFrames(frames), KEY)
+    return msg.sign_using(OTHER_KEY).parts
+
+
+def frames_resign(frames):
+    if not JupyterMessage.verify_frames(frames, KEY):
+        raise ValueError("Signature verification failed")
+    return JupyterMessage.sign_frames(frames, OTHER_KEY)
+
+
+def shared_key_forward(frames):
+    if not JupyterMessage.verify_frames(frames, KEY):
+        raise ValueError("Signature verification failed")
+    return frames
+
+
+PATHS = {
+    "parse_and_resign": full_resign,
+    "verify_and_resign_frames": frames_resign,
+    "verify_only_shared_key": shared_key_forward,
+}
+
+
+def bench_signing(runs: int) -> dict:
+    results = {}
+    for message_name, frames in MESSAGES.items():
+        results[message_name] = {}
+        for path_name, path in PATHS.items():
+            timings = timeit.repeat(lambda: path(frames), number=1, repeat=runs)
+            results[message_name][path_name] = summarize(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=1000)
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+    report({"signing": bench_signing(args.runs)}, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Helpers for benchmarking Beaker internals against a real, local ipykernel.
+
+The harness starts a python3 kernel with jupyter_client, connects a `ProxyKernelServer`/`ProxyKernelClient` pair to it
+and creates a `BeakerContext` for it through its regular constructor, with stand-ins for the Beaker kernel and the LLM
+agent, so no Jupyter server or LLM is needed. This allows the execution and checkpoint paths to be timed offline.
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+from beaker_kernel.lib.jupyter_kernel_proxy import KernelProxyManager, ProxyKernelServer
+
+
+def free_port() -> int:
+    with contextlib.closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(timings: list[float]) -> dict[str, float]:
+    return {
+        "runs": len(timings),
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def add_baseline_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--output", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Fail if median times regressed compared to this results file")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float, prefix: str = "") -> list[str]:
+    """
+    Compares the `median_ms` of every summary in `results` with the summary at the same path in `baseline`.
+    """
+    regressions = []
+    for name, stats in results.items():
+        baseline_stats = baseline.get(name)
+        if not isinstance(stats, dict) or not isinstance(baseline_stats, dict):
+            continue
+        if "median_ms" not in stats:
+            regressions.extend(find_regressions(stats, baseline_stats, tolerance, prefix=f"{prefix}{name}."))
+            continue
+        current, previous = stats["median_ms"], baseline_stats.get("median_ms")
+        if previous and current > previous * tolerance:
+            regressions.append(f"{prefix}{name}: {current:.3f}ms (baseline {previous:.3f}ms)")
+    return regressions
+
+
+def report(results: dict, args: argparse.Namespace):
+    """
+    Prints the results and handles the arguments added by `add_baseline_arguments()`, exiting with 1 on regressions.
+    """
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+class BenchmarkSession(contextlib.AbstractAsyncContextManager):
+    """
+    Async context manager providing a `BeakerContext` wired to a freshly started local python3 kernel.
+
+    Must be entered from within a running event loop so that the ZMQ streams attach to it.
+    """
+
+    def __init__(self, kernel_name: str = "python3", run_path: str | None = None):
+        self.kernel_name = kernel_name
+        self.run_path = run_path
+        self._tempdir = None
+        self.kernel_manager = None
+        self.context = None
+
+    async def __aenter__(self):
+        if self.run_path is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="beaker-bench-")
+            self.run_path = self._tempdir.name
+        # Config is loaded lazily, so this must be set before anything reads from it.
+        os.environ["BEAKER_RUN_PATH"] = self.run_path
+
+        # Imported here as importing the subkernel module loads the config
+        from beaker_kernel.lib.context import BeakerContext
+        from jupyter_client.manager import AsyncKernelManager
+
+        self.kernel_manager = AsyncKernelManager(kernel_name=self.kernel_name)
+        await self.kernel_manager.start_kernel()
+        client = self.kernel_manager.client()
+        client.start_channels()
+        await client.wait_for_ready(timeout=60)
+        client.stop_channels()
+        connection_info = self.kernel_manager.get_connection_info()
+
+        server_config = {
+            "transport": "tcp",
+            "ip": "127.0.0.1",
+            "key": uuid.uuid4().hex,
+            "signature_scheme": "hmac-sha256",
+            **{f"{name}_port": free_port() for name in ("hb", "iopub", "control", "stdin", "shell")},
+        }
+        session_id = f"{uuid.uuid4()}_session"
+        server = ProxyKernelServer(server_config, session_id=session_id)
+        subkernel_id = str(uuid.uuid4())
+        self.beaker_kernel = BenchmarkKernel(server, session_id=session_id)
+        subkernel_cls = BeakerContext.resolve_subkernel_class(self.kernel_name)
+        self.beaker_kernel.add_started_subkernel(subkernel_cls.KERNEL_NAME, subkernel_id, connection_info)
+
+        context = BeakerContext(
+            beaker_kernel=self.beaker_kernel,
+            agent_cls=BenchmarkAgent,
+            config={"language": self.kernel_name, "context_info": {}},
+        )
+        self.beaker_kernel.context = context
+        await context.subkernel.setup()
+        self.context = context
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.kernel_manager is not None:
+            await self.kernel_manager.shutdown_kernel(now=True)
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+        return None
+
+    async def time_calls(self, coro_fn, runs: int = 20, warmup: int = 2) -> list[float]:
+        for _ in range(warmup):
+            await coro_fn()
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            await coro_fn()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+
+class BenchmarkKernel(KernelProxyManager):
+    """
+    Minimal stand-in for `BeakerKernel` with only the attributes used to create a context and run code. Subkernels are
+    started by the harness and handed to the context as if `BeakerKernel.set_context()` had started them.
+    """
+    jupyter_server = None
+
+    def __init__(self, server, session_id=None):
+        super().__init__(server, session_id=session_id)
+        self.internal_executions = set()
+        self.debug_enabled = False
+        self.context = None
+        self.started_subkernels: dict[str, list[str]] = {}
+        self.kernels = {}
+
+    def add_started_subkernel(self, kernel_name: str, kernel_id: str, connection_info: dict):
+        self.started_subkernels.setdefault(kernel_name, []).append(kernel_id)
+        self.kernels[f"kernel-{kernel_id}.json"] = connection_info
+
+    def take_started_subkernel(self, kernel_name: str) -> str | None:
+        started = self.started_subkernels.get(kernel_name)
+        return started.pop(0) if started else None
+
+    def update_running_kernels(self):
+        return self.kernels
+
+    def add_intercept(self, msg_type, func, stream=None):
+        self.server.intercept_message(stream, msg_type, func)
+
+    def remove_intercept(self, msg_type, func, stream=None):
+        self.server.filters.remove(self.server._make_filter(stream, msg_type, func))
+
+    def debug(self, *args, **kwargs):
+        pass
+
+
+class BenchmarkAgent:
+    """
+    Stand-in for the LLM agent, which isn't used by the benchmarks.
+    """
+
+    def __init__(self, context, tools):
+        self.context = context
+        self.tools = tools
+
+    def disable(self, *tool_names):
+        pass
+
+    def set_auto_context(self, default_context, context_callback):
+        pass
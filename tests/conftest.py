@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.fixture
+async def kernel_session(tmp_path, monkeypatch):
+    """
+    A `BenchmarkSession` whose context is wired to a freshly started local python3 kernel, with its own run path.
+    """
+    pytest.importorskip("jupyter_client")
+    pytest.importorskip("ipykernel")
+    from beaker_kernel.lib.config import reset_config
+    from tests.benchmarks.harness import BenchmarkSession
+
+    monkeypatch.setenv("BEAKER_RUN_PATH", str(tmp_path))
+    # The config may already have been loaded with another run path by an earlier test
+    reset_config()
+    try:
+        async with BenchmarkSession(run_path=str(tmp_path)) as session:
+            yield session
+    finally:
+        reset_config()
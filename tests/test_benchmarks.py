@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tests.benchmarks.harness import find_regressions
+
+pytestmark = pytest.mark.benchmark
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(REPO_ROOT, "tests", "benchmarks", "baselines")
+
+# Few runs and small namespaces, so that the benchmarks are only checked to still work. Timings from such short runs
+# are too noisy to compare against the baselines, which are checked with `make benchmark-check` instead.
+SMOKE_RUNS = {
+    "evaluate": ["--runs", "2"],
+    "signing": ["--runs", "5"],
+    "checkpoint": ["--runs", "1", "--scale", "0.01"],
+}
+NEEDS_KERNEL = {"evaluate", "checkpoint"}
+
+
+def summary_paths(results: dict, prefix: str = "") -> set[str]:
+    paths = set()
+    for name, stats in results.items():
+        if isinstance(stats, dict):
+            paths |= {f"{prefix}{name}"} if "median_ms" in stats else summary_paths(stats, f"{prefix}{name}.")
+    return paths
+
+
+@pytest.mark.parametrize("bench", list(SMOKE_RUNS))
+def test_benchmark_smoke_run(bench, tmp_path):
+    if bench in NEEDS_KERNEL:
+        pytest.importorskip("jupyter_client")
+        pytest.importorskip("ipykernel")
+    output = tmp_path / f"{bench}.json"
+    subprocess.run(
+        [sys.executable, "-m", f"tests.benchmarks.bench_{bench}", *SMOKE_RUNS[bench], "--output", str(output)],
+        cwd=REPO_ROOT,
+        check=True,
+        capture_output=True,
+        timeout=300,
+    )
+    results = json.loads(output.read_text())
+    with open(os.path.join(BASELINES, f"{bench}.json")) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    assert summary_paths(results)
+    # Scenarios skipped for lack of numpy or pandas in the kernel only appear in the baseline
+    assert summary_paths(results) <= summary_paths(baseline)
+
+
+def test_find_regressions():
+    baseline = {"scenario": {"fast": {"median_ms": 10.0}, "slow": {"median_ms": 100.0}}, "skipped": {"skipped": "x"}}
+    results = {"scenario": {"fast": {"median_ms": 14.0}, "slow": {"median_ms": 200.0}}, "new": {"median_ms": 1.0}}
+
+    assert find_regressions(results, baseline, tolerance=1.5) == ["scenario.slow: 200.000ms (baseline 100.000ms)"]
+    assert find_regressions(results, baseline, tolerance=2.0) == []
@@ -0,0 +1,102 @@
+import errno
+import os
+
+import pytest
+
+from beaker_kernel.lib.checkpoint_store import BlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    assert store.create()
+    return store
+
+
+def write_file(path, content=b"content"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_sessions_publishing_the_same_content_share_a_blob(store, tmp_path):
+    first = str(tmp_path / "session1" / "hash.pickle")
+    second = str(tmp_path / "session2" / "hash.pickle")
+    source1 = write_file(tmp_path / "session1" / "partial")
+    source2 = write_file(tmp_path / "session2" / "partial")
+
+    assert store.publish(source1, "hash.pickle", first)
+    assert store.publish(source2, "hash.pickle", second)
+    assert not os.path.exists(source1) and not os.path.exists(source2)
+    assert os.path.samefile(first, second)
+    assert os.stat(store.blob_path("hash.pickle")).st_nlink == 3
+
+    # Already stored, so the next session only needs to link it
+    third = str(tmp_path / "session3" / "hash.pickle")
+    os.makedirs(os.path.dirname(third))
+    assert store.link("hash.pickle", third)
+    assert os.path.samefile(first, third)
+
+
+def test_release_and_garbage_collection(store, tmp_path):
+    destination = str(tmp_path / "session" / "hash.pickle")
+    store.publish(write_file(tmp_path / "session" / "partial"), "hash.pickle", destination)
+
+    # Still linked by the session
+    assert store.release("hash.pickle") == 0
+    assert os.path.exists(store.blob_path("hash.pickle"))
+
+    os.remove(destination)
+    assert store.release("hash.pickle") == len(b"content")
+    assert not os.path.exists(store.blob_path("hash.pickle"))
+    assert store.release("hash.pickle") == 0
+
+    kept = str(tmp_path / "session" / "kept.pickle")
+    store.publish(write_file(tmp_path / "session" / "partial"), "kept.pickle", kept)
+    store.publish(write_file(tmp_path / "session" / "partial"), "unused.pickle", str(tmp_path / "session" / "unused"))
+    os.remove(tmp_path / "session" / "unused")
+    store.collect_garbage()
+    assert os.path.exists(store.blob_path("kept.pickle"))
+    assert not os.path.exists(store.blob_path("unused.pickle"))
+
+
+def test_garbage_collection_while_publishing(store, tmp_path, monkeypatch):
+    destination = str(tmp_path / "session" / "hash.pickle")
+    source = write_file(tmp_path / "session" / "partial")
+    link = os.link
+
+    def link_then_collect(src, dst):
+        link(src, dst)
+        if dst == store.blob_path("hash.pickle"):
+            # Another session collects garbage between adding the blob and linking it into place
+            store.collect_garbage()
+    monkeypatch.setattr(os, "link", link_then_collect)
+
+    assert store.publish(source, "hash.pickle", destination)
+    with open(destination, "rb") as file:
+        assert file.read() == b"content"
+    assert os.path.samefile(destination, store.blob_path("hash.pickle"))
+
+
+def test_without_hard_links_files_are_not_shared(store, tmp_path, monkeypatch):
+    def link(src, dst):
+        raise OSError(errno.EPERM, "Operation not permitted")
+    monkeypatch.setattr(os, "link", link)
+
+    source = write_file(tmp_path / "session" / "partial")
+    destination = str(tmp_path / "session" / "hash.pickle")
+    assert not store.publish(source, "hash.pickle", destination)
+    assert os.path.exists(source)
+    assert not os.path.exists(destination)
+    assert not store.link("hash.pickle", destination)
+
+
+def test_store_accessible_to_other_users_is_not_used(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    os.makedirs(store.path, mode=0o777)
+    os.chmod(store.path, 0o777)
+    assert not store.create()
+
+    source = write_file(tmp_path / "session" / "partial")
+    assert not store.publish(source, "hash.pickle", str(tmp_path / "session" / "hash.pickle"))
+    assert os.path.exists(source)
@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import os
+
+import pytest
+
+from beaker_kernel.lib import subkernel as subkernel_module
+from beaker_kernel.lib.config import config, reset_config
+from beaker_kernel.lib.subkernel import CheckpointableBeakerSubkernel
+
+
+class FakeContext:
+    async def execute(self, code, **kwargs):
+        return {"code": code}
+
+
+class FakeSubkernel(CheckpointableBeakerSubkernel):
+    """
+    Checkpoints a dict of bytes values, serialized the way the python subkernel does it: only variables that changed
+    since the previous checkpoint are written to a file, the others are sent as their hash.
+    """
+    SERIALIZATION_EXTENSION = "bin"
+
+    def __init__(self, *args, **kwargs):
+        self.values = {}
+        self.restored = None
+        self.background_error = None
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def parse_subkernel_return(cls, execution_result):
+        return execution_result.get("return")
+
+    async def generate_checkpoint_from_state(self):
+        previous = self.previous_serializations()
+        fetched = {}
+        for varname, value in self.values.items():
+            identifier = hashlib.sha256(value).hexdigest()
+            if previous.get(varname) == identifier:
+                fetched[varname] = {"sha256": identifier, "format": "bin"}
+                continue
+            path = os.path.join(self.storage_prefix, f"{varname}.partial")
+            with open(path, "wb") as file:
+                file.write(value)
+            fetched[varname] = {"sha256": identifier, "format": "bin", "path": path}
+        return fetched
+
+    async def load_checkpoint(self, checkpoint):
+        self.restored = {}
+        for varname, filename in checkpoint.items():
+            opener = gzip.open if filename.endswith(".gz") else open
+            with opener(filename, "rb") as file:
+                self.restored[varname] = file.read()
+
+    async def start_background_checkpoint(self):
+        return "job"
+
+    async def complete_background_checkpoint(self, job):
+        if self.background_error:
+            raise self.background_error
+        return await self.generate_checkpoint_from_state()
+
+
+@pytest.fixture
+def checkpoint_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("BEAKER_RUN_PATH", str(tmp_path))
+    reset_config()
+    monkeypatch.setattr(config, "enable_checkpoints", True, raising=False)
+    monkeypatch.setattr(config, "checkpoint_compression", "none", raising=False)
+    monkeypatch.setattr(config, "checkpoint_session_quota", 0, raising=False)
+    monkeypatch.setattr(config, "checkpoint_global_quota", 0, raising=False)
+    monkeypatch.setattr(config, "background_checkpoints", False, raising=False)
+    yield config
+    reset_config()
+
+
+@pytest.fixture
+def make_subkernel(checkpoint_config, monkeypatch):
+    def init(self, jupyter_id, subkernel_configuration, context):
+        self.jupyter_id = jupyter_id
+        self.context = context
+    monkeypatch.setattr(subkernel_module.BeakerSubkernel, "__init__", init)
+
+    def make_subkernel(jupyter_id="kernel"):
+        return FakeSubkernel(jupyter_id, {}, FakeContext())
+    return make_subkernel
+
+
+async def test_unchanged_variables_reuse_stored_files(make_subkernel):
+    subkernel = make_subkernel()
+    subkernel.values = {"a": b"a" * 100, "b": b"b" * 100}
+    first = subkernel.checkpoints[await subkernel.add_checkpoint()]
+    subkernel.values["b"] = b"changed"
+    second = subkernel.checkpoints[await subkernel.add_checkpoint()]
+
+    assert second["a"] == first["a"]
+    assert second["b"] != first["b"]
+    assert subkernel.storage_refcounts[first["a"]] == 2
+    assert subkernel.storage_refcounts[first["b"]] == 1
+
+
+async def test_compressed_files_are_reused(make_subkernel, checkpoint_config, monkeypatch):
+    monkeypatch.setattr(checkpoint_config, "checkpoint_compression", "gzip", raising=False)
+    subkernel = make_subkernel()
+    subkernel.values = {"a": b"a" * 100}
+    first = subkernel.checkpoints[await subkernel.add_checkpoint()]
+    assert first["a"].endswith(".bin.gz")
+
+    # The same content under a variable the latest checkpoint doesn't have resolves to the compressed file
+    identifier = hashlib.sha256(b"a" * 100).hexdigest()
+    index = subkernel._store_checkpoint({"b": {"sha256": identifier, "format": "bin"}})
+    assert subkernel.checkpoints[index]["b"] == first["a"]
+
+    await subkernel.rollback(0)
+    assert subkernel.restored == {"a": b"a" * 100}
+
+
+async def test_reusing_a_missing_file_fails(make_subkernel):
+    subkernel = make_subkernel()
+    with pytest.raises(FileNotFoundError):
+        subkernel._store_checkpoint({"a": {"sha256": "0" * 64, "format": "bin"}})
+    assert subkernel.checkpoints == []
+
+
+async def test_rollback_releases_later_checkpoints(make_subkernel):
+    subkernel = make_subkernel()
+    subkernel.values = {"a": b"first"}
+    first = subkernel.checkpoints[await subkernel.add_checkpoint()]
+    subkernel.values = {"a": b"second"}
+    second = subkernel.checkpoints[await subkernel.add_checkpoint()]
+
+    await subkernel.rollback(0)
+    assert subkernel.restored == {"a": b"first"}
+    assert len(subkernel.checkpoints) == 1
+    assert not os.path.exists(second["a"])
+    assert os.path.exists(first["a"])
+    assert subkernel.storage_used == len(b"first")
+
+
+async def test_quota_thins_out_older_checkpoints(make_subkernel, checkpoint_config, monkeypatch):
+    monkeypatch.setattr(checkpoint_config, "checkpoints_keep_recent", 2, raising=False)
+    monkeypatch.setattr(checkpoint_config, "checkpoint_session_quota", 5500, raising=False)
+    subkernel = make_subkernel()
+    for index in range(6):
+        subkernel.values = {"a": bytes([index]) * 1000}
+        await subkernel.add_checkpoint()
+
+    # Every other older checkpoint is evicted first, and the most recent ones are always kept
+    assert [checkpoint is not None for checkpoint in subkernel.checkpoints] == [True, False, True, True, True, True]
+    assert subkernel.storage_used == 5000
+
+    monkeypatch.setattr(checkpoint_config, "checkpoint_session_quota", 1500, raising=False)
+    subkernel.enforce_checkpoint_quota()
+    assert [checkpoint is not None for checkpoint in subkernel.checkpoints] == [False, False, False, False, True, True]
+
+    with pytest.raises(IndexError):
+        await subkernel.rollback(1)
+    with pytest.raises(IndexError):
+        await subkernel.rollback(6)
+
+
+async def test_failed_background_checkpoint_leaves_placeholder(make_subkernel, checkpoint_config, monkeypatch):
+    monkeypatch.setattr(checkpoint_config, "background_checkpoints", True, raising=False)
+    subkernel = make_subkernel()
+    subkernel.values = {"a": b"value"}
+    subkernel.background_error = RuntimeError("serialization failed")
+    failed_index, task = await subkernel.checkpoint_and_execute("code")
+    await task
+    await subkernel.wait_for_pending_checkpoint()
+
+    subkernel.background_error = None
+    index, task = await subkernel.checkpoint_and_execute("code")
+    await task
+    await subkernel.wait_for_pending_checkpoint()
+    assert (failed_index, index) == (0, 1)
+    assert subkernel.checkpoints[0] is None
+    assert subkernel.checkpoints[1] is not None
+
+    with pytest.raises(IndexError):
+        await subkernel.rollback(failed_index)
+    await subkernel.rollback(index)
+    assert subkernel.restored == {"a": b"value"}
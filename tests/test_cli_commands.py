@@ -0,0 +1,24 @@
+import importlib
+
+import pytest
+
+click = pytest.importorskip("click")
+
+from beaker_kernel.cli.main import BUILTIN_COMMANDS, cli  # noqa: E402
+
+
+@pytest.mark.parametrize("name", list(BUILTIN_COMMANDS))
+def test_builtin_command_help_matches_command(name):
+    lazy_command = BUILTIN_COMMANDS[name]
+    command = getattr(importlib.import_module(lazy_command.module), lazy_command.entry_point)
+
+    assert isinstance(command, click.Command)
+    assert lazy_command.short_help == command.get_short_help_str(limit=1000)
+
+
+def test_command_list_matches_loaded_commands():
+    ctx = click.Context(cli)
+    limit = 40
+    listed = {name: cli.list_help(ctx, name, limit) for name in BUILTIN_COMMANDS}
+    loaded = {name: cli.get_command(ctx, name).get_short_help_str(limit) for name in BUILTIN_COMMANDS}
+    assert listed == loaded
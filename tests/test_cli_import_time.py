@@ -0,0 +1,58 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("click")
+
+
+# Generous so that the test isn't flaky on slow machines, while still catching the CLI importing hatch, archytas or
+# the Jupyter server, which each take longer than this on their own.
+IMPORT_TIME_BUDGET_SECONDS = 1.0
+
+# Modules that are only needed by specific commands and must not be imported just to build the command list.
+DEFERRED_MODULES = [
+    "archytas",
+    "hatch",
+    "hatchling",
+    "jupyter_server",
+    "beaker_kernel.lib.agent",
+    "beaker_kernel.lib.config",
+    "beaker_kernel.lib.context",
+    "beaker_kernel.cli.project",
+    "beaker_kernel.cli.context",
+    "beaker_kernel.cli.subkernel",
+]
+
+PROBE = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+from beaker_kernel.cli.main import cli
+cli.list_commands(None)
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def run_probe() -> dict:
+    result = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_cli_defers_command_imports():
+    modules = set(run_probe()["modules"])
+    imported = [
+        name for name in DEFERRED_MODULES
+        if any(module == name or module.startswith(f"{name}.") for module in modules)
+    ]
+    assert not imported, f"Building the CLI imported {', '.join(imported)}"
+
+
+def test_cli_import_time_budget():
+    # Best of a few runs, to ignore a cold filesystem cache
+    elapsed = min(run_probe()["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_TIME_BUDGET_SECONDS, f"Importing the CLI took {elapsed:.2f}s"
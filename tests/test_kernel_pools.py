@@ -0,0 +1,84 @@
+import asyncio
+import itertools
+
+import pytest
+
+pytest.importorskip("jupyter_server")
+
+from jupyter_server.services.kernels.kernelmanager import AsyncMappingKernelManager  # noqa: E402
+
+from beaker_kernel.lib.config import config  # noqa: E402
+from beaker_kernel.service.base import BeakerKernelMappingManager  # noqa: E402
+
+
+@pytest.fixture
+def started_kernels(monkeypatch):
+    """
+    Replaces starting a kernel process with registering a placeholder kernel, returning the ids of started kernels.
+    """
+    started = []
+    ids = itertools.count()
+
+    async def start_kernel(self, *, kernel_id=None, path=None, **kwargs):
+        kernel_id = kernel_id or f"kernel-{next(ids)}"
+        self._kernels[kernel_id] = object()
+        started.append(kernel_id)
+        return kernel_id
+    monkeypatch.setattr(AsyncMappingKernelManager, "_async_start_kernel", start_kernel)
+    return started
+
+
+@pytest.fixture
+def make_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(BeakerKernelMappingManager, "connection_dir", str(tmp_path))
+    monkeypatch.setattr(config, "subkernel_pool_sizes", {"python3": 2}, raising=False)
+    return BeakerKernelMappingManager
+
+
+async def wait_for_pools(kernel_manager):
+    while kernel_manager._pool_tasks or kernel_manager._filling_pools:
+        await asyncio.sleep(0)
+
+
+async def test_pools_are_filled_when_the_manager_starts(make_manager, started_kernels):
+    kernel_manager = make_manager()
+    await asyncio.sleep(0)
+    await wait_for_pools(kernel_manager)
+    assert kernel_manager.warm_kernels == {"python3": ["kernel-0", "kernel-1"]}
+
+
+async def test_start_kernel_claims_warm_kernels_and_refills(make_manager, started_kernels):
+    kernel_manager = make_manager()
+    await asyncio.sleep(0)
+    await wait_for_pools(kernel_manager)
+
+    assert await kernel_manager.start_kernel(kernel_name="python3") == "kernel-0"
+    await wait_for_pools(kernel_manager)
+    assert kernel_manager.warm_kernels["python3"] == ["kernel-1", "kernel-2"]
+
+    # Kernels started with a path or other arguments are not started like the warm ones
+    assert await kernel_manager.start_kernel(kernel_name="python3", path="project") == "kernel-3"
+    assert kernel_manager.warm_kernels["python3"] == ["kernel-1", "kernel-2"]
+
+
+def test_matches_warm_kernels():
+    assert BeakerKernelMappingManager.matches_warm_kernels(None, {"kernel_name": "python3"})
+    assert BeakerKernelMappingManager.matches_warm_kernels("", {"kernel_name": "python3", "env": {}})
+    assert not BeakerKernelMappingManager.matches_warm_kernels("project", {"kernel_name": "python3"})
+    assert not BeakerKernelMappingManager.matches_warm_kernels(None, {"env": {"VARIABLE": "value"}})
+
+
+async def test_claim_skips_culled_warm_kernels(make_manager, monkeypatch):
+    monkeypatch.setattr(config, "subkernel_pool_sizes", {}, raising=False)
+    kernel_manager = make_manager()
+    kernel_manager.warm_kernels = {"python3": ["culled", "running", "other"]}
+    kernel_manager._kernels.update(running=object(), other=object())
+
+    assert kernel_manager.claim_warm_kernel("python3") == "running"
+    assert kernel_manager.warm_kernels["python3"] == ["other"]
+    assert kernel_manager.claim_warm_kernel("ir") is None
+
+    # Warm kernels are never culled while they wait to be claimed
+    assert kernel_manager.is_warm_kernel("other")
+    assert await kernel_manager.cull_kernel_if_idle("other") is None
+    assert not kernel_manager.is_warm_kernel("running")
@@ -0,0 +1,41 @@
+import asyncio
+import gc
+import logging
+
+from beaker_kernel.kernel import BeakerKernel
+
+
+class TaskOwner:
+    run_in_background = BeakerKernel.run_in_background
+    _background_task_done = BeakerKernel._background_task_done
+
+    def __init__(self):
+        self.background_tasks = set()
+
+
+async def test_background_tasks_are_kept_until_done(caplog):
+    owner = TaskOwner()
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    owner.run_in_background(asyncio.create_task(fail()))
+    gc.collect()
+    assert len(owner.background_tasks) == 1
+
+    with caplog.at_level(logging.ERROR, logger="beaker_kernel.kernel"):
+        while owner.background_tasks:
+            await asyncio.sleep(0)
+    assert "boom" in caplog.text
+
+
+async def test_cancelled_background_task_is_not_logged(caplog):
+    owner = TaskOwner()
+    task = asyncio.create_task(asyncio.sleep(10))
+    owner.run_in_background(task)
+    task.cancel()
+    with caplog.at_level(logging.ERROR, logger="beaker_kernel.kernel"):
+        while owner.background_tasks:
+            await asyncio.sleep(0)
+    assert not caplog.text
@@ -0,0 +1,153 @@
+import hashlib
+import hmac
+import inspect
+import json
+import types
+
+import pytest
+
+from beaker_kernel.lib import output_spill as output_spill_module
+from beaker_kernel.lib.output_spill import OutputBudget, OutputSpill
+
+KEY = b"test-key"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(output_spill_module.time, "monotonic", clock)
+    return clock
+
+
+def test_budget_limits_total_bytes():
+    budget = OutputBudget(max_bytes=100, bytes_per_second=0)
+    assert budget.admit(60)
+    assert budget.admit(40)
+    assert not budget.admit(1)
+    assert budget.exhausted
+    assert budget.used == 100
+
+
+def test_budget_rate_limit_refills_over_time(clock):
+    budget = OutputBudget(max_bytes=0, bytes_per_second=100)
+    assert budget.admit(50)
+    assert budget.admit(50)
+    clock.now += 0.5
+    assert budget.admit(50)
+    clock.now += 0.1
+    # Only 10 bytes were added to the bucket since
+    assert not budget.admit(50)
+    # Once exhausted, nothing more is sent so that the output has no gaps
+    clock.now += 10
+    assert not budget.admit(1)
+
+
+def test_budget_lets_a_large_message_through_after_a_quiet_second(clock):
+    budget = OutputBudget(max_bytes=0, bytes_per_second=100)
+    assert budget.admit(500)
+    clock.now += 1
+    # The bucket is still in debt for the large message
+    assert not budget.admit(10)
+
+
+def test_spilled_output_is_read_back_per_execution(tmp_path):
+    spill = OutputSpill(str(tmp_path / "output" / "kernel.spill"), max_bytes=10)
+    spill.spill("first", "0123456789")
+    spill.spill("second", "abcdef")
+    spill.spill("first", "ABCDEFGHIJ")
+
+    assert spill.spilled_bytes("first") == 20
+    assert spill.read("first") == b"0123456789ABCDEFGHIJ"
+    assert spill.read("second") == b"abcdef"
+    # Pages span the ranges of an execution without including other executions' output
+    assert spill.read("first", 5, 10) == b"56789ABCDE"
+    assert spill.read("first", 15) == b"FGHIJ"
+    assert spill.read("first", 20, 10) == b""
+    assert spill.read("unknown") == b""
+
+    spill.cleanup()
+    assert not (tmp_path / "output" / "kernel.spill").exists()
+    assert spill.read("first") == b""
+
+
+def test_spill_file_size_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_spill_module, "SPILL_FILE_MAX_BYTES", 15)
+    spill = OutputSpill(str(tmp_path / "kernel.spill"), max_bytes=10)
+    assert spill.spill("first", "0123456789") == 10
+    assert spill.spill("first", "0123456789") == 0
+    assert spill.read("first") == b"0123456789"
+
+
+def stream_frames(text, parent_id="request"):
+    header = json.dumps({"msg_id": f"output-{text}", "msg_type": "stream"}).encode()
+    parent_header = json.dumps({"msg_id": parent_id, "msg_type": "execute_request"}).encode()
+    fields = [header, parent_header, b"{}", json.dumps({"name": "stdout", "text": text}).encode()]
+    h = hmac.HMAC(KEY, digestmod=hashlib.sha256)
+    for field in fields:
+        h.update(field)
+    return [b"<IDS|MSG>", h.hexdigest().encode(), *fields]
+
+
+@pytest.fixture
+def limited_kernel(tmp_path):
+    kernel = pytest.importorskip("beaker_kernel.kernel")
+    beaker_kernel = types.SimpleNamespace(
+        output_spill=OutputSpill(str(tmp_path / "kernel.spill"), max_bytes=100),
+        internal_executions=set(),
+    )
+
+    async def limit_output(frames):
+        result = await kernel.BeakerKernel.limit_output(beaker_kernel, None, None, frames)
+        if result is None:
+            return None
+        return json.loads(result[-1])["text"]
+    beaker_kernel.limit_output = limit_output
+    return beaker_kernel
+
+
+async def test_notice_replaces_the_first_message_over_the_limit(limited_kernel):
+    frames = stream_frames("a" * 60)
+    assert await limited_kernel.limit_output(frames) == "a" * 60
+
+    notice = await limited_kernel.limit_output(stream_frames("b" * 60))
+    assert notice.startswith("\n[Output truncated")
+    assert "msg_id request" in notice
+    assert await limited_kernel.limit_output(stream_frames("c")) is None
+
+    # Everything from the message over the limit on is saved, in order
+    assert limited_kernel.output_spill.read("request") == b"b" * 60 + b"c"
+
+    # Other executions have their own budget, and internal executions are never limited
+    assert await limited_kernel.limit_output(stream_frames("d" * 60, parent_id="other")) == "d" * 60
+    limited_kernel.internal_executions.add("request")
+    assert await limited_kernel.limit_output(stream_frames("e" * 60)) == "e" * 60
+
+
+async def test_fetch_output_range_pages_through_spilled_output(tmp_path):
+    context_module = pytest.importorskip("beaker_kernel.lib.context")
+    fetch_output_range = inspect.unwrap(context_module.BeakerContext.fetch_output_range)
+    spill = OutputSpill(str(tmp_path / "kernel.spill"), max_bytes=10)
+    spill.spill("request", "0123456789")
+    spill.spill("other", "xxxx")
+    spill.spill("request", "abcdef")
+    context = types.SimpleNamespace(beaker_kernel=types.SimpleNamespace(output_spill=spill))
+
+    pages = []
+    offset = 0
+    while True:
+        message = types.SimpleNamespace(content={"msg_id": "request", "offset": offset, "length": 6})
+        page = await fetch_output_range(context, message)
+        if not page["length"]:
+            break
+        assert page["total_length"] == 16
+        pages.append(page["text"])
+        offset += page["length"]
+    assert pages == ["012345", "6789ab", "cdef"]
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import types
+
+import pytest
+
+pytest.importorskip("zmq")
+
+from beaker_kernel.lib.jupyter_kernel_proxy import (  # noqa: E402
+    KERNEL_SOCKETS,
+    InterceptionFilterIndex,
+    JupyterMessage,
+    ProxyKernelServer,
+    SocketGroup,
+)
+
+KEY = b"test-key"
+IOPUB = KERNEL_SOCKETS[1]
+
+# Not valid JSON, so that anything decoding the content of the message fails
+UNDECODABLE_CONTENT = b'{"data": {"image/png": "iVBORw0KGgo'
+
+
+class RecordingStream:
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, data, **kwargs):
+        self.sent.append(list(data))
+
+    def flush(self):
+        pass
+
+
+def display_data_frames(content: bytes) -> list[bytes]:
+    header = json.dumps({"msg_id": "output", "msg_type": "display_data"}).encode()
+    parent_header = json.dumps({"msg_id": "request", "msg_type": "execute_request"}).encode()
+    fields = [header, parent_header, b"{}", content]
+    h = hmac.HMAC(KEY, digestmod=hashlib.sha256)
+    for field in fields:
+        h.update(field)
+    return [JupyterMessage.DELIMITER, h.hexdigest().encode(), *fields]
+
+
+def make_server(filters=()):
+    server = ProxyKernelServer.__new__(ProxyKernelServer)
+    server.config = {"key": KEY.decode()}
+    server.filters = InterceptionFilterIndex()
+    server.message_routes = {}
+    server.streams = SocketGroup(*(RecordingStream() for _ in KERNEL_SOCKETS))
+    server.proxy_target = types.SimpleNamespace(config={"key": KEY.decode()})
+    for msg_type, callback in filters:
+        server.filters.append(server._make_filter("iopub", msg_type, callback))
+    return server
+
+
+def forward(server, frames):
+    handler = server._proxy_to(server.streams.iopub, socktype=IOPUB)
+    asyncio.run(handler(frames))
+    return server.streams.iopub.sent
+
+
+def test_unfiltered_display_data_is_not_decoded():
+    frames = display_data_frames(UNDECODABLE_CONTENT)
+    sent = forward(make_server(), frames)
+    assert sent == [frames]
+
+
+def test_header_only_filters_do_not_decode_content():
+    async def read_headers(server, target_stream, data):
+        header, _ = JupyterMessage.parse_headers(data)
+        assert header["msg_type"] == "display_data"
+        return data
+
+    frames = display_data_frames(UNDECODABLE_CONTENT)
+    sent = forward(make_server([("display_data", read_headers)]), frames)
+    assert sent == [frames]
+
+
+def test_output_limit_under_budget_does_not_decode_content(tmp_path):
+    kernel = pytest.importorskip("beaker_kernel.kernel")
+    from beaker_kernel.lib.output_spill import OutputSpill
+
+    beaker_kernel = types.SimpleNamespace(
+        output_spill=OutputSpill(str(tmp_path / "output.spill"), max_bytes=1024 ** 2, bytes_per_second=1024 ** 2),
+        internal_executions=set(),
+    )
+
+    async def limit_output(server, target_stream, data):
+        return await kernel.BeakerKernel.limit_output(beaker_kernel, server, target_stream, data)
+
+    frames = display_data_frames(UNDECODABLE_CONTENT)
+    sent = forward(make_server([("display_data", limit_output)]), frames)
+    assert sent == [frames]
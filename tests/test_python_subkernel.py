@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("jupyter_client")
+pytest.importorskip("ipykernel")
+
+
+async def test_background_checkpoint_in_threaded_kernel(kernel_session, monkeypatch):
+    from beaker_kernel.lib.config import config
+    monkeypatch.setattr(config, "background_checkpoints", True, raising=False)
+    context = kernel_session.context
+    subkernel = context.subkernel
+
+    # The heartbeat, IOPub and control threads of ipykernel are always running
+    threads = await context.evaluate("__import__('threading').active_count()")
+    assert threads["return"] > 1
+
+    await context.execute("values = list(range(10))")
+    checkpoint_index, task = await subkernel.checkpoint_and_execute("values.append(10)")
+    assert subkernel.pending_checkpoint is not None
+    await task
+    await subkernel.wait_for_pending_checkpoint()
+    assert subkernel.checkpoints[checkpoint_index] is not None
+    assert "values" in subkernel.checkpoints[checkpoint_index]
+
+    # The checkpoint is a snapshot from before the code ran
+    await subkernel.rollback(checkpoint_index)
+    restored = await context.evaluate("len(values)")
+    assert restored["return"] == 10
+
+
+async def test_start_background_checkpoint_returns_job(kernel_session):
+    subkernel = kernel_session.context.subkernel
+    await kernel_session.context.execute("value = 1")
+
+    job = await subkernel.start_background_checkpoint()
+    assert job is not None
+    fetched = await subkernel.complete_background_checkpoint(job)
+    assert "value" in fetched
+
+
+async def test_helpers_are_reinstalled_when_missing(kernel_session):
+    context = kernel_session.context
+    subkernel = context.subkernel
+    await context.execute("value = 1")
+
+    # As if the subkernel was restarted since setup
+    await context.execute("del __import__('sys').modules['_beaker']")
+    state = await context.evaluate(subkernel.FETCH_STATE_CODE, changes_state=False)
+    assert "value" in state["return"]["variables"]
+
+    await context.execute("del __import__('sys').modules['_beaker']")
+    checkpoint_index = await subkernel.add_checkpoint()
+    assert "value" in subkernel.checkpoints[checkpoint_index]
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import uuid
+
+import pytest
+
+pytest.importorskip("zmq")
+
+from beaker_kernel.lib.jupyter_kernel_proxy import CoalescingStream, JupyterMessage  # noqa: E402
+
+KEY = b"test-key"
+
+
+class RecordingStream:
+    def __init__(self):
+        self.sent = []
+
+    def send_multipart(self, data, *args, **kwargs):
+        self.sent.append(list(data))
+
+    def flush(self):
+        pass
+
+
+def message_frames(msg_type, content, parent_id="request", buffers=()):
+    header = json.dumps({"msg_id": uuid.uuid4().hex, "msg_type": msg_type}).encode()
+    parent_header = json.dumps({"msg_id": parent_id, "msg_type": "execute_request"}).encode()
+    fields = [header, parent_header, b"{}", json.dumps(content).encode()]
+    h = hmac.HMAC(KEY, digestmod=hashlib.sha256)
+    for field in fields:
+        h.update(field)
+    return [JupyterMessage.DELIMITER, h.hexdigest().encode(), *fields, *buffers]
+
+
+def stream_frames(text, name="stdout", parent_id="request"):
+    return message_frames("stream", {"name": name, "text": text}, parent_id=parent_id)
+
+
+def sent_texts(stream):
+    return [JupyterMessage.parse(frames).content.get("text") for frames in stream.sent]
+
+
+@pytest.fixture
+def coalescing():
+    target = RecordingStream()
+    return target, CoalescingStream(target, KEY.decode(), window_ms=50, max_bytes=1024)
+
+
+async def test_consecutive_stream_messages_are_merged(coalescing):
+    target, stream = coalescing
+    for line in ("a\n", "b\n", "c\n"):
+        stream.send_multipart(stream_frames(line))
+    assert target.sent == []
+
+    await asyncio.sleep(0.1)
+    assert sent_texts(target) == ["a\nb\nc\n"]
+    # The merged message is signed again
+    merged = target.sent[0]
+    h = hmac.HMAC(KEY, digestmod=hashlib.sha256)
+    for field in merged[2:6]:
+        h.update(field)
+    assert merged[1] == h.hexdigest().encode()
+
+
+async def test_single_message_is_sent_unchanged(coalescing):
+    target, stream = coalescing
+    frames = stream_frames("only\n")
+    stream.send_multipart(frames)
+    stream.flush_pending()
+    assert target.sent == [frames]
+
+
+async def test_other_messages_flush_held_output_first(coalescing):
+    target, stream = coalescing
+    stream.send_multipart(stream_frames("a\n"))
+    stream.send_multipart(stream_frames("b\n"))
+    status = message_frames("status", {"execution_state": "idle"})
+    stream.send_multipart(status)
+    assert sent_texts(target) == ["a\nb\n", None]
+    assert target.sent[1] == status
+
+
+async def test_different_streams_and_parents_are_not_merged(coalescing):
+    target, stream = coalescing
+    stream.send_multipart(stream_frames("out\n"))
+    stream.send_multipart(stream_frames("err\n", name="stderr"))
+    stream.send_multipart(stream_frames("other\n", parent_id="other"))
+    stream.flush_pending()
+    assert sent_texts(target) == ["out\n", "err\n", "other\n"]
+
+
+async def test_output_over_max_bytes_is_sent_without_waiting(coalescing):
+    target, stream = coalescing
+    chunk = "x" * 400
+    for _ in range(3):
+        stream.send_multipart(stream_frames(chunk))
+    # The third message takes the held output over max_bytes
+    assert sent_texts(target) == [chunk * 3]
+
+    stream.send_multipart(stream_frames("tail"))
+    assert len(target.sent) == 1
+    await asyncio.sleep(0.1)
+    assert sent_texts(target) == [chunk * 3, "tail"]
+
+
+async def test_messages_with_buffers_pass_through(coalescing):
+    target, stream = coalescing
+    stream.send_multipart(stream_frames("a\n"))
+    frames = message_frames("stream", {"name": "stdout", "text": "b\n"}, buffers=[b"buffer"])
+    stream.send_multipart(frames)
+    assert sent_texts(target) == ["a\n", "b\n"]
+    assert target.sent[1] == frames
+
+
+async def test_zero_window_sends_every_message(coalescing):
+    target, stream = coalescing
+    stream.configure(window_ms=0, max_bytes=1024)
+    stream.send_multipart(stream_frames("a\n"))
+    stream.send_multipart(stream_frames("b\n"))
+    assert sent_texts(target) == ["a\n", "b\n"]
@@ -0,0 +1,113 @@
+import pytest
+
+from beaker_kernel.lib.subkernel_state import SubkernelStateTracker
+from beaker_kernel.subkernels import python_helpers
+
+
+@pytest.fixture
+def namespace(monkeypatch):
+    namespace = {}
+    monkeypatch.setattr(python_helpers, "user_namespace", lambda: namespace)
+    monkeypatch.setattr(python_helpers, "state_tracking", {"version": 0, "fingerprints": {}})
+    return namespace
+
+
+def test_state_delta_reports_additions_changes_and_removals(namespace):
+    namespace.update(a=1, b=[1, 2, 3])
+    first = python_helpers.state_delta()
+    assert first["full"]
+    assert set(first["state"]["variables"]) == {"a", "b"}
+
+    unchanged = python_helpers.state_delta(first["version"])
+    assert not unchanged["full"]
+    assert unchanged["version"] == first["version"]
+    assert not any(unchanged["state"].values()) and not unchanged["removed"]
+
+    namespace["a"] = 2
+    namespace["c"] = "new"
+    del namespace["b"]
+    delta = python_helpers.state_delta(first["version"])
+    assert not delta["full"]
+    assert delta["version"] == first["version"] + 1
+    assert set(delta["state"]["variables"]) == {"a", "c"}
+    assert delta["removed"] == {"variables": ["b"]}
+
+
+def test_state_delta_detects_changes_in_place(namespace):
+    class Shown:
+        text = "before"
+
+        def __str__(self):
+            return self.text
+
+    namespace.update(items=list(range(200)), mapping={"k": []}, obj=Shown())
+    version = python_helpers.state_delta()["version"]
+
+    namespace["items"][50] = "changed"
+    namespace["mapping"]["k"].append(1)
+    namespace["obj"].text = "after"
+    delta = python_helpers.state_delta(version)
+    assert set(delta["state"]["variables"]) == {"items", "mapping", "obj"}
+
+
+def test_state_delta_detects_array_and_frame_changes_in_place(namespace):
+    numpy = pytest.importorskip("numpy")
+    pandas = pytest.importorskip("pandas")
+    namespace.update(array=numpy.arange(10), frame=pandas.DataFrame({"a": [1, 2, 3]}))
+    version = python_helpers.state_delta()["version"]
+
+    namespace["array"][:] = 0
+    namespace["frame"].loc[0, "a"] = 10
+    delta = python_helpers.state_delta(version)
+    assert set(delta["state"]["variables"]) == {"array", "frame"}
+
+
+def test_state_delta_with_mismatched_version_returns_full_state(namespace):
+    namespace.update(a=1, b=2)
+    version = python_helpers.state_delta()["version"]
+
+    delta = python_helpers.state_delta(version - 1)
+    assert delta["full"]
+    assert set(delta["state"]["variables"]) == {"a", "b"}
+
+
+def delta(state, removed=None, version=1, full=False):
+    return {"full": full, "version": version, "state": state, "removed": removed or {}}
+
+
+def test_tracker_applies_full_states_and_deltas():
+    tracker = SubkernelStateTracker()
+    tracker.update({"variables": {"a": {"value": 1}, "b": {"value": 2}}})
+    assert tracker.version == 1
+
+    tracker.update(delta({"variables": {"a": {"value": 10}, "c": {"value": 3}}}, {"variables": ["b"]}))
+    assert tracker.state == {"variables": {"a": {"value": 10}, "c": {"value": 3}}}
+    assert tracker.version == 2
+    assert tracker.remote_version == 1
+
+    updated, removed = tracker.changes_since(1)
+    assert updated == {"variables": {"a": {"value": 10}, "c": {"value": 3}}}
+    assert removed == {"variables": ["b"]}
+
+    # Nothing changed, so the version stays the same
+    tracker.update(delta({"variables": {"a": {"value": 10}}}, version=2))
+    assert tracker.version == 2
+
+
+def test_tracker_full_delta_removes_missing_entries():
+    tracker = SubkernelStateTracker()
+    tracker.update({"variables": {"a": {"value": 1}, "b": {"value": 2}}})
+    tracker.update(delta({"variables": {"a": {"value": 1}}}, full=True))
+    assert tracker.state == {"variables": {"a": {"value": 1}}}
+    assert tracker.changes_since(1) == ({"variables": {}}, {"variables": ["b"]})
+
+
+def test_tracker_forgets_removals():
+    tracker = SubkernelStateTracker()
+    for index in range(10):
+        tracker.update({"variables": {f"name_{index}": {"value": index}}})
+        tracker.forget_removals(tracker.version)
+    assert len(tracker.removed_at) == 0
+    assert len(tracker.changed_at) == 1
+    assert tracker.changes_since(tracker.version - 1) is None
+    assert tracker.changes_since(tracker.version) == ({"variables": {}}, {})
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from beaker_kernel.service.zygote import KernelZygote, ZygoteProcess
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="The kernel zygote forks kernels")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_KERNEL = "tests.zygote_stub_kernel"
+
+
+@pytest.fixture
+async def zygote(monkeypatch):
+    # So that the zygote can import the stub kernel
+    monkeypatch.setenv("PYTHONPATH", REPO_ROOT)
+    zygote = KernelZygote(kernel_module=STUB_KERNEL)
+    yield zygote
+    zygote.stop()
+
+
+async def spawn(zygote, tmp_path, argument, **kwargs):
+    output_path = tmp_path / f"output-{argument}"
+    with open(output_path, "w") as output:
+        process = await zygote.spawn(
+            [sys.executable, "-m", STUB_KERNEL, argument], stdout=output.fileno(), stderr=output.fileno(), **kwargs
+        )
+    return process, output_path
+
+
+async def test_spawned_kernel_runs_in_requested_environment(zygote, tmp_path):
+    home = tmp_path / "home"
+    working_dir = tmp_path / "work"
+    (home / ".beaker").mkdir(parents=True)
+    (working_dir / "beaker").mkdir(parents=True)
+
+    process, output_path = await spawn(
+        zygote, tmp_path, "3", env={"ZYGOTE_TEST": "value", "HOME": str(home)}, cwd=str(working_dir)
+    )
+    assert await asyncio.to_thread(process.wait, 30) == 3
+    assert process.poll() == 3
+
+    seen = json.loads(output_path.read_text())
+    assert seen["argv"] == ["3"]
+    assert seen["env"] == "value"
+    assert seen["cwd"] == str(working_dir)
+    # Without a user to switch to, the kernel runs as the server's user
+    assert seen["uid"] == os.getuid()
+    # Library locations are discovered again for the kernel's home and working directory
+    assert str(home / ".beaker") in seen["lib_locations"]
+    assert str(working_dir / "beaker") in seen["lib_locations"]
+
+
+async def test_spawned_kernel_can_be_polled_and_signalled(zygote, tmp_path):
+    process, output_path = await spawn(zygote, tmp_path, "wait", env={}, cwd=str(tmp_path))
+    await asyncio.sleep(0.5)
+    assert process.poll() is None
+    with pytest.raises(subprocess.TimeoutExpired):
+        process.wait(timeout=0.1)
+
+    process.terminate()
+    assert await asyncio.to_thread(process.wait, 30) == -signal.SIGTERM
+
+
+def test_reaped_kernel_waits_for_its_exit_code(tmp_path):
+    # A process that has already exited and been reaped, so its pid no longer exists
+    exited = subprocess.Popen([sys.executable, "-c", ""])
+    exited.wait()
+    zygote = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    exit_code_path = tmp_path / str(exited.pid)
+    try:
+        process = ZygoteProcess(exited.pid, str(exit_code_path), zygote)
+        # The zygote is still running, so it is about to record the exit code
+        assert process.poll() is None
+        exit_code_path.write_text("3")
+        assert process.poll() == 3
+    finally:
+        zygote.kill()
+        zygote.wait()
+
+    # Without a zygote to record it, the exit code is never known
+    process = ZygoteProcess(exited.pid, str(tmp_path / "missing"), zygote)
+    assert process.poll() == -signal.SIGKILL
+
+
+def test_output_fd_rejects_pipes():
+    assert KernelZygote.output_fd(None) is None
+    assert KernelZygote.output_fd(5) == 5
+    with pytest.raises(ValueError):
+        KernelZygote.output_fd(subprocess.PIPE)
+
+
+async def test_launch_falls_back_to_popen_when_zygote_fails(monkeypatch):
+    base = pytest.importorskip("beaker_kernel.service.base")
+
+    class FailingZygote:
+        async def spawn(self, *args, **kwargs):
+            raise RuntimeError("zygote unavailable")
+
+    class Parent:
+        def kernel_zygote(self):
+            return FailingZygote()
+
+    launched = []
+
+    async def launch_kernel(self, kernel_cmd, **kw):
+        launched.append((kernel_cmd, kw))
+        return "popen"
+
+    monkeypatch.setattr(base.AsyncIOLoopKernelManager, "_async_launch_kernel", launch_kernel)
+    manager = base.BeakerKernelManager(kernel_name="beaker_kernel")
+    monkeypatch.setattr(base.BeakerKernelManager, "parent", Parent())
+    kernel_cmd = [sys.executable, "-m", "beaker_kernel.kernel", "-f", "connection.json"]
+
+    assert await manager._async_launch_kernel(kernel_cmd, env={}, cwd="/") == "popen"
+    assert launched == [(kernel_cmd, {"env": {}, "cwd": "/"})]
@@ -0,0 +1,24 @@
+"""
+Stand-in for the Beaker kernel, forked by the kernel zygote in tests. Prints what it sees after the zygote switched to
+the requested user, environment and working directory, then exits with the code given as its first argument, or waits
+to be signalled if that is "wait".
+"""
+import json
+import os
+import sys
+import time
+
+from beaker_kernel.lib import autodiscovery
+
+
+def main():
+    print(json.dumps({
+        "argv": sys.argv[1:],
+        "uid": os.getuid(),
+        "cwd": os.getcwd(),
+        "env": os.environ.get("ZYGOTE_TEST"),
+        "lib_locations": autodiscovery.LIB_LOCATIONS,
+    }), flush=True)
+    if sys.argv[1] == "wait":
+        time.sleep(60)
+    sys.exit(int(sys.argv[1]))